@@ -1 +1,9 @@
-SQLALCHEMY_DATABASE_URI = 'sqlite:///sports_betting.db'
\ No newline at end of file
+import os
+import sys
+
+# the database module lives in data_processing and is imported the way the pipelines import it,
+# as database, so a process that loads both shares one module and one engine per database
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing'))
+from database import ALL_BETTING_LINES_INDEXES, LINE_INDEXES, get_engine
+
+SQLALCHEMY_DATABASE_URI = 'sqlite:///sports_betting.db'
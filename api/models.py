@@ -1,17 +1,23 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
-from config import SQLALCHEMY_DATABASE_URI
+from config import ALL_BETTING_LINES_INDEXES, LINE_INDEXES, SQLALCHEMY_DATABASE_URI, get_engine
 
 # Create the engine and connect to the SQLite database
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
+engine = get_engine(SQLALCHEMY_DATABASE_URI)
 Base = declarative_base()
 Base.metadata.bind = engine
 Session = sessionmaker(bind=engine)
 
+# Indexes backing the filtered queries in queries.py, defined in data_processing/database.py.
+# The pipeline replaces these tables with pandas and recreates the same indexes after every load
+def line_indexes(table_name, column_lists):
+    return tuple(Index(f"ix_{table_name}_{'_'.join(columns)}", *columns) for columns in column_lists)
+
 # Define SQLAlchemy models
 class AllLines(Base):
     __tablename__ = 'all_betting_lines'
+    __table_args__ = line_indexes('all_betting_lines', ALL_BETTING_LINES_INDEXES)
     id = Column(String, primary_key=True)
     sport = Column(String)
     home_team = Column(String)
@@ -21,6 +27,8 @@ class AllLines(Base):
     outcome = Column(String)
     decimal_odds = Column(Float)
     update_time = Column(DateTime)
+    snapshot_time = Column(DateTime)
+    line_key = Column(Integer)
 
 class AvgOdds(Base):
     __tablename__ = 'avg_odds'
@@ -32,9 +40,11 @@ class AvgOdds(Base):
     outcome = Column(String)
     decimal_odds = Column(Float)
     update_time = Column(DateTime)
+    snapshot_time = Column(DateTime)
     
 class PlusEvBets(Base):
     __tablename__ = 'plus_ev_bets'
+    __table_args__ = line_indexes('plus_ev_bets', LINE_INDEXES)
     id = Column(String, primary_key=True)
     sport = Column(String)
     start_time = Column(DateTime)
@@ -50,6 +60,28 @@ class PlusEvBets(Base):
     best_implied_probability = Column(Float)
     thresh = Column(Float)
     predicted_probability = Column(Float)
+    expected_value = Column(Float)
+    kelly = Column(Float)
+    half_kelly = Column(Float)
+
+class BestLines(Base):
+    __tablename__ = 'best_lines_model_probabilities'
+    __table_args__ = line_indexes('best_lines_model_probabilities', LINE_INDEXES)
+    sport = Column(String, primary_key=True)
+    start_time = Column(DateTime, primary_key=True)
+    home_team = Column(String, primary_key=True)
+    away_team = Column(String, primary_key=True)
+    outcome = Column(String, primary_key=True)
+    sportsbook = Column(String)
+    decimal_odds = Column(Float)
+    avg_odds = Column(Float)
+    best_odds_update_time = Column(DateTime)
+    avg_odds_update_time = Column(DateTime)
+    mean_implied_probability = Column(Float)
+    best_implied_probability = Column(Float)
+    thresh = Column(Float)
+    predicted_probability = Column(Float)
+    expected_value = Column(Float)
     kelly = Column(Float)
     half_kelly = Column(Float)
 
@@ -0,0 +1,123 @@
+import base64
+import json
+import pandas as pd
+from sqlalchemy import text
+
+# table -> columns that can be filtered/sorted on, every one of them is backed by an index
+# (see the models in models.py)
+LINE_TABLES = {
+    'plus_ev_bets': ['sport', 'sportsbook', 'start_time', 'expected_value', 'kelly', 'decimal_odds'],
+    'best_lines_model_probabilities': ['sport', 'sportsbook', 'start_time', 'expected_value', 'kelly', 'decimal_odds'],
+    'all_betting_lines': ['sport', 'sportsbook', 'start_time', 'decimal_odds'],
+}
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def all_lines_json(engine, table_name) -> str:
+    """
+    Every row of the table as a JSON array, the response the lines endpoints gave before they
+    took filters and pages. They still give it when called without any query parameter, any
+    parameter switches them to query_lines and its {data, next_cursor} pages
+
+    Raises:
+        ValueError: for unknown tables
+    """
+    if table_name not in LINE_TABLES:
+        raise ValueError(f"Unknown table {table_name}")
+    return pd.read_sql(f"SELECT * FROM {table_name}", engine).to_json(orient='records')
+
+
+def encode_cursor(sort_value, rowid) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, rowid]).encode()).decode()
+
+
+def decode_cursor(cursor) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError(f"Invalid cursor {cursor}")
+
+
+def keyset_condition(sort_column, descending, cursor_is_null) -> str:
+    """
+    The rows after the cursor row in ORDER BY sort_column, rowid. SQLite sorts NULLs first
+    ascending and last descending, and a tuple comparison with a NULL is never true, so the
+    rows with a NULL sort value are paged through on their rowid on their own
+    """
+    if descending:
+        if cursor_is_null:
+            return f"({sort_column} IS NULL AND rowid < :cursor_rowid)"
+        return f"(({sort_column}, rowid) < (:cursor_value, :cursor_rowid) OR {sort_column} IS NULL)"
+    if cursor_is_null:
+        return f"(({sort_column} IS NULL AND rowid > :cursor_rowid) OR {sort_column} IS NOT NULL)"
+    return f"({sort_column}, rowid) > (:cursor_value, :cursor_rowid)"
+
+
+def query_lines(engine, table_name, sport=None, sportsbook=None, min_ev=None, min_kelly=None,
+                start_after=None, start_before=None, sort='start_time', cursor=None, limit=DEFAULT_LIMIT) -> dict:
+    """
+    Runs a filtered, keyset paginated query against one of the lines tables. Everything
+    happens in SQL so a client polling for one sport only reads that sport's rows
+
+    Args:
+        engine (sqlalchemy.Engine): the database engine
+        table_name (str): one of LINE_TABLES
+        sport (str): only return this sport key
+        sportsbook (str): only return lines from this sportsbook
+        min_ev (float): minimum expected_value
+        min_kelly (float): minimum kelly
+        start_after (str): only events starting at or after this time
+        start_before (str): only events starting before this time
+        sort (str): column to sort on, prefixed with - for descending, e.g. -expected_value
+        cursor (str): next_cursor of the previous page
+        limit (int): page size, at most MAX_LIMIT
+
+    Returns:
+        dict: data (list of rows) and next_cursor (None on the last page)
+
+    Raises:
+        ValueError: for unknown tables, sort columns or filters the table does not have
+    """
+    if table_name not in LINE_TABLES:
+        raise ValueError(f"Unknown table {table_name}")
+    columns = LINE_TABLES[table_name]
+    descending = sort.startswith('-')
+    sort_column = sort.lstrip('-')
+    if sort_column not in columns:
+        raise ValueError(f"Cannot sort {table_name} on {sort_column}, use one of {columns}")
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+
+    conditions, params = [], {}
+    filters = [('sport', '=', sport), ('sportsbook', '=', sportsbook), ('expected_value', '>=', min_ev),
+               ('kelly', '>=', min_kelly), ('start_time', '>=', start_after), ('start_time', '<', start_before)]
+    for i, (column, op, value) in enumerate(filters):
+        if value is None:
+            continue
+        if column not in columns:
+            raise ValueError(f"{table_name} cannot be filtered on {column}")
+        if column == 'start_time':
+            # stored as text in the pandas datetime format, compare in the same format
+            value = pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S.%f')
+        conditions.append(f"{column} {op} :p{i}")
+        params[f"p{i}"] = value
+    if cursor is not None:
+        params['cursor_value'], params['cursor_rowid'] = decode_cursor(cursor)
+        conditions.append(keyset_condition(sort_column, descending, params['cursor_value'] is None))
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT rowid AS _rowid, * FROM {table_name}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {sort_column} {direction}, rowid {direction} LIMIT :limit"
+    params['limit'] = limit + 1
+
+    with engine.connect() as conn:
+        rows = [dict(row) for row in conn.execute(text(sql), params).mappings()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][sort_column], rows[-1]['_rowid'])
+    for row in rows:
+        del row['_rowid']
+    return {'data': rows, 'next_cursor': next_cursor}
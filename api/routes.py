@@ -1,7 +1,7 @@
 
 
-from fastapi import FastAPI
-from sqlalchemy import create_engine
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String
@@ -9,24 +9,49 @@ from sqlalchemy.orm import Session
 from sqlalchemy.sql import select
 import json
 import pandas as pd
+from config import get_engine
+from queries import DEFAULT_LIMIT, MAX_LIMIT, all_lines_json, query_lines
 
 app = FastAPI()
 SQLALCHEMY_DATABASE_URI = 'sqlite:///../sports_betting.db'
 # Create SQLAlchemy engine
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
+engine = get_engine(SQLALCHEMY_DATABASE_URI)
 
 
+def lines_endpoint(table_name, default_sort, sport, sportsbook, min_ev, min_kelly, start_after, start_before, sort, cursor, limit):
+    """
+    A {data, next_cursor} page of query_lines, or every row as the endpoints returned them
+    before they paged when none of the parameters is given
+    """
+    if all(value is None for value in [sport, sportsbook, min_ev, min_kelly, start_after, start_before, sort, cursor, limit]):
+        return all_lines_json(engine, table_name)
+    try:
+        return query_lines(engine, table_name, sport=sport, sportsbook=sportsbook, min_ev=min_ev, min_kelly=min_kelly,
+                           start_after=start_after, start_before=start_before, sort=sort or default_sort, cursor=cursor,
+                           limit=DEFAULT_LIMIT if limit is None else limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Define endpoint for "all_best_lines"
 @app.get("/all_best_lines")
-def get_all_best_lines():
-    df = pd.read_sql("SELECT * FROM best_lines_model_probabilities", engine)
-    return df.to_json(orient='records')
+def get_all_best_lines(sport: Optional[str] = None, sportsbook: Optional[str] = None, min_ev: Optional[float] = None,
+                       min_kelly: Optional[float] = None, start_after: Optional[str] = None, start_before: Optional[str] = None,
+                       sort: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT)):
+    return lines_endpoint('best_lines_model_probabilities', 'start_time', sport, sportsbook, min_ev, min_kelly, start_after, start_before, sort, cursor, limit)
 
 # Define endpoint for "filtered_lines"
 @app.get("/reccommended_bets")
-def get_filtered_lines():
-    df = pd.read_sql("SELECT * FROM plus_ev_bets", engine)
-    return df.to_json(orient='records')
+def get_filtered_lines(sport: Optional[str] = None, sportsbook: Optional[str] = None, min_ev: Optional[float] = None,
+                       min_kelly: Optional[float] = None, start_after: Optional[str] = None, start_before: Optional[str] = None,
+                       sort: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT)):
+    return lines_endpoint('plus_ev_bets', '-expected_value', sport, sportsbook, min_ev, min_kelly, start_after, start_before, sort, cursor, limit)
+
+# Define endpoint for every line of the latest odds snapshot
+@app.get("/all_lines")
+def get_all_lines(sport: Optional[str] = None, sportsbook: Optional[str] = None, start_after: Optional[str] = None,
+                  start_before: Optional[str] = None, sort: Optional[str] = None, cursor: Optional[str] = None,
+                  limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT)):
+    return lines_endpoint('all_betting_lines', 'start_time', sport, sportsbook, None, None, start_after, start_before, sort, cursor, limit)
 
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
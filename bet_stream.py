@@ -0,0 +1,115 @@
+import json
+import logging
+import queue
+import threading
+import pandas as pd
+from sqlalchemy import text
+
+from data_processing.pipeline_events import ChangeNotifier
+
+NOTIFY_TABLE = 'bets_to_notify'
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscriber(object):
+    def __init__(self, sports=None, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        """
+        One connected client. sports is the set of sport keys it wants, None for all of them
+        """
+        self.sports = set(sports) if sports else None
+        self.queue = queue.Queue(maxsize=queue_size)
+
+
+class BetBroadcaster(object):
+    def __init__(self, engine, poll_seconds=1.0):
+        """
+        Fans the bets LineFilter flags as new (the bets_to_notify table, i.e. the output of
+        get_bets_to_notify) out to every subscriber. A single background thread watches the
+        change counter and reads the rows of the versions it has not seen yet once per
+        pipeline write, however many clients are connected. Every version is published on its
+        own, also when several cycles ran between two polls
+        """
+        self.engine = engine
+        self.notifier = ChangeNotifier(engine)
+        self.poll_seconds = poll_seconds
+        self.logger = logging.getLogger("bet_stream")
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, sports=None) -> Subscriber:
+        subscriber = Subscriber(sports)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, version, bets) -> None:
+        """
+        Sends every subscriber the bets for the sports it asked for
+
+        Args:
+            version (int): the bets_to_notify version the bets come from
+            bets (list): the new bets as records
+        """
+        by_sport = {}
+        for bet in bets:
+            by_sport.setdefault(bet['sport'], []).append(bet)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.sports is None:
+                selected = bets
+            else:
+                selected = [bet for sport in subscriber.sports for bet in by_sport.get(sport, [])]
+            if not selected:
+                continue
+            event = (version, selected)
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                # slow client, drop its oldest event rather than block everyone else
+                try:
+                    subscriber.queue.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.queue.put_nowait(event)
+
+    def _watch(self) -> None:
+        last_versions = self.notifier.versions([NOTIFY_TABLE])
+        while True:
+            try:
+                versions = self.notifier.wait_for_change([NOTIFY_TABLE], last_versions, timeout=60, poll_seconds=self.poll_seconds)
+                if versions == last_versions:
+                    continue
+                df = pd.read_sql(text(f"SELECT * FROM {NOTIFY_TABLE} WHERE version > :last_seen ORDER BY version"),
+                                 self.engine, params={'last_seen': last_versions[NOTIFY_TABLE]})
+                # a cycle that committed after the counter was read is already in df
+                last_versions = {NOTIFY_TABLE: int(max(versions[NOTIFY_TABLE], df['version'].max() if len(df) else 0))}
+                for version, bets in df.groupby('version', sort=False):
+                    self.publish(int(version), json.loads(bets.drop(columns='version').to_json(orient='records')))
+            except Exception as e:
+                self.logger.error(f"Failed to broadcast new bets: {e}")
+
+
+def sse_events(broadcaster, subscriber, keepalive_seconds=15):
+    """
+    Server-Sent Events stream for a subscriber, ends with the client connection
+    """
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                version, bets = subscriber.queue.get(timeout=keepalive_seconds)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {version}\nevent: bets\ndata: {json.dumps(bets)}\n\n"
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,154 @@
+import logging
+import os
+import queue
+import threading
+import time
+import requests
+
+DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", 1000))
+# discord rejects message content longer than this
+DISCORD_MAX_MESSAGE_LENGTH = 2000
+MAX_RETRIES = 5
+REQUEST_TIMEOUT_SECONDS = 10
+# queued by stop, ends the background thread once everything before it was sent
+_STOP = object()
+
+
+class DiscordDispatcher(object):
+    def __init__(self, webhook_url=DISCORD_WEBHOOK_URL, fallback=None, max_queue=ALERT_QUEUE_SIZE, logger=None):
+        """
+        Sends alerts from a background thread so the ETL loop never waits on Discord. Alerts
+        go into a bounded queue, the worker packs as many queued alerts as fit into a single
+        message and posts it to the webhook, backing off on 429s and following the rate limit
+        headers. Without a webhook url the packed messages go through fallback.send_msg instead
+
+        Args:
+            webhook_url (str): the discord webhook to post to
+            fallback (DiscordAlert): used when there is no webhook url
+            max_queue (int): alerts beyond this many waiting are dropped
+        """
+        self.webhook_url = webhook_url
+        self.fallback = fallback
+        self.logger = logger or logging.getLogger("alert_dispatcher")
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.session = requests.Session()
+        self.sent_messages = 0
+        self.dropped_alerts = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def submit(self, msg) -> bool:
+        """
+        Queues an alert without blocking
+
+        Returns:
+            bool: False if the queue was full and the alert was dropped
+        """
+        try:
+            self.queue.put_nowait(msg)
+            return True
+        except queue.Full:
+            self.dropped_alerts += 1
+            self.logger.warning("Alert queue is full, dropping alert")
+            return False
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Waits until every queued alert was sent
+
+        Returns:
+            bool: False if the timeout ran out first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout=None) -> None:
+        """
+        Sends the alerts already queued and stops the background thread
+        """
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        pending = None
+        while True:
+            if pending is None:
+                pending = self.queue.get()
+            if pending is _STOP:
+                self.queue.task_done()
+                return
+            batch, length, packed, overflow = [], 0, 0, []
+            # pack alerts until the next one would not fit, that one starts the next message
+            while pending is not None and pending is not _STOP:
+                chunks = self._split(pending)
+                if batch and length + len(chunks[0]) + 1 > DISCORD_MAX_MESSAGE_LENGTH:
+                    break
+                batch.append(chunks[0])
+                length += len(chunks[0]) + 1
+                packed += 1
+                try:
+                    pending = self.queue.get_nowait()
+                except queue.Empty:
+                    pending = None
+                # an alert too long for one message ends the batch, the rest of it follows the batch
+                if len(chunks) > 1:
+                    overflow = chunks[1:]
+                    break
+            self._deliver("\n".join(batch))
+            for chunk in overflow:
+                self._deliver(chunk)
+            for _ in range(packed):
+                self.queue.task_done()
+
+    def _split(self, msg) -> list:
+        return [msg[i:i + DISCORD_MAX_MESSAGE_LENGTH] for i in range(0, max(len(msg), 1), DISCORD_MAX_MESSAGE_LENGTH)]
+
+    def _deliver(self, content) -> None:
+        try:
+            if self.webhook_url:
+                self._post(content)
+            elif self.fallback is not None:
+                self.fallback.send_msg(content)
+            self.sent_messages += 1
+        except Exception as e:
+            self.logger.error(f"Failed to send alert: {e}")
+
+    def _post(self, content) -> None:
+        backoff = 1.0
+        for _ in range(MAX_RETRIES):
+            try:
+                response = self.session.post(self.webhook_url, json={"content": content}, timeout=REQUEST_TIMEOUT_SECONDS)
+            except requests.RequestException as e:
+                self.logger.warning(f"Discord request failed, retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+            if response.status_code == 429:
+                time.sleep(self._retry_after(response, backoff))
+                backoff *= 2
+                continue
+            if response.status_code >= 500:
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+            response.raise_for_status()
+            # out of requests in this bucket, wait for it to reset before the next message
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                time.sleep(float(response.headers.get('X-RateLimit-Reset-After', 0)))
+            return
+        raise requests.HTTPError(f"Gave up sending alert after {MAX_RETRIES} attempts")
+
+    def _retry_after(self, response, default) -> float:
+        try:
+            return float(response.json()['retry_after'])
+        except Exception:
+            return float(response.headers.get('Retry-After', default))
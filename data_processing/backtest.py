@@ -0,0 +1,147 @@
+"""
+Backtests a whole grid of alpha values and kelly fractions at once over historical merged
+lines (merged_df of every cycle, e.g. from the replay) and settled results. For every
+configuration the bet on a line is the first observation where LineFilter would have
+flagged it at that alpha, the same line is never bet twice, just like the recommendation
+archive makes sure it is only alerted once. Everything is one broadcast NumPy pass over a
+(lines x alphas x kelly fractions) array instead of one pipeline run per alpha
+
+The results file has one row per settled event, the winner is the outcome name as it
+appears in the merged lines after clean_team_names ('draw' for a draw):
+
+    sport,home_team,away_team,start_time,winner
+
+    python backtest.py --start 2024-03-01 --end 2024-03-31 --results results.csv --alphas 0 0.01 0.02
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+from betting_math import bet_ids
+from filter_lines import BET_ID_COLUMNS, KELLY_FRACTIONS
+from odds_archive import ODDS_ARCHIVE_DIR
+
+DEFAULT_ALPHAS = [0.0, 0.005, 0.01, 0.015, 0.02, 0.03, 0.04, 0.05]
+EVENT_COLUMNS = ['sport', 'home_team', 'away_team', 'start_time']
+
+
+def settle(lines: pd.DataFrame, results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Attaches whether each line won, lines of events without a result are dropped
+
+    Args:
+        lines (pd.DataFrame): merged lines with an observed_at column
+        results (pd.DataFrame): sport, home_team, away_team, start_time and winner columns
+
+    Returns:
+        pd.DataFrame: the settled lines with a boolean won column
+    """
+    lines = lines.assign(start_time=pd.to_datetime(lines['start_time']))
+    results = results.assign(start_time=pd.to_datetime(results['start_time']))
+    settled = lines.merge(results[EVENT_COLUMNS + ['winner']], on=EVENT_COLUMNS, how='inner')
+    settled['won'] = settled['outcome'].str.lower() == settled['winner'].str.lower()
+    return settled.drop(columns=['winner'])
+
+
+def sweep(lines: pd.DataFrame, alphas, kelly_fractions) -> pd.DataFrame:
+    """
+    Runs every (alpha, kelly fraction) configuration over the settled lines. Stakes are
+    fractions of a fixed bankroll of 1, so profit and drawdown are in bankrolls
+
+    Args:
+        lines (pd.DataFrame): settled lines, see settle
+        alphas (list): the alpha values to test
+        kelly_fractions (list): the fractions of the full kelly bet to test
+
+    Returns:
+        pd.DataFrame: one row per configuration with the number of bets, wins, amount
+        staked, profit, ROI and the maximum drawdown of the running profit, with the bets
+        settled in start_time order
+    """
+    alphas = np.asarray(alphas, dtype=float)
+    fractions = np.asarray(kelly_fractions, dtype=float)
+    if lines.empty:
+        index = pd.MultiIndex.from_product([alphas, fractions], names=['alpha', 'kelly_fraction'])
+        return pd.DataFrame({'bets': 0, 'wins': 0, 'staked': 0.0, 'profit': 0.0, 'roi': np.nan,
+                             'max_drawdown': 0.0}, index=index).reset_index()
+
+    # walk every line's observations in time order
+    codes = pd.factorize(pd.Series(bet_ids(lines, BET_ID_COLUMNS), index=lines.index))[0]
+    order = np.lexsort((pd.to_datetime(lines['observed_at']).to_numpy(), codes))
+    codes = codes[order]
+    decimal_odds = lines['decimal_odds'].to_numpy(dtype=float)[order]
+    # the fair probability LineFilter used, if the lines carry it
+    if 'fair_probability' in lines:
+        mean_implied = lines['fair_probability'].to_numpy(dtype=float)[order]
+    else:
+        mean_implied = 1 / lines['avg_odds'].to_numpy(dtype=float)[order]
+    won = lines['won'].to_numpy(dtype=bool)[order]
+    start_time = pd.to_datetime(lines['start_time']).to_numpy()[order]
+
+    # (lines, alphas), the same threshold necessary_calculations and find_plus_ev_bets apply
+    predicted = mean_implied[:, None] - alphas[None, :]
+    flagged = decimal_odds[:, None] > 1 / predicted
+    # only the first flagged observation of each line is bet
+    counts = np.cumsum(flagged, axis=0)
+    group_start = np.r_[True, codes[1:] != codes[:-1]]
+    before_group = (counts - flagged)[group_start]
+    bet = flagged & (counts - before_group[np.cumsum(group_start) - 1] == 1)
+
+    b = decimal_odds - 1
+    full_kelly = np.clip((b[:, None] * predicted - (1 - predicted)) / b[:, None], 0, None)
+    # (lines, alphas, fractions)
+    stakes = np.where(bet, full_kelly, 0)[:, :, None] * fractions[None, None, :]
+    # an alpha above the fair probability flags the line with a kelly stake of 0, nothing is bet
+    placed = bet & (full_kelly > 0)
+    pnl = stakes * np.where(won, b, -1)[:, None, None]
+
+    running = np.cumsum(pnl[np.argsort(start_time, kind='stable')], axis=0)
+    peak = np.maximum(np.maximum.accumulate(running, axis=0), 0)
+    max_drawdown = (peak - running).max(axis=0)
+
+    staked = stakes.sum(axis=0)
+    profit = pnl.sum(axis=0)
+    shape = (len(alphas), len(fractions))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        roi = np.where(staked > 0, profit / staked, np.nan)
+    return pd.DataFrame({
+        'alpha': np.repeat(alphas, len(fractions)),
+        'kelly_fraction': np.tile(fractions, len(alphas)),
+        'bets': np.broadcast_to(placed.sum(axis=0)[:, None], shape).ravel(),
+        'wins': np.broadcast_to((placed & won[:, None]).sum(axis=0)[:, None], shape).ravel(),
+        'staked': staked.ravel(),
+        'profit': profit.ravel(),
+        'roi': roi.ravel(),
+        'max_drawdown': max_drawdown.ravel(),
+    })
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--results', required=True, help="CSV of settled events")
+    arg_parser.add_argument('--lines', default=None, help="CSV or parquet of merged lines with observed_at, "
+                                                         "replays the archive from --start to --end if not given")
+    arg_parser.add_argument('--start', default=None)
+    arg_parser.add_argument('--end', default=None)
+    arg_parser.add_argument('--archive-root', default=ODDS_ARCHIVE_DIR)
+    arg_parser.add_argument('--workers', type=int, default=None)
+    arg_parser.add_argument('--alphas', type=float, nargs='+', default=DEFAULT_ALPHAS)
+    arg_parser.add_argument('--kelly-fractions', type=float, nargs='+', default=list(KELLY_FRACTIONS.values()))
+    arg_parser.add_argument('--output', default=None, help="CSV file for the results")
+    args = arg_parser.parse_args()
+
+    if args.lines:
+        lines = pd.read_parquet(args.lines) if args.lines.endswith('.parquet') else pd.read_csv(args.lines)
+    else:
+        from replay import replay
+        dates = pd.date_range(args.start, args.end or args.start, freq='D')
+        days = [day['merged'] for day in replay(dates, args.archive_root, workers=args.workers, keep_merged=True)]
+        lines = pd.concat([pd.DataFrame()] + days, ignore_index=True)
+    report = sweep(settle(lines, pd.read_csv(args.results)), args.alphas, args.kelly_fractions)
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
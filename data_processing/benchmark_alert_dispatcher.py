@@ -0,0 +1,108 @@
+"""
+Measures alert throughput of DiscordDispatcher against a local stub of a Discord webhook.
+The stub enforces a bucket of --bucket-size requests per --bucket-seconds, sends the
+X-RateLimit headers Discord sends and answers 429 with retry_after once the bucket is
+empty. Also reports how long submit() blocked the caller, which should be ~0
+
+    python benchmark_alert_dispatcher.py --alerts 500 --bucket-size 5 --bucket-seconds 2
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import alert_dispatcher
+from alert_dispatcher import DiscordDispatcher
+
+
+class StubWebhook(object):
+    def __init__(self, bucket_size, bucket_seconds):
+        self.bucket_size = bucket_size
+        self.bucket_seconds = bucket_seconds
+        self.messages = []
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._used = 0
+
+    def handle(self, content):
+        """
+        Returns:
+            tuple: status code, headers, body
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.bucket_seconds:
+                self._window_start, self._used = now, 0
+            reset_after = self.bucket_seconds - (now - self._window_start)
+            if self._used >= self.bucket_size:
+                self.rate_limited += 1
+                return 429, {}, json.dumps({'message': 'You are being rate limited.', 'retry_after': reset_after})
+            if len(content) > alert_dispatcher.DISCORD_MAX_MESSAGE_LENGTH:
+                return 400, {}, json.dumps({'message': 'content too long'})
+            self._used += 1
+            self.messages.append(content)
+            headers = {'X-RateLimit-Limit': str(self.bucket_size),
+                       'X-RateLimit-Remaining': str(self.bucket_size - self._used),
+                       'X-RateLimit-Reset-After': f"{reset_after:.3f}"}
+            return 204, headers, ''
+
+
+def serve(stub) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            status, headers, payload = stub.handle(body['content'])
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(payload.encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--alerts', type=int, default=500)
+    arg_parser.add_argument('--bucket-size', type=int, default=5)
+    arg_parser.add_argument('--bucket-seconds', type=float, default=2.0)
+    args = arg_parser.parse_args()
+
+    stub = StubWebhook(args.bucket_size, args.bucket_seconds)
+    server = serve(stub)
+    url = f"http://127.0.0.1:{server.server_address[1]}/webhook"
+    dispatcher = DiscordDispatcher(webhook_url=url, max_queue=args.alerts)
+
+    alerts = [f"Team {i} vs Team {i + 1} home at fanduel has a 0.0{i % 10} EV. \n "
+              f"Bet on home with fanduel at 2.1 odds. And bet on nothing lower than 1.95\n"
+              for i in range(args.alerts)]
+    start = time.perf_counter()
+    blocked = 0.0
+    for alert in alerts:
+        submit_start = time.perf_counter()
+        dispatcher.submit(alert)
+        blocked = max(blocked, time.perf_counter() - submit_start)
+    dispatcher.flush()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    delivered = "\n".join(stub.messages)
+    assert all(alert in delivered for alert in alerts), "not every alert was delivered"
+    print(f"{args.alerts} alerts in {len(stub.messages)} messages, {elapsed:.2f}s, "
+          f"{args.alerts / elapsed:.1f} alerts/s, {stub.rate_limited} 429s, "
+          f"longest submit {blocked * 1000:.3f}ms")
+    print(f"one request per alert at the same rate limit would take "
+          f"~{args.alerts / args.bucket_size * args.bucket_seconds:.0f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Checks that the vectorized kelly, EV and bet id math in betting_math matches the
+row-wise apply path LineFilter used to run, and times both. The row-wise kelly is the
+scalar formula LineFilter applied through utils.basic_kelly_criterion, written out here.
+Neither path clips: a line priced below its fair odds gets a negative kelly, which the
+check asserts, and find_plus_ev_bets never flags those lines.
+
+    python benchmark_betting_math.py --rows 100000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from betting_math import bet_ids, expected_value, kelly_criterion
+from filter_lines import BET_ID_COLUMNS, KELLY_FRACTIONS, LineFilter
+
+
+def basic_kelly_criterion(probability, decimal_odds, kelly_size=1.0) -> float:
+    """
+    The kelly fraction of one line, kelly_size times (b * p - q) / b, unclipped
+    """
+    b = decimal_odds - 1
+    return kelly_size * (probability * b - (1 - probability)) / b
+
+
+def build_merged_lines(n_rows, alpha, seed) -> pd.DataFrame:
+    """
+    Builds a merged_df shaped frame with random prices around a common average
+    """
+    rng = np.random.default_rng(seed)
+    avg_odds = rng.uniform(1.2, 6.0, n_rows).round(2)
+    df = pd.DataFrame({
+        'home_team': [f"Home {i % 500}" for i in range(n_rows)],
+        'away_team': [f"Away {i % 700}" for i in range(n_rows)],
+        'outcome': [f"Home {i % 500}" if i % 2 == 0 else f"Away {i % 700}" for i in range(n_rows)],
+        'start_time': pd.Timestamp('2024-03-01 18:00') + pd.to_timedelta(rng.integers(0, 600, n_rows), unit='min'),
+        'avg_odds': avg_odds,
+        'decimal_odds': (avg_odds * rng.uniform(0.9, 1.15, n_rows)).round(2),
+    })
+    df['predicted_probability'] = 1 / df['avg_odds'] - alpha
+    return df
+
+
+def rowwise(df):
+    out = pd.DataFrame(index=df.index)
+    out['expected_value'] = (df['predicted_probability'] * (df['decimal_odds'] - 1)) + ((1 - df['predicted_probability']) * -1)
+    for column, fraction in KELLY_FRACTIONS.items():
+        out[column] = df.apply(lambda x: basic_kelly_criterion(x['predicted_probability'], x['decimal_odds'], kelly_size=fraction), axis=1)
+    out['id'] = df.apply(lambda x: LineFilter.generate_unique_hash(None, x['home_team'], x['away_team'], x['outcome'], x['start_time']), axis=1)
+    return out
+
+
+def vectorized(df):
+    out = pd.DataFrame(index=df.index)
+    out['expected_value'] = expected_value(df['predicted_probability'], df['decimal_odds'])
+    kelly_sizes = kelly_criterion(df['predicted_probability'], df['decimal_odds'], list(KELLY_FRACTIONS.values()))
+    for i, column in enumerate(KELLY_FRACTIONS):
+        out[column] = kelly_sizes[:, i]
+    out['id'] = bet_ids(df, BET_ID_COLUMNS)
+    return out
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    arg_parser.add_argument('--alpha', type=float, default=0.02)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    df = build_merged_lines(args.rows, args.alpha, args.seed)
+    start = time.perf_counter()
+    expected = rowwise(df)
+    rowwise_time = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = vectorized(df)
+    vectorized_time = time.perf_counter() - start
+
+    # same data in, same sizes and ids out
+    for column in ['expected_value', *KELLY_FRACTIONS]:
+        np.testing.assert_allclose(actual[column], expected[column], rtol=1e-12, atol=1e-12)
+    assert (actual['id'] == expected['id']).all(), "bet ids differ from generate_unique_hash"
+    # a negative edge sizes a negative bet, a positive edge a positive one
+    negative_edge = (df['predicted_probability'] * df['decimal_odds'] < 1).to_numpy()
+    assert negative_edge.any() and (~negative_edge).any(), "the lines need both signs of edge"
+    for column in KELLY_FRACTIONS:
+        assert (actual[column].to_numpy()[negative_edge] < 0).all(), f"{column} is not negative on every negative edge line"
+        assert (actual[column].to_numpy()[~negative_edge] >= 0).all(), f"{column} is negative on a positive edge line"
+
+    print(f"rows: {args.rows}")
+    print(f"row-wise apply: {rowwise_time:.3f}s")
+    print(f"vectorized:     {vectorized_time:.3f}s ({rowwise_time / vectorized_time:.1f}x)")
+    print("outputs match")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Stress tests the shared SQLite database the way the pipelines and the web apps use it: every
+writer process replaces its own pair of tables every cycle, like the odds sources and
+LineFilter do, while reader processes read both tables of a random writer, like the web apps.
+Runs once with the old setup (a plain engine and to_sql(if_exists='replace')) and once with
+database.py (WAL, pooled engine, staging tables swapped in one transaction) and reports the
+errors and the inconsistent reads of each: a missing table, a locked database, a table read
+half-written or a pair of tables read from two different cycles. The swap run must have
+no error at all, the script fails if a reader or a writer of it records one or if its
+readers did not get to read
+
+    python benchmark_database.py --writers 3 --readers 4 --rows 5000 --seconds 10 --write-interval 1
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from database import new_engine, replace_tables
+
+MODES = ['legacy', 'swap']
+
+
+def writer_tables(writer) -> list:
+    return [f"writer_{writer}_best_lines", f"writer_{writer}_plus_ev_bets"]
+
+
+def cycle_frame(cycle, rows, seed) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'cycle': cycle,
+        'sport': rng.choice(['basketball_nba', 'icehockey_nhl', 'soccer_epl'], rows),
+        'start_time': pd.Timestamp('2030-01-01') + pd.to_timedelta(rng.integers(0, 86400, rows), unit='s'),
+        'decimal_odds': rng.uniform(1.2, 5, rows),
+        'expected_value': rng.normal(0, 0.05, rows),
+    })
+
+
+def make_engine(mode, database_uri):
+    return new_engine(database_uri) if mode == 'swap' else create_engine(database_uri)
+
+
+def run_writer(mode, database_uri, writer, rows, seconds, interval, results) -> None:
+    engine = make_engine(mode, database_uri)
+    tables = writer_tables(writer)
+    frame = cycle_frame(0, rows, writer)
+    latencies, errors, cycle = [], {}, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        cycle += 1
+        df = frame.assign(cycle=cycle)
+        start = time.perf_counter()
+        try:
+            if mode == 'swap':
+                replace_tables(engine, {table: df for table in tables})
+            else:
+                for table in tables:
+                    df.to_sql(table, engine, if_exists='replace', index=False)
+        except Exception as e:
+            key = type(e).__name__ + ': ' + str(getattr(e, 'orig', e)).split('\n')[0]
+            errors[key] = errors.get(key, 0) + 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        time.sleep(interval)
+    engine.dispose()
+    results.put({'role': 'writer', 'operations': len(latencies), 'latencies': latencies, 'errors': errors})
+
+
+def run_reader(mode, database_uri, writers, rows, seconds, seed, results) -> None:
+    engine = make_engine(mode, database_uri)
+    rng = np.random.default_rng(seed)
+    latencies, errors = [], {}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        tables = writer_tables(int(rng.integers(writers)))
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                snapshots = [conn.execute(text(f"SELECT MIN(cycle), MAX(cycle), COUNT(*) FROM {table}")).fetchone()
+                             for table in tables]
+        except Exception as e:
+            key = type(e).__name__ + ': ' + str(getattr(e, 'orig', e)).split('\n')[0]
+            errors[key] = errors.get(key, 0) + 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        if any(count != rows or low != high for low, high, count in snapshots):
+            errors['partial table'] = errors.get('partial table', 0) + 1
+        elif len({low for low, _, _ in snapshots}) > 1:
+            errors['tables from different cycles'] = errors.get('tables from different cycles', 0) + 1
+    engine.dispose()
+    results.put({'role': 'reader', 'operations': len(latencies), 'latencies': latencies, 'errors': errors})
+
+
+def benchmark(mode, writers, readers, rows, seconds, interval) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+        # every table exists before the readers start
+        engine = make_engine(mode, database_uri)
+        for writer in range(writers):
+            for table in writer_tables(writer):
+                cycle_frame(0, rows, writer).to_sql(table, engine, if_exists='replace', index=False)
+        engine.dispose()
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_writer, args=(mode, database_uri, writer, rows, seconds, interval, results))
+                     for writer in range(writers)]
+        processes += [multiprocessing.Process(target=run_reader, args=(mode, database_uri, writers, rows, seconds, seed, results))
+                      for seed in range(readers)]
+        for process in processes:
+            process.start()
+        runs = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    result = {'mode': mode, 'writers': writers, 'readers': readers, 'rows': rows, 'seconds': seconds, 'write_interval': interval}
+    for role in ['writer', 'reader']:
+        role_runs = [run for run in runs if run['role'] == role]
+        latencies = np.concatenate([run['latencies'] for run in role_runs] + [[]])
+        errors = {}
+        for run in role_runs:
+            for key, count in run['errors'].items():
+                errors[key] = errors.get(key, 0) + count
+        result[f"{role}_ops_per_second"] = sum(run['operations'] for run in role_runs) / seconds
+        result[f"{role}_p50_ms"] = float(np.percentile(latencies, 50) * 1000) if len(latencies) else None
+        result[f"{role}_p95_ms"] = float(np.percentile(latencies, 95) * 1000) if len(latencies) else None
+        result[f"{role}_errors"] = errors
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--writers', type=int, default=3)
+    arg_parser.add_argument('--readers', type=int, default=4)
+    arg_parser.add_argument('--rows', type=int, default=5000, help="rows per table and cycle")
+    arg_parser.add_argument('--seconds', type=float, default=10)
+    arg_parser.add_argument('--write-interval', type=float, default=1.0,
+                            help="seconds every writer waits between cycles, 0 writes back to back")
+    arg_parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    arg_parser.add_argument('--output', default=None, help="JSON file for the results")
+    args = arg_parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        result = benchmark(mode, args.writers, args.readers, args.rows, args.seconds, args.write_interval)
+        results.append(result)
+        print(json.dumps({key: round(value, 3) if isinstance(value, float) else value
+                          for key, value in result.items()}), flush=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    for result in results:
+        if result['mode'] != 'swap':
+            continue
+        if not result['reader_ops_per_second']:
+            raise AssertionError("the swap readers read nothing, the run checks nothing")
+        if result['reader_errors'] or result['writer_errors']:
+            raise AssertionError(f"replace_tables let readers or writers fail: readers {result['reader_errors']}, "
+                                 f"writers {result['writer_errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Checks the grouped fair odds methods in fair_odds against a plain per-event implementation
+and times them on a full synthetic avg_odds board, 2-way and 3-way markets mixed
+
+    python benchmark_fair_odds.py --events 5000
+"""
+import argparse
+import math
+import time
+import numpy as np
+
+from fair_odds import EVENT_COLUMNS, METHODS, fair_probabilities
+from synthetic_data import generate_line_tables, load_bundled_team_names
+
+
+def solve(f, low, high, iterations=200) -> float:
+    """
+    Bisection for a decreasing f
+    """
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        low, high = (mid, high) if f(mid) > 0 else (low, mid)
+    return (low + high) / 2
+
+
+def reference(odds, method) -> list:
+    """
+    Fair probabilities of a single event, one outcome at a time
+    """
+    implied = [1 / o for o in odds]
+    booksum = sum(implied)
+    n = len(implied)
+    if method == 'raw' or n < 2:
+        return implied
+    if method == 'multiplicative':
+        return [q / booksum for q in implied]
+    if method == 'additive':
+        return [max(q - (booksum - 1) / n, 0) for q in implied]
+    if method == 'power':
+        k = solve(lambda k: sum(q ** k for q in implied) - 1, 1e-6, 100)
+        return [q ** k for q in implied]
+    if method == 'shin':
+        def probabilities(z):
+            return [(math.sqrt(z ** 2 + 4 * (1 - z) * q ** 2 / booksum) - z) / (2 * (1 - z)) for q in implied]
+        z = solve(lambda z: sum(probabilities(z)) - 1, 0, 0.999) if booksum > 1 else 0
+        return probabilities(z)
+    raise ValueError(method)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--events', type=int, default=5000, help="events per sport")
+    args = arg_parser.parse_args()
+
+    _, avg_odds = generate_line_tables(load_bundled_team_names(), ['book'], args.events, noise=0)
+    groups = list(avg_odds.groupby(EVENT_COLUMNS, sort=False).indices.values())
+    print(f"{len(avg_odds)} outcomes in {len(groups)} events")
+    for method in METHODS:
+        start = time.perf_counter()
+        fair = fair_probabilities(avg_odds, method)
+        vectorized = time.perf_counter() - start
+
+        odds = avg_odds['decimal_odds'].to_numpy()
+        expected = np.empty(len(avg_odds))
+        start = time.perf_counter()
+        for rows in groups:
+            expected[rows] = reference(odds[rows].tolist(), method)
+        looped = time.perf_counter() - start
+
+        assert np.allclose(fair, expected, atol=1e-9), f"{method} does not match the per event reference"
+        sums = np.bincount(avg_odds.groupby(EVENT_COLUMNS, sort=False).ngroup(), weights=fair)
+        print(f"{method:>15}: {vectorized * 1000:8.1f}ms vectorized, {looped * 1000:8.1f}ms per event "
+              f"({looped / vectorized:5.1f}x), event sums {sums.min():.4f}-{sums.max():.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Times each stage of the LineFilter pipeline on synthetic all_betting_lines, avg_odds and
+team_names tables built from the BOOKMAKERS table and the team files bundled with the
+repo. Every configuration runs against a fresh temporary database, the first repeat
+starts with a cold team name cache and empty recommendation archive, later repeats see
+the same slate again like a steady state cycle does. Results are written as JSON so
+runs can be compared between commits
+
+    python benchmark_line_filter.py --events 100 1000 --books 8 --noise 0.3 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from sqlalchemy import create_engine
+
+from filter_lines import BOOKMAKERS, TRANSFORM_STAGES, LineFilter
+from synthetic_data import generate_line_tables, load_bundled_team_names
+
+STAGES = TRANSFORM_STAGES + ['load']
+
+
+def run_stages(line_filter, all_betting_lines, avg_odds, team_names) -> dict:
+    """
+    Runs one cycle of the pipeline on copies of the tables
+
+    Returns:
+        dict: stage -> seconds
+    """
+    line_filter.all_betting_lines = all_betting_lines.copy()
+    line_filter.average_odds = avg_odds.copy()
+    line_filter.team_names = team_names
+    timings = {}
+    for stage in STAGES:
+        start = time.perf_counter()
+        getattr(line_filter, stage)()
+        timings[stage] = time.perf_counter() - start
+    timings['total'] = sum(timings.values())
+    return timings
+
+
+def benchmark(n_events, n_books, sports, noise, repeat, alpha, seed) -> dict:
+    team_names = load_bundled_team_names()
+    # the books we can bet with first, like the real feed has all of them
+    bookmakers = sorted(BOOKMAKERS, key=lambda book: not BOOKMAKERS[book]['can_bet'])[:n_books]
+    all_betting_lines, avg_odds = generate_line_tables(team_names, bookmakers, n_events, sports=sports,
+                                                       noise=noise, seed=seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        line_filter = LineFilter(engine=create_engine(f"sqlite:///{os.path.join(tmp, 'benchmark.db')}"), alpha=alpha)
+        line_filter.logger.setLevel('INFO')
+        runs = [run_stages(line_filter, all_betting_lines, avg_odds, team_names) for _ in range(repeat)]
+        line_filter.sheets.stop()
+        rows = {'all_betting_lines': len(all_betting_lines), 'avg_odds': len(avg_odds),
+                'best_lines': len(line_filter.best_lines), 'merged': len(line_filter.merged_df),
+                'plus_ev_bets': len(line_filter.plus_ev_bets)}
+        line_filter.engine.dispose()
+    return {
+        'events_per_sport': n_events, 'books': n_books, 'sports': sports or team_names['sport'].unique().tolist(),
+        'noise': noise, 'rows': rows, 'runs': runs,
+        'median': {stage: statistics.median(run[stage] for run in runs) for stage in runs[0]},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--events', type=int, nargs='+', default=[100, 1000], help="events per sport")
+    arg_parser.add_argument('--books', type=int, nargs='+', default=[len(BOOKMAKERS)])
+    arg_parser.add_argument('--sports', nargs='+', default=None)
+    arg_parser.add_argument('--noise', type=float, nargs='+', default=[0.3])
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--alpha', type=float, default=0.01)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--output', default=None, help="JSON file to write, stdout if not given")
+    args = arg_parser.parse_args()
+
+    results = []
+    for n_events in args.events:
+        for n_books in args.books:
+            for noise in args.noise:
+                result = benchmark(n_events, n_books, args.sports, noise, args.repeat, args.alpha, args.seed)
+                results.append(result)
+                stages = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in result['median'].items())
+                print(f"# {n_events} events/sport, {n_books} books, noise {noise}: {stages}", flush=True)
+
+    output = {'commit': git_commit(), 'python': platform.python_version(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'stages': STAGES, 'repeat': args.repeat, 'alpha': args.alpha, 'seed': args.seed, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+
+if __name__ == '__main__':
+    main()
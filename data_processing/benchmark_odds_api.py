@@ -0,0 +1,110 @@
+"""
+Load tests OddsAPIExtractor against mock_odds_api.py: extracts, transforms and loads every
+sport of the mock for a few cycles at each --concurrency into a scratch database and reports
+throughput, request latencies, the sports lost to injected failures and the quota spent.
+The mock sends no ETag, so every cycle downloads every sport
+
+    python benchmark_odds_api.py --sports 200 --events 20 --latency-ms 80 --jitter-ms 40 --concurrency 1 4 16
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import create_engine
+
+from mock_odds_api import MOCK_BOOKMAKERS, MockOddsAPI
+from odds_api import OddsAPIExtractor
+
+
+def run_cycle(extractor) -> dict:
+    """
+    Runs one ETL cycle stage by stage
+
+    Returns:
+        dict: seconds per stage, the rows loaded and the sports that failed
+    """
+    extractor.api.start_cycle()
+    extractor.api.request_seconds.clear()
+    timings = {}
+    for stage in [extractor.extract_odds, extractor.transform_odds, extractor.load_odds]:
+        start = time.perf_counter()
+        r = stage()
+        timings[stage.__name__] = time.perf_counter() - start
+        if r != 0:
+            break
+    requested = len(extractor.api.request_seconds)
+    return {**timings, 'rows': len(extractor.odds_table), 'requests': requested,
+            'request_seconds': list(extractor.api.request_seconds.values()),
+            'events': extractor.flattener.events_seen}
+
+
+def benchmark(mock, base_url, concurrency, cycles) -> dict:
+    mock.reset()
+    with tempfile.TemporaryDirectory() as tmp:
+        extractor = OddsAPIExtractor(api_key='mock', max_concurrency=concurrency, base_url=base_url,
+                                     engine=create_engine(f"sqlite:///{os.path.join(tmp, 'benchmark.db')}"),
+                                     archive_root=os.path.join(tmp, 'odds_archive'))
+        # the failures are counted from the mock
+        extractor.logger.setLevel('ERROR')
+        extractor.extracted_sports = [sport['key'] for sport in mock.sports]
+        runs = [run_cycle(extractor) for _ in range(cycles)]
+        extractor.engine.dispose()
+    latencies = np.concatenate([run['request_seconds'] for run in runs])
+    extract_seconds = sum(run['extract_odds'] for run in runs)
+    return {
+        'concurrency': concurrency,
+        'sports': len(extractor.extracted_sports),
+        'cycles': cycles,
+        'requests_per_second': sum(run['requests'] for run in runs) / extract_seconds,
+        'events_per_second': sum(run['events'] for run in runs) / extract_seconds,
+        'extract_seconds': float(np.median([run['extract_odds'] for run in runs])),
+        'transform_seconds': float(np.median([run.get('transform_odds', np.nan) for run in runs])),
+        'load_seconds': float(np.median([run.get('load_odds', np.nan) for run in runs])),
+        'rows': runs[-1]['rows'],
+        'request_p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'request_p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'failed_sports_per_cycle': (mock.errors + mock.rate_limited) / cycles,
+        'mock_errors': mock.errors,
+        'mock_rate_limited': mock.rate_limited,
+        'quota_used': mock.quota_used,
+        'requests_remaining': extractor.api.requests_remaining,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sports', type=int, default=200)
+    arg_parser.add_argument('--events', type=int, default=20, help="events per sport")
+    arg_parser.add_argument('--books', type=int, default=len(MOCK_BOOKMAKERS))
+    arg_parser.add_argument('--payload-dir', default=None, help="serve recorded payloads, see mock_odds_api.py")
+    arg_parser.add_argument('--latency-ms', type=float, default=50)
+    arg_parser.add_argument('--jitter-ms', type=float, default=25)
+    arg_parser.add_argument('--error-rate', type=float, default=0)
+    arg_parser.add_argument('--rate-limit-rate', type=float, default=0)
+    arg_parser.add_argument('--quota', type=int, default=1_000_000)
+    arg_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    arg_parser.add_argument('--cycles', type=int, default=3)
+    arg_parser.add_argument('--output', default=None, help="JSON file for the results")
+    args = arg_parser.parse_args()
+
+    mock = MockOddsAPI(args.sports, args.events, args.books, args.payload_dir, args.latency_ms, args.jitter_ms,
+                       args.error_rate, args.rate_limit_rate, quota=args.quota)
+    base_url = mock.start()
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            result = benchmark(mock, base_url, concurrency, args.cycles)
+            results.append(result)
+            print(json.dumps({key: round(value, 3) if isinstance(value, float) else value
+                              for key, value in result.items()}), flush=True)
+    finally:
+        mock.stop()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
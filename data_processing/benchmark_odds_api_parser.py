@@ -0,0 +1,114 @@
+"""
+Compares OddsFlattener with the json_normalize transform OddsAPIExtractor.transform_odds ran
+before it, on synthetic Odds API responses whose events start anywhere from hours ago to
+tomorrow, plus events without a start time or without bookmakers. Both paths get the same
+clock, the script fails if they keep different rows and reports the time and the peak memory
+of each
+
+    python benchmark_odds_api_parser.py --sports 40 --events 20 --now "2030-06-15 18:00"
+"""
+import argparse
+import time
+import tracemalloc
+import pandas as pd
+
+from event_keys import line_keys
+from mock_odds_api import MOCK_BOOKMAKERS
+from odds_api_parser import OddsFlattener
+from synthetic_data import generate_odds_api_events, load_bundled_team_names
+
+# generated per cycle, not part of what the responses say
+VOLATILE_COLUMNS = ['id', 'update_time']
+
+
+def json_normalize_transform(extracted_odds, now) -> pd.DataFrame:
+    """
+    transform_odds before OddsFlattener, with now passed in where it called pd.to_datetime('now')
+    """
+    odds_table = pd.json_normalize(extracted_odds, record_path=["bookmakers", "markets", "outcomes"],
+                                   meta=["sport_key", "commence_time", "home_team", "away_team",
+                                         ["bookmakers", "key"], ["bookmakers", "title"], ["markets", "key"]],
+                                   errors="ignore")
+    odds_table = odds_table.rename(columns={"name": "outcome", "price": "decimal_odds", 'sport_key': 'sport',
+                                            "commence_time": "start_time", "bookmakers.title": "sportsbook"})
+    odds_table['update_time'] = now
+    odds_table["id"] = [str(i) for i in range(len(odds_table))]
+    odds_table["start_time"] = pd.to_datetime(odds_table["start_time"])
+    odds_table["start_time"] = odds_table["start_time"].dt.tz_convert('US/Central')
+    odds_table = odds_table[odds_table["start_time"] > now.tz_localize('US/Central')]
+    odds_table = odds_table[odds_table["start_time"].dt.date == now.date()]
+    odds_table = odds_table.loc[:, ['id', "sport", "home_team", "away_team", "start_time", "sportsbook", "outcome",
+                                    "decimal_odds", "update_time"]]
+    odds_table['line_key'] = line_keys(odds_table)
+    return odds_table
+
+
+def build_responses(n_sports, n_events, now, seed) -> list:
+    """
+    One response per sport, the events start between 12 hours before now and 36 hours after
+    it so every response has started, later today and tomorrow's events
+    """
+    team_names = load_bundled_team_names()
+    sports = list(team_names['sport'].unique())
+    start = now.tz_localize('US/Central').tz_convert('UTC') - pd.Timedelta(hours=12)
+    responses = []
+    for i in range(n_sports):
+        sport_key = sports[i % len(sports)]
+        teams = team_names[team_names['sport'] == sport_key]['team_name'].to_list()
+        events = generate_odds_api_events(sport_key, teams, MOCK_BOOKMAKERS, n_events, three_way=sport_key.startswith('soccer'),
+                                          start=start, window_hours=48, seed=seed + i)
+        events[0] = {**events[0], 'commence_time': None}
+        events[1] = {**events[1], 'bookmakers': []}
+        responses.append(events)
+    return responses
+
+
+def measure(func, *args) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = func(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, seconds, peak
+
+
+def flatten(responses, now) -> pd.DataFrame:
+    flattener = OddsFlattener(now=now)
+    for events in responses:
+        flattener.add(events)
+    return flattener.to_frame()
+
+
+def normalize(responses, now) -> pd.DataFrame:
+    return json_normalize_transform([event for events in responses for event in events], now)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sports', type=int, default=40)
+    arg_parser.add_argument('--events', type=int, default=20, help="events per sport")
+    arg_parser.add_argument('--now', default=None, help="local time of the cycle, the current time by default")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    now = pd.Timestamp('now') if args.now is None else pd.Timestamp(args.now)
+    responses = build_responses(args.sports, args.events, now, args.seed)
+
+    expected, normalize_seconds, normalize_peak = measure(normalize, responses, now)
+    flattened, flatten_seconds, flatten_peak = measure(flatten, responses, now)
+
+    n_events = sum(len(events) for events in responses)
+    print(f"sports: {args.sports}, events: {n_events}, now: {now}, rows kept: {len(expected)}")
+    print(f"json_normalize: {normalize_seconds:.3f}s, peak {normalize_peak / 2 ** 20:.1f} MiB")
+    print(f"OddsFlattener:  {flatten_seconds:.3f}s ({normalize_seconds / flatten_seconds:.1f}x), "
+          f"peak {flatten_peak / 2 ** 20:.1f} MiB")
+    if expected.empty:
+        raise AssertionError("no event starts later today, the comparison checks nothing")
+    pd.testing.assert_frame_equal(flattened.drop(columns=VOLATILE_COLUMNS).reset_index(drop=True),
+                                  expected.drop(columns=VOLATILE_COLUMNS).reset_index(drop=True))
+    print("OddsFlattener keeps the same rows as json_normalize")
+
+
+if __name__ == '__main__':
+    main()
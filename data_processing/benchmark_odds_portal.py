@@ -0,0 +1,90 @@
+"""
+Measures how many league pages per second OddsPortalScraper gets through for different
+pool sizes, against league pages served from a local directory instead of OddsPortal.
+Saved OddsPortal pages named <league key>.html in --fixtures-dir are used as they are,
+missing leagues get a synthetic page with the same structure.
+
+    python benchmark_odds_portal.py --pool-sizes 1 2 4 --rounds 3
+"""
+import argparse
+import functools
+import os
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from odds_portal import LEAGUE_URLS, OddsPortalScraper
+from synthetic_data import load_bundled_team_names, render_odds_portal_page
+
+
+def write_fixtures(fixtures_dir, n_events) -> dict:
+    """
+    Makes sure every league has a page in fixtures_dir
+
+    Returns:
+        dict: league key -> file name
+    """
+    team_names = load_bundled_team_names()
+    sports = team_names['sport'].unique()
+    os.makedirs(fixtures_dir, exist_ok=True)
+    pages = {}
+    for i, league in enumerate(LEAGUE_URLS):
+        file_name = f"{league}.html"
+        path = os.path.join(fixtures_dir, file_name)
+        if not os.path.exists(path):
+            # borrow the teams of a bundled sport, the scraper does not care which
+            sport = league if league in sports else sports[i % len(sports)]
+            html = render_odds_portal_page(team_names, sport, n_events, three_way=league.startswith('soccer'), seed=i)
+            with open(path, 'w') as f:
+                f.write(html)
+        pages[league] = file_name
+    return pages
+
+
+def serve(fixtures_dir) -> ThreadingHTTPServer:
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=fixtures_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--pool-sizes', type=int, nargs='+', default=[1, 2, 4])
+    arg_parser.add_argument('--rounds', type=int, default=3)
+    arg_parser.add_argument('--events', type=int, default=30)
+    arg_parser.add_argument('--fixtures-dir', default=None)
+    args = arg_parser.parse_args()
+
+    fixtures_dir = args.fixtures_dir or tempfile.mkdtemp(prefix="odds_portal_fixtures_")
+    pages = write_fixtures(fixtures_dir, args.events)
+    server = serve(fixtures_dir)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    league_urls = {league: f"{base_url}/{file_name}" for league, file_name in pages.items()}
+
+    for pool_size in args.pool_sizes:
+        scraper = OddsPortalScraper(league_urls=league_urls, pool_size=pool_size, headless=True)
+        if len(scraper.drivers) < pool_size:
+            for web in scraper.drivers:
+                web.quit()
+            raise RuntimeError(f"Only {len(scraper.drivers)} of {pool_size} Chrome drivers started, see the odds_portal log")
+        try:
+            scraper.extract_odds()  # warm up the browsers
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                scraper.extract_odds()
+            elapsed = time.perf_counter() - start
+        finally:
+            for web in scraper.drivers:
+                web.quit()
+        n_pages = args.rounds * len(league_urls)
+        print(f"pool size {pool_size}: {n_pages / elapsed:.2f} league pages/s ({len(scraper.data)} rows per round)")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Times every installed OddsPortal parser backend against saved league pages and checks
+that they extract exactly the same rows as the original BeautifulSoup html.parser path.
+Pages are read from --fixtures-dir (<league key>.html), leagues without a saved page get
+a synthetic one. The league pages committed in fixtures/odds_portal_saved, written in the
+markup of the live site (Vue comment nodes, entities, accented names, in-play, postponed
+and unpriced events, Yesterday/Today/Tomorrow and dated headers), are always compared too
+and must parse to at least one row, the script fails on any difference
+
+    python benchmark_odds_portal_parser.py --rounds 20
+"""
+import argparse
+import os
+import time
+import pandas as pd
+
+from benchmark_odds_portal import write_fixtures
+from odds_portal_parser import PARSER_BACKENDS, parse_event_rows
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "odds_portal")
+SAVED_PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "odds_portal_saved")
+# generated per parse, not part of what the page says
+VOLATILE_COLUMNS = ['id', 'update_time']
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    arg_parser.add_argument('--events', type=int, default=60)
+    arg_parser.add_argument('--fixtures-dir', default=FIXTURES_DIR)
+    args = arg_parser.parse_args()
+
+    pages = write_fixtures(args.fixtures_dir, args.events)
+    html = {}
+    for league, file_name in pages.items():
+        with open(os.path.join(args.fixtures_dir, file_name)) as f:
+            html[league] = (league, f.read())
+    for file_name in sorted(os.listdir(SAVED_PAGES_DIR)):
+        with open(os.path.join(SAVED_PAGES_DIR, file_name), encoding='utf-8') as f:
+            html[f"saved/{file_name}"] = (os.path.splitext(file_name)[0], f.read())
+
+    expected = {name: parse_event_rows(league, page, backend="bs4").drop(columns=VOLATILE_COLUMNS)
+                for name, (league, page) in html.items()}
+    empty = [name for name, df in expected.items() if name.startswith('saved/') and df.empty]
+    if empty:
+        raise AssertionError(f"no rows parsed from {empty}, the comparison checks nothing")
+    n_rows = sum(len(df) for df in expected.values())
+    timings = {}
+    for backend in PARSER_BACKENDS:
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            parsed = {name: parse_event_rows(league, page, backend=backend) for name, (league, page) in html.items()}
+        timings[backend] = (time.perf_counter() - start) / args.rounds
+        for name, df in parsed.items():
+            pd.testing.assert_frame_equal(df.drop(columns=VOLATILE_COLUMNS), expected[name], obj=f"{backend} {name}")
+
+    print(f"{len(html)} pages, {n_rows} rows per round")
+    for backend, seconds in timings.items():
+        print(f"{backend:>10}: {seconds * 1000:.1f} ms per round, {len(html) / seconds:.1f} pages/s "
+              f"({timings['bs4'] / seconds:.1f}x bs4), rows identical")
+
+
+if __name__ == '__main__':
+    main()
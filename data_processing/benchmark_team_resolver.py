@@ -0,0 +1,109 @@
+"""
+Compares the row-wise fuzzywuzzy path LineFilter.clean_team_names used to run with the
+cached TeamNameResolver on synthetic lines built from the bundled team files, some of the
+names with accents and punctuation added, and fails if a single name resolves differently
+
+    python benchmark_team_resolver.py --rows 3000 --noise 0.5 --accents 0.2
+"""
+import argparse
+import logging
+import time
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+
+from filter_lines import LineFilter
+from synthetic_data import generate_raw_team_names, load_bundled_team_names
+from team_resolver import TeamNameResolver
+
+NAME_COLUMNS = ['home_team', 'away_team', 'outcome']
+# the characters the sources write differently, fuzzywuzzy drops the non-ASCII ones
+ACCENTS = str.maketrans({'a': 'á', 'e': 'é', 'o': 'ö', 'u': 'ü', 'n': 'ñ'})
+PUNCTUATION = ['.', '-', '–', "'", '&']
+
+
+def add_accents(names, share, seed) -> list:
+    """
+    Gives share of the names accents or punctuation
+    """
+    rng = np.random.default_rng(seed)
+    out = []
+    for name in names:
+        roll = rng.random()
+        if roll < share / 2:
+            name = name.translate(ACCENTS)
+        elif roll < share:
+            name = name.replace(' ', rng.choice(PUNCTUATION), 1) if ' ' in name else name + rng.choice(PUNCTUATION)
+        out.append(name)
+    return out
+
+
+def build_lines(team_names, n_rows, noise, accents, seed) -> pd.DataFrame:
+    """
+    Builds a best_lines shaped frame with noisy home/away/outcome names
+    """
+    home = generate_raw_team_names(team_names, n_rows, noise, seed)
+    away = generate_raw_team_names(team_names, n_rows, noise, seed + 1)
+    lines = pd.DataFrame({
+        'sport': home['sport'],
+        'home_team': add_accents(home['raw_name'], accents, seed),
+        'away_team': add_accents(away['raw_name'], accents, seed + 1),
+    })
+    lines['outcome'] = np.where(np.arange(n_rows) % 2 == 0, lines['home_team'], lines['away_team'])
+    return lines
+
+
+def rowwise_clean(lines, team_names) -> pd.DataFrame:
+    """
+    The path clean_team_names took before the resolver: one apply per column and a
+    fresh sport filter plus extractOne for every row
+    """
+    fake_filter = SimpleNamespace(team_names=team_names, logger=logging.getLogger("benchmark"))
+    lines = lines.copy()
+    for column in NAME_COLUMNS:
+        lines[column] = lines.apply(lambda x: LineFilter.lambda_fuzzy_wuzzy(fake_filter, x[column], x['sport']), axis=1)
+    return lines
+
+
+def time_it(func, *args):
+    start = time.perf_counter()
+    out = func(*args)
+    return out, time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=3000)
+    arg_parser.add_argument('--noise', type=float, default=0.5)
+    arg_parser.add_argument('--accents', type=float, default=0.2, help="share of names with accents or punctuation")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    team_names = load_bundled_team_names()
+    lines = build_lines(team_names, args.rows, args.noise, args.accents, args.seed)
+
+    expected, rowwise_time = time_it(rowwise_clean, lines, team_names)
+
+    resolver = TeamNameResolver()
+    resolver.refresh(team_names)
+    cold, cold_time = time_it(resolver.resolve_columns, lines.copy(), NAME_COLUMNS)
+    resolver.refresh(team_names)
+    _, warm_time = time_it(resolver.resolve_columns, lines.copy(), NAME_COLUMNS)
+
+    same = (cold[NAME_COLUMNS].fillna('') == expected[NAME_COLUMNS].fillna('')).to_numpy()
+    print(f"rows: {args.rows}, noise: {args.noise}, accents: {args.accents}")
+    print(f"row-wise apply:       {rowwise_time:.3f}s")
+    print(f"resolver (cold cache): {cold_time:.3f}s ({rowwise_time / cold_time:.1f}x)")
+    print(f"resolver (warm cache): {warm_time:.3f}s ({rowwise_time / warm_time:.1f}x)")
+    print(f"cache hit rate: {resolver.hit_rate:.2%}")
+    if not same.all():
+        rows, columns = np.nonzero(~same)
+        examples = [(lines[NAME_COLUMNS[c]].iloc[r], expected[NAME_COLUMNS[c]].iloc[r], cold[NAME_COLUMNS[c]].iloc[r])
+                    for r, c in zip(rows[:10], columns[:10])]
+        raise AssertionError(f"{(~same).sum()} names resolve differently from extractOne "
+                             f"(raw, extractOne, resolver): {examples}")
+    print("every name resolves as extractOne does")
+
+
+if __name__ == '__main__':
+    main()
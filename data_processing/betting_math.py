@@ -0,0 +1,59 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def kelly_criterion(probability, decimal_odds, kelly_fractions=(1.0,)) -> np.ndarray:
+    """
+    Vectorized version of utils.basic_kelly_criterion that sizes every line for every
+    kelly fraction in one pass. Like it, the sizes are not clipped: a line whose
+    probability times decimal_odds is below 1 gets a negative size
+
+    Args:
+        probability (array-like): the predicted probability of each line winning
+        decimal_odds (array-like): the decimal odds of each line
+        kelly_fractions (list): the fractions of the full kelly bet to size for
+
+    Returns:
+        np.ndarray: array of shape (n_lines, n_fractions) with the bet sizes as a
+        fraction of the bankroll
+    """
+    probability = np.asarray(probability, dtype=float)
+    b = np.asarray(decimal_odds, dtype=float) - 1
+    full_kelly = (b * probability - (1 - probability)) / b
+    return full_kelly[:, None] * np.asarray(kelly_fractions, dtype=float)[None, :]
+
+
+def expected_value(probability, decimal_odds) -> np.ndarray:
+    """
+    Expected profit of a one unit bet at decimal_odds given the predicted probability
+
+    Args:
+        probability (array-like): the predicted probability of each line winning
+        decimal_odds (array-like): the decimal odds of each line
+
+    Returns:
+        np.ndarray: the expected value of each line
+    """
+    probability = np.asarray(probability, dtype=float)
+    decimal_odds = np.asarray(decimal_odds, dtype=float)
+    return (probability * (decimal_odds - 1)) + ((1 - probability) * -1)
+
+
+def bet_ids(df: pd.DataFrame, columns) -> list:
+    """
+    Produces the same SHA-256 ids as LineFilter.generate_unique_hash for every row of df
+    at once, the key columns are joined with '-' column-wise before hashing
+
+    Args:
+        df (pd.DataFrame): the lines to generate ids for
+        columns (list): the key columns, in the order they are joined
+
+    Returns:
+        list: the hex digest of every row
+    """
+    if df.empty:
+        return []
+    parts = [df[column].map(str) for column in columns]
+    data_strings = parts[0].str.cat(parts[1:], sep='-')
+    return [hashlib.sha256(data_string.encode()).hexdigest() for data_string in data_strings]
@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pandas as pd
+
+from event_keys import shared_codes
+from fair_odds import EVENT_COLUMNS
+
+# how many of the best books are kept for every outcome
+LADDER_DEPTH = int(os.getenv("LADDER_DEPTH", 3))
+ARBITRAGE_COLUMNS = ['sport', 'home_team', 'away_team', 'start_time', 'outcome', 'sportsbook', 'decimal_odds',
+                     'update_time', 'inverse_sum', 'stake', 'profit']
+
+
+def book_ladder(lines: pd.DataFrame, depth=LADDER_DEPTH) -> pd.DataFrame:
+    """
+    Ranks the books of every outcome by price with a single sort of the whole board. Rank 0
+    is the best price, ties keep the order of the lines, so rank 0 is the line a groupby
+    idxmax picks
+
+    Args:
+        lines (pd.DataFrame): every line of every book, with the line_key of its outcome
+        depth (int): how many books to keep per outcome
+
+    Returns:
+        pd.DataFrame: the best depth lines of every outcome with their rank, grouped by
+        outcome and best first
+    """
+    if lines.empty:
+        return lines.assign(rank=pd.Series(dtype=np.int64))
+    keys = lines['line_key'].to_numpy(dtype=np.int64)
+    odds = lines['decimal_odds'].to_numpy(dtype=float)
+    order = np.lexsort((-odds, keys))
+    sorted_keys = keys[order]
+    group_start = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    starts = np.flatnonzero(group_start)
+    rank = np.arange(len(order)) - starts[np.cumsum(group_start) - 1]
+    keep = rank < depth
+    ladder = lines.iloc[order[keep]]
+    return ladder.assign(rank=rank[keep])
+
+
+def find_arbitrage(best_lines: pd.DataFrame) -> pd.DataFrame:
+    """
+    Finds the events where backing every outcome at its best price across books returns more
+    than the total stake, i.e. the inverse best prices sum to less than 1. Only events that
+    have as many outcomes as the sport's events do (3 with a draw, 2 without) are scanned,
+    an event missing an outcome always looks like an arbitrage
+
+    Args:
+        best_lines (pd.DataFrame): the best line of every outcome, e.g. rank 0 of the ladder
+
+    Returns:
+        pd.DataFrame: one row per leg of every arbitrage, with the inverse sum of the event,
+        the stake of the leg as a fraction of the total outlay that pays the same whichever
+        outcome wins, and the profit as a fraction of the total outlay
+    """
+    codes = shared_codes([best_lines], EVENT_COLUMNS, dropna=True)[0]
+    # an event with a missing key value can not be matched to its other outcomes
+    best_lines = best_lines[codes >= 0]
+    if best_lines.empty:
+        return pd.DataFrame(columns=ARBITRAGE_COLUMNS)
+    events = pd.factorize(codes[codes >= 0])[0]
+    n_events = events.max() + 1
+    inverse = 1 / best_lines['decimal_odds'].to_numpy(dtype=float)
+    inverse_sum = np.bincount(events, weights=inverse, minlength=n_events)
+    outcomes = np.bincount(events, minlength=n_events)
+    sport = pd.factorize(best_lines['sport'])[0]
+    event_sport = np.zeros(n_events, dtype=sport.dtype)
+    event_sport[events] = sport
+    sport_outcomes = np.zeros(sport.max() + 1, dtype=outcomes.dtype)
+    np.maximum.at(sport_outcomes, event_sport, outcomes)
+    arbitrage = (inverse_sum < 1) & (outcomes >= 2) & (outcomes == sport_outcomes[event_sport])
+    legs = arbitrage[events]
+    df = best_lines.loc[legs, ARBITRAGE_COLUMNS[:8]].copy()
+    df['inverse_sum'] = inverse_sum[events[legs]]
+    df['stake'] = inverse[legs] / df['inverse_sum']
+    df['profit'] = 1 / df['inverse_sum'] - 1
+    return df.sort_values(['profit', 'sport', 'home_team', 'away_team'], ascending=[False, True, True, True])
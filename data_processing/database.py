@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+import os
+import threading
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import QueuePool
+
+SQLALCHEMY_DATABASE_URI = 'sqlite:///../sports_betting.db'
+# how long a connection waits for another writer's lock before it fails with "database is locked"
+BUSY_TIMEOUT_MS = int(os.getenv("DATABASE_BUSY_TIMEOUT_MS", 30000))
+POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+# set on every new connection. WAL lets the web apps read while a pipeline writes and
+# synchronous=NORMAL is safe with WAL, a power loss can only lose the last commits
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': BUSY_TIMEOUT_MS,
+    'temp_store': 'MEMORY',
+    # negative is KiB, 64MB of page cache per connection
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+STAGING_SUFFIX = '_staging'
+# indexes behind the filtered queries in api/queries.py, the pipelines create them on the tables
+# they write and api/models.py declares them on the models
+LINE_INDEXES = [['sport', 'start_time'], ['sportsbook', 'start_time'], ['start_time'], ['expected_value'], ['kelly']]
+ALL_BETTING_LINES_INDEXES = [['sport', 'start_time'], ['sportsbook', 'start_time'], ['start_time']]
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(database_uri=SQLALCHEMY_DATABASE_URI):
+    """
+    Returns the engine of database_uri, one per process and uri so every module of a process
+    shares the same connection pool. SQLite connections get the PRAGMAS and the pysqlite
+    driver is kept from managing transactions itself: it does not begin one before DDL, which
+    would put a DROP TABLE outside of the transaction, so the engine emits BEGIN instead.
+    Transactions are deferred, writers that read before they write use write_transaction.
+    The engine lives as long as the process, scratch databases use new_engine
+
+    Args:
+        database_uri (str): the SQLAlchemy database uri
+
+    Returns:
+        sqlalchemy.Engine: the shared engine
+    """
+    with _engines_lock:
+        engine = _engines.get(database_uri)
+        if engine is None:
+            engine = new_engine(database_uri)
+            _engines[database_uri] = engine
+        return engine
+
+
+def new_engine(database_uri):
+    """
+    An engine set up like get_engine's that is not shared or kept, for databases that only
+    live as long as a run, e.g. a temporary directory. The caller disposes of it
+
+    Args:
+        database_uri (str): the SQLAlchemy database uri
+
+    Returns:
+        sqlalchemy.Engine: the new engine
+    """
+    if not database_uri.startswith('sqlite'):
+        return create_engine(database_uri, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_pre_ping=True)
+    engine = create_engine(database_uri, poolclass=QueuePool, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                           connect_args={'check_same_thread': False, 'timeout': BUSY_TIMEOUT_MS / 1000})
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma, value in PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        conn.exec_driver_sql(f"BEGIN {conn.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+
+    return engine
+
+
+@contextmanager
+def write_transaction(engine):
+    """
+    A transaction that takes the write lock when it begins, waiting up to BUSY_TIMEOUT_MS for
+    it. A deferred transaction that reads first and then writes fails at once if another
+    writer committed in between, SQLite can not wait that conflict out. Engines that were not
+    made by get_engine or new_engine get an ordinary engine.begin()
+
+    Yields:
+        sqlalchemy.Connection: the connection of the transaction
+    """
+    with engine.execution_options(sqlite_begin='IMMEDIATE').begin() as conn:
+        yield conn
+
+
+def replace_tables(engine, tables, indexes=None) -> None:
+    """
+    Replaces every table in tables with its DataFrame in one transaction. Each DataFrame is
+    written to a staging table, then the old table is dropped and the staging table renamed in
+    its place, so a reader sees either all the old tables or all the new ones and never a
+    missing or half-written table, the way to_sql(if_exists='replace') leaves them
+
+    Args:
+        engine (sqlalchemy.Engine): the database engine
+        tables (dict): table name -> DataFrame
+        indexes (dict): table name -> column lists to index the new table on
+    """
+    indexes = indexes or {}
+    with write_transaction(engine) as conn:
+        for table_name, df in tables.items():
+            staging_table = f"{table_name}{STAGING_SUFFIX}"
+            df.to_sql(staging_table, conn, if_exists='replace', index=False)
+            conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+            conn.execute(text(f"ALTER TABLE {staging_table} RENAME TO {table_name}"))
+            # index names are global, they can only be created once the old table is dropped
+            for columns in indexes.get(table_name, ()):
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table_name}_{'_'.join(columns)} "
+                                  f"ON {table_name} ({', '.join(columns)})"))
+
+
+def replace_table(engine, table_name, df: pd.DataFrame, indexes=()) -> None:
+    """
+    replace_tables for a single table
+    """
+    replace_tables(engine, {table_name: df}, {table_name: indexes})
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+# a line of a source before the team names are cleaned, one per event, outcome and sportsbook
+LINE_KEY_COLUMNS = ['sport', 'home_team', 'away_team', 'start_time', 'outcome']
+# the combined code of the key columns is compacted before it can overflow int64
+MAX_COMBINED_CODE = 2 ** 31
+
+
+def line_keys(df: pd.DataFrame, columns=LINE_KEY_COLUMNS) -> np.ndarray:
+    """
+    A stable int64 key for every row, the same for the same values in every process and
+    every cycle, so the extractors can store it with the lines when they are ingested and
+    LineFilter groups on it instead of on the string columns. It is a 64 bit hash of the
+    values, with a few tens of thousands of lines a day a collision is not a concern
+
+    Args:
+        df (pd.DataFrame): the lines
+        columns (list): the key columns
+
+    Returns:
+        np.ndarray: the int64 key of every row of df
+    """
+    if df.empty:
+        return np.empty(0, dtype=np.int64)
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy().view(np.int64)
+
+
+def shared_codes(frames, columns, dropna=False) -> list:
+    """
+    Codes the key columns of several tables together, rows with the same key values get the
+    same int64 code whichever table they are in, so the tables can be grouped and joined on a
+    single integer column. Every string is hashed once per column instead of once per
+    column and operation. Missing values are a value like any other, NaN matches NaN the way
+    it does in a pandas merge
+
+    Args:
+        frames (list): the DataFrames to code
+        columns (list): the key columns, present in every frame
+        dropna (bool): give rows with a missing key value the code -1 instead, like a
+            groupby on the columns leaves them out
+
+    Returns:
+        list: the int64 codes of every frame, in order
+    """
+    lengths = [len(df) for df in frames]
+    combined = np.zeros(sum(lengths), dtype=np.int64)
+    missing = np.zeros(len(combined), dtype=bool)
+    for column in columns:
+        values = np.concatenate([df[column].to_numpy() for df in frames])
+        codes, uniques = pd.factorize(values)
+        missing |= codes < 0
+        # missing values get the code 0
+        combined = combined * (len(uniques) + 1) + codes + 1
+        if len(combined) and combined.max() > MAX_COMBINED_CODE:
+            combined = pd.factorize(combined)[0].astype(np.int64)
+    if dropna:
+        combined[missing] = -1
+    return np.split(combined, np.cumsum(lengths)[:-1])
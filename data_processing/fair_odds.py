@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import pandas as pd
+
+# raw keeps the bookmaker margin in (1 / odds), the way LineFilter always worked
+FAIR_ODDS_METHOD = os.getenv("FAIR_ODDS_METHOD", "raw")
+EVENT_COLUMNS = ['sport', 'home_team', 'away_team', 'start_time']
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-12
+
+
+def _group_sum(codes, values, n_groups) -> np.ndarray:
+    return np.bincount(codes, weights=values, minlength=n_groups)
+
+
+def raw(implied, codes, n_groups) -> np.ndarray:
+    return implied
+
+
+def multiplicative(implied, codes, n_groups) -> np.ndarray:
+    """
+    Scales every outcome down by the same factor, p = q / sum(q)
+    """
+    return implied / _group_sum(codes, implied, n_groups)[codes]
+
+
+def additive(implied, codes, n_groups) -> np.ndarray:
+    """
+    Takes the same amount off every outcome, p = q - (sum(q) - 1) / n. Long shots can come
+    out at or below 0, those are clipped to 0
+    """
+    margin = _group_sum(codes, implied, n_groups) - 1
+    outcomes = np.bincount(codes, minlength=n_groups)
+    return np.clip(implied - (margin / outcomes)[codes], 0, None)
+
+
+def power(implied, codes, n_groups) -> np.ndarray:
+    """
+    Raises every outcome to the same power k, p = q ** k with k solving sum(q ** k) = 1.
+    Newton's method runs on every event at once
+    """
+    k = np.ones(n_groups)
+    log_implied = np.log(implied)
+    for _ in range(MAX_ITERATIONS):
+        powered = implied ** k[codes]
+        f = _group_sum(codes, powered, n_groups) - 1
+        df = _group_sum(codes, powered * log_implied, n_groups)
+        step = np.divide(f, df, out=np.zeros(n_groups), where=df != 0)
+        k = np.maximum(k - step, 1e-6)
+        if np.nanmax(np.abs(step)) < TOLERANCE:
+            break
+    return implied ** k[codes]
+
+
+def shin(implied, codes, n_groups) -> np.ndarray:
+    """
+    Shin's model, which puts more of the margin on long shots to account for insider
+    trading. The insider share z of every event is found by bisection on all events at once,
+    p = (sqrt(z^2 + 4 (1 - z) q^2 / sum(q)) - z) / (2 (1 - z)) with z solving sum(p) = 1.
+    Events without a margin get z = 0
+    """
+    booksum = _group_sum(codes, implied, n_groups)
+
+    def probabilities(z):
+        z = z[codes]
+        return (np.sqrt(z ** 2 + 4 * (1 - z) * implied ** 2 / booksum[codes]) - z) / (2 * (1 - z))
+
+    # sum(p) falls from sqrt(sum(q)) at z = 0 as z grows
+    low, high = np.zeros(n_groups), np.full(n_groups, 0.999)
+    for _ in range(MAX_ITERATIONS):
+        z = (low + high) / 2
+        too_big = _group_sum(codes, probabilities(z), n_groups) > 1
+        low = np.where(too_big, z, low)
+        high = np.where(too_big, high, z)
+        if (high - low).max() < TOLERANCE:
+            break
+    z = np.where(booksum > 1, (low + high) / 2, 0)
+    return probabilities(z)
+
+
+METHODS = {
+    'raw': raw,
+    'multiplicative': multiplicative,
+    'additive': additive,
+    'power': power,
+    'shin': shin,
+}
+
+
+def fair_probabilities(df: pd.DataFrame, method=FAIR_ODDS_METHOD, odds_column='decimal_odds',
+                       event_columns=EVENT_COLUMNS) -> np.ndarray:
+    """
+    Removes the bookmaker margin from the odds of every outcome of every event in df at
+    once. The outcomes of an event are the rows sharing event_columns, so 2-way and 3-way
+    (with a Draw row) markets are handled alike. Events with a single outcome can not be
+    normalized and keep their raw implied probability
+
+    Args:
+        df (pd.DataFrame): one row per outcome, e.g. the avg_odds table
+        method (str): one of METHODS
+        odds_column (str): the decimal odds column
+        event_columns (list): the columns identifying an event
+
+    Returns:
+        np.ndarray: the fair probability of every row of df, in order
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown fair odds method {method}, use one of {list(METHODS)}")
+    implied = 1 / df[odds_column].to_numpy(dtype=float)
+    if df.empty or method == 'raw':
+        return implied
+    codes = df.groupby(event_columns, sort=False, dropna=False).ngroup().to_numpy()
+    n_groups = codes.max() + 1
+    fair = METHODS[method](implied, codes, n_groups)
+    single = np.bincount(codes, minlength=n_groups)[codes] < 2
+    return np.where(single, implied, fair)
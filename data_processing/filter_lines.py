@@ -4,22 +4,37 @@ import pickle
 import time
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
 import os
 from dotenv import load_dotenv
 from fuzzywuzzy import fuzz 
 from fuzzywuzzy import process
+from sqlalchemy import text
 from DiscordAlerts import DiscordAlert
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import logging
 
-from utils import basic_kelly_criterion
+from alert_dispatcher import DiscordDispatcher
+from betting_math import bet_ids, expected_value, kelly_criterion
+from book_ladder import book_ladder, find_arbitrage
+from database import LINE_INDEXES, get_engine, replace_tables, write_transaction
+from event_keys import LINE_KEY_COLUMNS, line_keys, shared_codes
+from fair_odds import FAIR_ODDS_METHOD, fair_probabilities
+from metrics import MetricsRecorder
+from pipeline_events import ChangeNotifier
+from recommendation_archive import RecommendationArchive
+from sheets_sync import SheetsSync
+from team_resolver import TeamNameResolver
 
 load_dotenv()
 SQLALCHEMY_DATABASE_URI = 'sqlite:///../sports_betting.db'
 WEBSITE_URL = ''
 TIME_SLEEP_MINUTES = 1
+# how often the change counter is checked for new loads from the odds sources
+CHANGE_POLL_SECONDS = 1
+SOURCE_TABLES = ['all_betting_lines', 'avg_odds']
+# the new bets of every cycle, read by the web app's live stream
+NOTIFY_TABLE = 'bets_to_notify'
+# how many cycles of new bets bets_to_notify keeps for streams that fell behind
+NOTIFY_KEEP_VERSIONS = int(os.getenv("NOTIFY_KEEP_VERSIONS", 1000))
 ALPHA = os.getenv("ALPHA")
 
 BOOKMAKERS = {
@@ -46,45 +61,67 @@ BOOKMAKERS = {
     "Wind Creek (Betfred PA)": {"bookmaker_key": "windcreek", "can_bet": False},
 }
 
+# the steps of transform, in order
+TRANSFORM_STAGES = ['filter_bookmakers', 'compute_best_lines', 'scan_arbitrage', 'clean_team_names', 'merge_tables',
+                    'necessary_calculations', 'find_plus_ev_bets', 'get_bets_to_notify']
+# column name -> fraction of the full kelly bet
+KELLY_FRACTIONS = {"kelly": 1.0, "half_kelly": 0.5}
+BET_ID_COLUMNS = ['home_team', 'away_team', 'outcome', 'start_time']
+# the columns both sources are matched on in merge_tables, after clean_team_names
+OUTCOME_KEY_COLUMNS = ['sport', 'home_team', 'away_team', 'outcome']
+
 
 class LineFilter(object):
-    def __init__(self):
+    def __init__(self, engine=None, alpha=None, clock=None, fair_odds_method=FAIR_ODDS_METHOD):
         """
         This is the object that performs the ETL process of merging the two tables
         all_betting_lines and avg_odds into a single table and filtering the lines
         for those that are beyond the necessary threshold form the mean odds. 
         writes those lines to the database in the table plus_ev_bets
+
+        Args:
+            engine (sqlalchemy.Engine): the database to work on, the production database by default
+            alpha (float): the edge required over the average implied probability, ALPHA by default
+            clock (callable): returns the current time as a naive datetime, datetime.now by default.
+                The replay passes a simulated clock
+            fair_odds_method (str): how the margin is taken out of the average odds, see fair_odds.METHODS
         """ 
         self.svc_name = "line_filter"
         self.logger = None
         self.init_logger()
-        self.engine = create_engine(SQLALCHEMY_DATABASE_URI)
+        self.engine = engine if engine is not None else get_engine(SQLALCHEMY_DATABASE_URI)
+        self.notifier = ChangeNotifier(self.engine)
+        self.metrics = MetricsRecorder(self.engine, self.svc_name, logger=self.logger)
         self.svc_name = "line_filter"
-        self._alpha = float(ALPHA)
+        self._alpha = float(ALPHA if alpha is None else alpha)
+        self.clock = clock or datetime.now
+        self.fair_odds_method = fair_odds_method
         # self.model = pickle.load(open('model.pkl', 'rb'))
         self.discord = DiscordAlert()
+        self.alerts = DiscordDispatcher(fallback=self.discord, logger=self.logger)
+        self.sheets = SheetsSync(self.engine, logger=self.logger)
+        self.archive = RecommendationArchive(self.engine, logger=self.logger)
         self.team_names = pd.DataFrame()
+        self.team_resolver = TeamNameResolver(logger=self.logger)
         self.average_odds = pd.DataFrame()
         self.all_betting_lines = pd.DataFrame()
         self.merged_df = pd.DataFrame()
         self.best_lines = pd.DataFrame()
+        self.book_ladder = pd.DataFrame()
+        self.arbitrage_bets = pd.DataFrame()
         self.merged_df = pd.DataFrame()
         self.plus_ev_bets = pd.DataFrame()
-        self.reccommended_bets_archive = pd.DataFrame()
         self.bets_to_reccommend = pd.DataFrame()
         
     def extract(self):
         """
         Extracts data for all_betting_lines and avg_odds tables from the databasedata   
-        stores them in the all_betting_lines and avg_odds attributes
+        stores them in the all_betting_lines and avg_odds attributes. Both tables only hold the
+        latest snapshot of each source, the line history lives in the *_history tables
         """
         self.all_betting_lines = pd.read_sql_query("SELECT * from all_betting_lines", self.engine)
         self.average_odds = pd.read_sql_query('SELECT * FROM avg_odds', self.engine)
         self.team_names = pd.read_sql('SELECT * FROM team_names', self.engine)
-        try:
-            self.reccommended_bets_archive = pd.read_sql('SELECT * FROM reccommended_bets_archive', self.engine)
-        except:
-            self.reccommended_bets_archive = pd.DataFrame()
 
     def transform(self):
         """
@@ -94,37 +131,75 @@ class LineFilter(object):
         lines to the database in the table plus_ev_bets. Also assigns an ID to each plus_ev line to 
         track the bets and only alert me on new bets that hit
         """
-        self.filter_bookmakers()
-        self.compute_best_lines()
-        self.merge_tables()
-        self.necessary_calculations()
-        self.find_plus_ev_bets()
-        self.get_bets_to_notify()
-        self.merge_with_reccommended_bets_archive()
+        for stage in TRANSFORM_STAGES:
+            with self.metrics.timer('line_filter_stage_seconds', stage=stage):
+                getattr(self, stage)()
         
     def load(self):
         """
-        Writes the plus_ev_bets table to the database
+        Writes the plus_ev_bets table to the database, the bets that are new this cycle go to
+        the recommendation archive and bets_to_notify. book_ladder gets the ladders of
+        the plus_ev_bets lines, they join on line_key, and arbitrage_bets every arbitrage. The
+        tables are swapped in together so the web apps never read a mix of two cycles
+        """
+        # the other books of the flagged lines, in case the best one limits the bet
+        if self.plus_ev_bets.empty:
+            ladder = self.book_ladder.iloc[:0]
+        else:
+            ladder = self.book_ladder[self.book_ladder['line_key'].isin(self.plus_ev_bets['line_key'])]
+        tables = {
+            'best_lines_model_probabilities': self.merged_df,
+            'plus_ev_bets': self.plus_ev_bets,
+            'book_ladder': ladder,
+            'arbitrage_bets': self.arbitrage_bets,
+        }
+        # the indexes behind the api queries
+        replace_tables(self.engine, tables, {'best_lines_model_probabilities': LINE_INDEXES, 'plus_ev_bets': LINE_INDEXES})
+        self.archive.append(self.bets_to_reccommend)
+        for table_name in tables:
+            self.notifier.bump(table_name)
+        self.append_bets_to_notify()
+
+    def append_bets_to_notify(self) -> None:
+        """
+        Appends the bets that are new this cycle to bets_to_notify tagged with the version they
+        bump the table to, in the same transaction, so the live stream reads every row above
+        the last version it saw and gets the bets of every cycle that ran since, never those of
+        an older one. Cycles without new bets leave the table and its version alone
         """
-        self.merged_df.to_sql('best_lines_model_probabilities', self.engine, if_exists='replace', index=False)
-        self.plus_ev_bets.to_sql('plus_ev_bets', self.engine, if_exists='replace', index=False)
-        self.reccommended_bets_archive.to_sql('reccommended_bets_archive', self.engine, if_exists='replace', index=False)
+        if self.bets_to_reccommend.empty:
+            return
+        with write_transaction(self.engine) as conn:
+            columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({NOTIFY_TABLE})"))]
+            if columns and 'version' not in columns:
+                # the table load used to replace every cycle
+                conn.execute(text(f"DROP TABLE {NOTIFY_TABLE}"))
+            version = self.notifier.bump(NOTIFY_TABLE, conn)
+            self.bets_to_reccommend.assign(version=version).to_sql(NOTIFY_TABLE, conn, if_exists='append', index=False)
+            conn.execute(text(f"DELETE FROM {NOTIFY_TABLE} WHERE version <= :oldest"),
+                         {'oldest': version - NOTIFY_KEEP_VERSIONS})
         
     def merge_tables(self) -> None:
         """
         mergest the two tables best_lines and avg_odds into a single table. Currently this is done using an exact only approach but eventually this will be done
-        using fuzzy_wuzzy to determine the best matches for each line
+        using fuzzy_wuzzy to determine the best matches for each line. Expects the team names
+        to have gone through clean_team_names
         """
-        self.clean_team_names()
         best_lines = self.best_lines.copy()
-        best_lines = best_lines[['sport', 'home_team', 'away_team','start_time', 'sportsbook', 'outcome', 'decimal_odds', 'update_time']]
+        best_lines = best_lines[['sport', 'home_team', 'away_team','start_time', 'sportsbook', 'outcome', 'decimal_odds', 'update_time', 'line_key']]
         best_lines = best_lines.rename(columns={'update_time': 'best_odds_update_time'})
         avg_odds = self.average_odds.copy()
         avg_odds = avg_odds[['sport', 'home_team', 'away_team','start_time', 'outcome', 'decimal_odds', 'update_time']]
+        # every outcome of the event is still here, after the merge some may be missing
+        avg_odds['fair_probability'] = fair_probabilities(avg_odds, self.fair_odds_method)
         avg_odds = avg_odds.rename(columns={'update_time': 'avg_odds_update_time', 'decimal_odds': 'avg_odds'})
-        df = pd.merge(best_lines, avg_odds, on=['sport', 'home_team', 'away_team', 'outcome'], how='inner', suffixes=('', '_y'))
+        # join on one int64 outcome key coded across both tables instead of the four string
+        # columns, the rest of the key columns come from best_lines
+        best_lines['outcome_key'], avg_odds['outcome_key'] = shared_codes([best_lines, avg_odds], OUTCOME_KEY_COLUMNS)
+        avg_odds = avg_odds[['outcome_key', 'avg_odds', 'fair_probability', 'avg_odds_update_time']]
+        df = pd.merge(best_lines, avg_odds, on='outcome_key', how='inner')
         df = df[['sport', 'start_time', 'home_team', 'away_team', 'outcome','sportsbook', 
-                 'decimal_odds', 'avg_odds', 'best_odds_update_time', 'avg_odds_update_time']]
+                 'decimal_odds', 'avg_odds', 'fair_probability', 'best_odds_update_time', 'avg_odds_update_time', 'line_key']]
         df['start_time'] = pd.to_datetime(df['start_time'])
         # Get current time in US/Central timezone
         # now = datetime.now(timezone('US/Central'))
@@ -132,46 +207,94 @@ class LineFilter(object):
         # # Convert 'now' to Pandas Timestamp object
         # now_timestamp = pd.Timestamp(now)
 
-        df = df[df['start_time'] > datetime.now()]
+        df = df[df['start_time'] > self.clock()]
         self.merged_df = df
       
     def compute_best_lines(self) -> None:
         """
-        Selects only the best line for each outcome across all sportsbooks
-        """
-        # select the best line for each outcome using group by
-        idx_max = self.all_betting_lines.groupby(['sport', 'home_team', 'away_team', 'start_time', 'outcome'])['decimal_odds'].idxmax()
-        self.best_lines =  self.all_betting_lines.iloc[idx_max].sort_values('start_time')
+        Ranks the books of every outcome into a ladder of the LADDER_DEPTH best prices and
+        selects the best line for each outcome across all sportsbooks from it
+        """
+        # the odds api extractor stores an integer key with every line, older snapshots
+        # without one get it here
+        if 'line_key' not in self.all_betting_lines or self.all_betting_lines['line_key'].isna().any():
+            self.all_betting_lines = self.all_betting_lines.assign(line_key=line_keys(self.all_betting_lines))
+        # lines with a missing key value are left out, as a groupby on the columns would, the
+        # hashed line_key would otherwise rank them like any other outcome
+        complete = self.all_betting_lines[LINE_KEY_COLUMNS].notna().all(axis=1)
+        self.book_ladder = book_ladder(self.all_betting_lines[complete])
+        best = self.book_ladder[self.book_ladder['rank'] == 0].drop(columns=['rank'])
+        self.best_lines = best.sort_values('start_time')
         self.logger.debug(f"Best lines shape: {self.best_lines.shape}")
+
+    def scan_arbitrage(self) -> None:
+        """
+        Finds the events that can be backed on every outcome at the best prices for a
+        guaranteed profit. Only the h2h market is pulled so there are no middles to look for
+        """
+        self.arbitrage_bets = find_arbitrage(self.best_lines)
+        if not self.arbitrage_bets.empty:
+            self.logger.info(f"Found {len(self.arbitrage_bets)} arbitrage legs, best profit {self.arbitrage_bets['profit'].max():.2%}")
         
     def necessary_calculations(self):
         """
-        Uses model to calculate the predicted probability of each line and then calculates the kelly criterion for each line
+        Uses model to calculate the predicted probability of each line and then calculates the kelly criterion for each line.
+        The predicted probability is the fair probability of the average odds (see fair_odds) minus alpha
         """
         self.merged_df['mean_implied_probability'] = 1 / self.merged_df['avg_odds']
         self.merged_df['best_implied_probability'] = 1 / self.merged_df['decimal_odds']
-        self.merged_df['predicted_probability'] = self.merged_df['mean_implied_probability'] - self._alpha
-        self.merged_df['thresh'] = 1 / (self.merged_df['mean_implied_probability'] - self._alpha)
-        self.merged_df['expected_value'] = (self.merged_df['predicted_probability'] * (self.merged_df['decimal_odds'] - 1)) + ((1 - self.merged_df['predicted_probability']) * -1)
-        self.merged_df['kelly'] = self.merged_df.apply(lambda x: basic_kelly_criterion(x['predicted_probability'], x['decimal_odds']), axis=1)
-        self.merged_df['half_kelly'] = self.merged_df.apply(lambda x: basic_kelly_criterion(x['predicted_probability'], x['decimal_odds'], kelly_size=0.5), axis=1)
+        self.merged_df['predicted_probability'] = self.merged_df['fair_probability'] - self._alpha
+        self.merged_df['thresh'] = 1 / (self.merged_df['fair_probability'] - self._alpha)
+        self.merged_df['expected_value'] = expected_value(self.merged_df['predicted_probability'], self.merged_df['decimal_odds'])
+        kelly_sizes = kelly_criterion(self.merged_df['predicted_probability'], self.merged_df['decimal_odds'], list(KELLY_FRACTIONS.values()))
+        for i, column in enumerate(KELLY_FRACTIONS):
+            self.merged_df[column] = kelly_sizes[:, i]
         
     def find_plus_ev_bets(self) -> None:
         """
         Filters the merged_df for lines that are beyond the necessary threshold from the mean odds
-        and calculates the kelly criterion for each line
+        and assigns each of them its id
         """
-        self.plus_ev_bets = self.merged_df[self.merged_df['decimal_odds'] > self.merged_df['thresh']]
-        self.plus_ev_bets['id'] = self.plus_ev_bets.apply(lambda x: self.generate_unique_hash(x['home_team'], x['away_team'], x['outcome'], x['start_time']), axis=1)
+        self.plus_ev_bets = self.merged_df[self.merged_df['decimal_odds'] > self.merged_df['thresh']].copy()
+        self.plus_ev_bets['id'] = bet_ids(self.plus_ev_bets, BET_ID_COLUMNS)
         
     def run_etl(self):
         """
         Runs the ETL process
         """
-        self.extract()
-        self.transform()
-        self.load()
-        self.notify()
+        with self.metrics.timer('line_filter_cycle_seconds'):
+            with self.metrics.timer('line_filter_stage_seconds', stage='extract'):
+                self.extract()
+            self.transform()
+            with self.metrics.timer('line_filter_stage_seconds', stage='load'):
+                self.load()
+            with self.metrics.timer('line_filter_stage_seconds', stage='notify'):
+                self.notify()
+        self.record_metrics()
+
+    def record_metrics(self):
+        """
+        Records the row counts, caches and queues of this cycle, and how old the odds behind
+        the newly flagged bets were when they got flagged
+        """
+        tables = {'all_betting_lines': self.all_betting_lines, 'avg_odds': self.average_odds, 'best_lines': self.best_lines,
+                  'merged': self.merged_df, 'plus_ev_bets': self.plus_ev_bets, 'bets_to_reccommend': self.bets_to_reccommend,
+                  'book_ladder': self.book_ladder, 'arbitrage_bets': self.arbitrage_bets}
+        for table, df in tables.items():
+            self.metrics.set('line_filter_rows', len(df), table=table)
+        self.metrics.set('team_resolver_hit_rate', self.team_resolver.hit_rate)
+        self.metrics.set('team_resolver_cache_hits', self.team_resolver.hits)
+        self.metrics.set('team_resolver_cache_misses', self.team_resolver.misses)
+        self.metrics.set('alert_queue_depth', self.alerts.depth)
+        self.metrics.set('alert_messages_sent', self.alerts.sent_messages)
+        self.metrics.set('alert_dropped', self.alerts.dropped_alerts)
+        self.metrics.set('sheets_pending_rows', self.sheets.pending)
+        if not self.bets_to_reccommend.empty:
+            now = pd.Timestamp(self.clock())
+            for source, column in [('sportsbook', 'best_odds_update_time'), ('avg_odds', 'avg_odds_update_time')]:
+                age = (now - pd.to_datetime(self.bets_to_reccommend[column])).dt.total_seconds()
+                self.metrics.set('line_filter_flagged_odds_age_seconds', age.max(), source=source)
+        self.metrics.flush()
         
     def filter_bookmakers(self):
         """
@@ -186,31 +309,41 @@ class LineFilter(object):
 
     def run(self):
         """
-        Runs the full ETL process every 5 minutes
+        Runs the ETL process as soon as either odds source finishes a load, cycles where
+        neither source wrote anything new are skipped
         """
         end_time = datetime.now().replace(hour=21, minute=30, second=0, microsecond=0)
+        self.archive.compact(now=self.clock())
+        self.sheets.compact(now=self.clock())
+        last_versions = {}
         while datetime.now() < end_time:
+            versions = self.notifier.wait_for_change(SOURCE_TABLES, last_versions, timeout=TIME_SLEEP_MINUTES * 60,
+                                                     poll_seconds=CHANGE_POLL_SECONDS)
+            if versions == last_versions:
+                continue
+            last_versions = versions
             self.run_etl()
             if self.all_betting_lines.empty:
                 self.logger.debug("No more games today, shutting down")
                 break
-            time.sleep(TIME_SLEEP_MINUTES * 60)
+        # let the background senders finish before the process exits
+        self.close()
       
     def clean_team_names(self):
         """
-        Uses fuzzywuzzy to clean the team names in the avg_odds table, 
-        extracts the set of teams for each sport and then uses fuzzywuzzy process to match the team names
+        Cleans the team names in the best_lines and avg_odds tables. The resolver indexes the
+        set of teams for each sport once per cycle and only fuzzy matches names it has not
+        seen before, everything else comes out of its cache
         """
-        self.best_lines['home_team'] = self.best_lines.apply(lambda x: self.lambda_fuzzy_wuzzy(x['home_team'], x['sport']), axis=1)
-        self.best_lines['away_team'] = self.best_lines.apply(lambda x: self.lambda_fuzzy_wuzzy(x['away_team'], x['sport']), axis=1)
-        self.best_lines['outcome'] = self.best_lines.apply(lambda x: self.lambda_fuzzy_wuzzy(x['outcome'], x['sport']), axis=1)
-        self.average_odds['home_team'] = self.average_odds.apply(lambda x: self.lambda_fuzzy_wuzzy(x['home_team'], x['sport']), axis=1)
-        self.average_odds['away_team'] = self.average_odds.apply(lambda x: self.lambda_fuzzy_wuzzy(x['away_team'], x['sport']), axis=1) 
-        self.average_odds['outcome'] = self.average_odds.apply(lambda x: self.lambda_fuzzy_wuzzy(x['outcome'], x['sport']), axis=1)
+        self.team_resolver.refresh(self.team_names)
+        self.best_lines = self.team_resolver.resolve_columns(self.best_lines, ['home_team', 'away_team', 'outcome'])
+        self.average_odds = self.team_resolver.resolve_columns(self.average_odds, ['home_team', 'away_team', 'outcome'])
+        self.logger.debug(f"Team name cache hit rate: {self.team_resolver.hit_rate:.2%}")
         
     def lambda_fuzzy_wuzzy(self, team_name, sport) -> str:
         """
-        Helper function for fuzzywuzzy to match team names
+        Helper function for fuzzywuzzy to match team names one row at a time. No longer used
+        by clean_team_names, kept as the reference the resolver benchmark compares against
         """
         teams = self.team_names[self.team_names['sport'] == sport]['team_name'].to_list()
         
@@ -229,7 +362,8 @@ class LineFilter(object):
     def generate_unique_hash(self, home_team, away_team, outcome, start_datetime):
         """
         Generates a unique hash for each line based on the team names, outcome, and start time
-        in order to avoid duplicate lines in the database
+        in order to avoid duplicate lines in the database. find_plus_ev_bets uses the bulk
+        betting_math.bet_ids, which must keep producing the same hashes as this
         
         Args:
             home_team (str): the home team name
@@ -247,30 +381,21 @@ class LineFilter(object):
         hashed_data = hashlib.sha256(data_string.encode()).hexdigest()
         return hashed_data
 
-    def merge_with_reccommended_bets_archive(self):
-        """
-        Merges the plus_ev_bets table with the reccommended_bets_archive table to filter out the bets that have already been reccommended
-        """
-        self.reccommended_bets_archive = pd.concat([self.reccommended_bets_archive, self.bets_to_reccommend])
-        self.reccommended_bets_archive = self.reccommended_bets_archive.drop_duplicates(subset=['id']) # should be redundant
-
     def get_bets_to_notify(self):
         """
         Filters the plus_ev_bets table for the bets that have not already been reccommended
         """
-        if self.reccommended_bets_archive.empty:
-            self.bets_to_reccommend = self.plus_ev_bets
-        else:
-            self.bets_to_reccommend = self.plus_ev_bets[~self.plus_ev_bets['id'].isin(self.reccommended_bets_archive['id'])]
+        self.bets_to_reccommend = self.archive.new_bets(self.plus_ev_bets)
         
     def send_alerts(self):
         """
-        Sends alerts for the bets that have not already been reccommended
+        Queues alerts for the bets that have not already been reccommended, the dispatcher
+        sends them in the background
         """
         for index, row in self.bets_to_reccommend.iterrows():
             msg = f"{row['home_team']} vs {row['away_team']} {row['outcome']} at {row['sportsbook']} has a {round(row['expected_value'], 2)} EV. \n "
             msg += f"Bet on {row['outcome']} with {row['sportsbook']} at {row['decimal_odds']} odds. And bet on nothing lower than {row['thresh']}\n"
-            self.discord.send_msg(msg)
+            self.alerts.submit(msg)
             
     def create_and_send_notification(self) -> None:
         """
@@ -303,28 +428,10 @@ class LineFilter(object):
     
     def post_archive_to_sheets(self):
         """
-        Posts the desired columns of the archive to google sheets
+        Queues this cycle's new recommendations for Google Sheets, the sync appends them
+        on its own schedule
         """
-        json_perms = "sportsbook-scraping-363802-5ed6e9e4d35c.json" 
-
-        # Define the scope and credentials
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_name(json_perms, scope)
-
-        # Authorize the client
-        client = gspread.authorize(creds)
-
-        # Open the Google Sheet by its title
-        sheet = client.open('Sports Betting Log').sheet1  # Replace 'Your Google Sheet Title' with your sheet's title
-        
-        desired_columns = ['sport', 'start_time', 'home_team', 'away_team', 'outcome','sportsbook', 
-                 'decimal_odds', 'avg_odds', "thresh", "kelly", "half_kelly", "expected_value"]
-        df = self.reccommended_bets_archive[desired_columns]
-        if df.empty:
-            return
-
-        sheet.update(df.values.tolist(), 'A2')
-        self.logger.debug(f"Posted Reccommended bets archive to Google Sheets")
+        self.sheets.enqueue(self.bets_to_reccommend)
         
     def notify(self):
         """
@@ -335,8 +442,20 @@ class LineFilter(object):
             self.post_archive_to_sheets()
         except Exception as e:
             self.logger.error(f"Error sending alerts: {e}")
-            self.discord.send_msg(f"Error sending alerts: {e}")
+            self.alerts.submit(f"Error sending alerts: {e}")
         
+    def close(self) -> None:
+        """
+        Stops the background alert and Google Sheets threads once they sent what is queued and
+        detaches the log handlers this LineFilter added, for processes that build more than
+        one, like the replay workers
+        """
+        self.alerts.stop(timeout=60)
+        self.sheets.stop()
+        for handler in self._log_handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
+
     def init_logger(self, log_lvl=logging.DEBUG, verbose=True) -> None:
         logger = logging.getLogger("line_filter")
         logger.setLevel(log_lvl)
@@ -356,6 +475,7 @@ class LineFilter(object):
         file_handler = logging.FileHandler(log_file_path)
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
+        self._log_handlers = [console_handler, file_handler]
         self.logger = logger
     
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import threading
+import time
+from sqlalchemy import text
+
+METRICS_TABLE = 'pipeline_metrics'
+VERSIONS_TABLE = 'pipeline_versions'
+
+
+class MetricsRecorder(object):
+    def __init__(self, engine, service, logger=None):
+        """
+        Collects the metrics of one service in memory and writes them to the pipeline_metrics
+        table on flush, where the web app picks them up for /metrics (see render_metrics).
+        Like the change counter, the database is what the services share, so nothing has to
+        listen on a port in the scrapers
+
+            gauges: the last value set, e.g. rows loaded or queue depth
+            counters: running totals, e.g. failed requests
+            summaries: the count and sum of observed durations, plus a <name>_last gauge with
+                the last observation so a single cycle can be read straight off
+
+        Args:
+            engine (sqlalchemy.Engine): the database engine
+            service (str): the service the metrics belong to, e.g. line_filter
+        """
+        self.engine = engine
+        self.service = service
+        self.logger = logger or logging.getLogger("metrics")
+        self._values = {}
+        self._lock = threading.Lock()
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (service TEXT NOT NULL, name TEXT NOT NULL, "
+                "labels TEXT NOT NULL, kind TEXT NOT NULL, value REAL, updated_at REAL, "
+                "PRIMARY KEY (service, name, labels))"
+            ))
+
+    def set(self, name, value, **labels) -> None:
+        self._record(name, 'gauge', labels, lambda _: float(value))
+
+    def inc(self, name, amount=1, **labels) -> None:
+        self._record(name, 'counter', labels, lambda current: (current or 0.0) + amount)
+
+    def observe(self, name, seconds, **labels) -> None:
+        self._record(f"{name}_count", 'summary', labels, lambda current: (current or 0.0) + 1)
+        self._record(f"{name}_sum", 'summary', labels, lambda current: (current or 0.0) + seconds)
+        self._record(f"{name}_last", 'gauge', labels, lambda _: seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes how long the block takes, also when it raises
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def flush(self) -> None:
+        """
+        Writes the current values to the metrics table. A failure is logged and never raised,
+        metrics must not break a cycle
+        """
+        now = time.time()
+        with self._lock:
+            rows = [{'service': self.service, 'name': name, 'labels': labels, 'kind': kind, 'value': value, 'now': now}
+                    for (name, labels), (kind, value) in self._values.items()]
+        if not rows:
+            return
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    f"INSERT INTO {METRICS_TABLE} (service, name, labels, kind, value, updated_at) "
+                    "VALUES (:service, :name, :labels, :kind, :value, :now) "
+                    "ON CONFLICT (service, name, labels) DO UPDATE SET "
+                    "kind = excluded.kind, value = excluded.value, updated_at = excluded.updated_at"
+                ), rows)
+        except Exception as e:
+            self.logger.error(f"Failed to write metrics: {e}")
+
+    def _record(self, name, kind, labels, update) -> None:
+        key = (name, json.dumps({k: str(v) for k, v in labels.items()}, sort_keys=True))
+        with self._lock:
+            current = self._values.get(key, (kind, None))[1]
+            self._values[key] = (kind, update(current))
+
+
+def _format_labels(labels) -> str:
+    escaped = {k: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for k, v in labels.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+
+def render_metrics(engine) -> str:
+    """
+    Renders every service's metrics in the Prometheus text format, along with how long ago
+    each table in the change counter was last written (pipeline_table_age_seconds), which is
+    how stale the data the next bet gets flagged on can be
+
+    Args:
+        engine (sqlalchemy.Engine): the database engine
+
+    Returns:
+        str: the exposition text
+    """
+    families = {}
+    with engine.connect() as conn:
+        tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        if METRICS_TABLE in tables:
+            rows = conn.execute(text(f"SELECT service, name, labels, kind, value, updated_at FROM {METRICS_TABLE} "
+                                     "ORDER BY name, service, labels")).fetchall()
+        else:
+            rows = []
+        versions = conn.execute(text(f"SELECT table_name, version, updated_at FROM {VERSIONS_TABLE}")).fetchall() \
+            if VERSIONS_TABLE in tables else []
+
+    last_report = {}
+    for service, name, labels, kind, value, updated_at in rows:
+        family = name.rsplit('_', 1)[0] if kind == 'summary' else name
+        families.setdefault(family, (kind, []))[1].append((name, {'service': service, **json.loads(labels)}, value))
+        last_report[service] = max(last_report.get(service, 0), updated_at or 0)
+    for service, updated_at in last_report.items():
+        families.setdefault('pipeline_service_last_report_timestamp_seconds', ('gauge', []))[1].append(
+            ('pipeline_service_last_report_timestamp_seconds', {'service': service}, updated_at))
+    now = time.time()
+    for table_name, version, updated_at in versions:
+        updated = datetime.fromisoformat(updated_at).timestamp() if updated_at else None
+        families.setdefault('pipeline_table_version', ('counter', []))[1].append(
+            ('pipeline_table_version', {'table': table_name}, version))
+        if updated is not None:
+            families.setdefault('pipeline_table_age_seconds', ('gauge', []))[1].append(
+                ('pipeline_table_age_seconds', {'table': table_name}, now - updated))
+
+    lines = []
+    for family, (kind, samples) in families.items():
+        lines.append(f"# TYPE {family} {kind}")
+        for name, labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels)} {value if value is not None else 'NaN'}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,260 @@
+"""
+Local stand-in for the Odds API v4 /sports and /sports/{sport}/odds endpoints, to load test
+OddsAPIExtractor without spending quota or needing the network. Serves recorded payloads
+from --payload-dir (sports.json and odds/<sport key>.json, see --record) or synthetic ones,
+and can add latency, 500s, 429s and a request quota with the x-requests-* headers the real
+API sends. Point the extractor at it with ODDS_API_BASE_URL
+
+    python mock_odds_api.py --port 8099 --sports 200 --events 20 --latency-ms 80 --rate-limit-rate 0.02
+    ODDS_API_BASE_URL=http://127.0.0.1:8099/v4 python odds_api.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import pandas as pd
+
+from filter_lines import BOOKMAKERS
+from synthetic_data import generate_odds_api_events, load_bundled_team_names
+
+# bookmaker key -> title, as the API names them
+MOCK_BOOKMAKERS = {book['bookmaker_key']: title for title, book in BOOKMAKERS.items()}
+# recorded events start this long after the mock starts, keeping their spacing
+RECORDED_START_MINUTES = 10
+
+
+class MockServer(ThreadingHTTPServer):
+    # room for hundreds of sports requested at once
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class MockOddsAPI(object):
+    def __init__(self, n_sports=4, n_events=20, n_books=len(MOCK_BOOKMAKERS), payload_dir=None, latency_ms=0,
+                 latency_jitter_ms=0, error_rate=0.0, rate_limit_rate=0.0, retry_after_seconds=1, quota=500, seed=0):
+        """
+        Args:
+            n_sports (int): number of synthetic sports, the bundled sports first
+            n_events (int): synthetic events per sport
+            n_books (int): synthetic bookmakers per event
+            payload_dir (str): serve the payloads recorded in this directory instead
+            latency_ms (float): added to every response
+            latency_jitter_ms (float): up to this much more, uniformly at random
+            error_rate (float): share of requests answered with a 500
+            rate_limit_rate (float): share of requests answered with a 429
+            retry_after_seconds (int): Retry-After of the 429s
+            quota (int): requests the key can spend, odds requests cost markets x regions
+            seed (int): seed for the payloads and the injected failures
+        """
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.quota = quota
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = None
+        if payload_dir:
+            self.sports, odds = self.load_payloads(payload_dir)
+        else:
+            self.sports, odds = self.synthetic_payloads(n_sports, n_events, n_books, seed)
+        # serialized once, the mock should never be what the load test measures
+        self.payloads = {sport_key: json.dumps(events).encode() for sport_key, events in odds.items()}
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Resets the counters and the spent quota
+        """
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.rate_limited = 0
+            self.quota_used = 0
+
+    @staticmethod
+    def synthetic_payloads(n_sports, n_events, n_books, seed) -> tuple:
+        team_names = load_bundled_team_names()
+        bundled = list(team_names['sport'].unique())
+        bookmakers = dict(list(MOCK_BOOKMAKERS.items())[:n_books])
+        sports, odds = [], {}
+        for i in range(n_sports):
+            if i < len(bundled):
+                sport_key = bundled[i]
+                teams = team_names[team_names['sport'] == sport_key]['team_name'].to_list()
+            else:
+                sport_key = f"synthetic_league_{i:03d}"
+                teams = [f"League {i} Team {j}" for j in range(max(2 * n_events, 2))]
+            sports.append({'key': sport_key, 'group': sport_key.split('_')[0], 'title': sport_key,
+                           'description': sport_key, 'active': True, 'has_outrights': False})
+            odds[sport_key] = generate_odds_api_events(sport_key, teams, bookmakers, n_events,
+                                                       three_way=sport_key.startswith('soccer'), seed=seed + i)
+        return sports, odds
+
+    @staticmethod
+    def load_payloads(payload_dir) -> tuple:
+        """
+        Reads the payloads record() saved, moving every sport's events so the first starts
+        RECORDED_START_MINUTES from now, otherwise the extractor drops them as started
+        """
+        with open(os.path.join(payload_dir, 'sports.json')) as f:
+            sports = json.load(f)
+        odds = {}
+        now = pd.Timestamp.now(tz='UTC')
+        for sport in sports:
+            path = os.path.join(payload_dir, 'odds', f"{sport['key']}.json")
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                events = json.load(f)
+            if events:
+                times = pd.to_datetime([event['commence_time'] for event in events], utc=True)
+                shift = now + pd.Timedelta(minutes=RECORDED_START_MINUTES) - times.min()
+                for event, commence_time in zip(events, times + shift):
+                    event['commence_time'] = commence_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+            odds[sport['key']] = events
+        return sports, odds
+
+    def handle(self, path, query) -> tuple:
+        """
+        Answers a GET the way the Odds API would
+
+        Returns:
+            tuple: status code, headers, body
+        """
+        delay = self.latency_ms + self._random.uniform(0, self.latency_jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        parts = [part for part in path.split('/') if part]
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                return 429, {'Retry-After': str(self.retry_after_seconds)}, self._message(
+                    'Requests are being sent too frequently', 'EXCEEDED_FREQ_LIMIT')
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return 500, {}, self._message('Internal server error', 'INTERNAL_ERROR')
+            if not query.get('api_key'):
+                return 401, {}, self._message('API key is missing', 'MISSING_KEY')
+            if parts == ['v4', 'sports']:
+                return 200, self._quota_headers(0), json.dumps(self.sports).encode()
+            if len(parts) != 4 or parts[:2] != ['v4', 'sports'] or parts[3] != 'odds':
+                return 404, {}, self._message('Not found', 'NOT_FOUND')
+            if parts[2] not in self.payloads:
+                return 404, {}, self._message(f"Unknown sport {parts[2]}", 'UNKNOWN_SPORT')
+            cost = len(query.get('markets', 'h2h').split(',')) * len(query.get('regions', 'us').split(','))
+            if self.quota_used + cost > self.quota:
+                return 401, self._quota_headers(0), self._message('Usage quota has been reached', 'OUT_OF_USAGE_CREDITS')
+            self.quota_used += cost
+            return 200, self._quota_headers(cost), self.payloads[parts[2]]
+
+    def _quota_headers(self, cost) -> dict:
+        return {'x-requests-remaining': str(self.quota - self.quota_used), 'x-requests-used': str(self.quota_used),
+                'x-requests-last': str(cost)}
+
+    @staticmethod
+    def _message(message, error_code) -> bytes:
+        return json.dumps({'message': message, 'error_code': error_code}).encode()
+
+    def start(self, host='127.0.0.1', port=0) -> str:
+        """
+        Serves the mock from a background thread
+
+        Returns:
+            str: the base url to hand OddsAPI
+        """
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body go out in separate writes, Nagle would hold the body for the ack
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                status, headers, body = mock.handle(url.path, query)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = MockServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}/v4"
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def record(payload_dir, sport_keys=None) -> None:
+    """
+    Saves the live /sports response and the odds of sport_keys (every active sport by
+    default) to payload_dir for the mock to serve. Spends one request per sport
+    """
+    from odds_api import OddsAPI
+    api = OddsAPI()
+    sports = api.get_sports()
+    sport_keys = sport_keys or [sport['key'] for sport in sports if sport.get('active')]
+    os.makedirs(os.path.join(payload_dir, 'odds'), exist_ok=True)
+    with open(os.path.join(payload_dir, 'sports.json'), 'w') as f:
+        json.dump([sport for sport in sports if sport['key'] in sport_keys], f)
+    for sport_key, odds, error in api.get_odds_many(sport_keys):
+        if error is not None:
+            print(f"Failed to record {sport_key}: {error}")
+            continue
+        with open(os.path.join(payload_dir, 'odds', f"{sport_key}.json"), 'w') as f:
+            json.dump(odds, f)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8099)
+    arg_parser.add_argument('--sports', type=int, default=4)
+    arg_parser.add_argument('--events', type=int, default=20, help="events per sport")
+    arg_parser.add_argument('--books', type=int, default=len(MOCK_BOOKMAKERS))
+    arg_parser.add_argument('--payload-dir', default=None, help="serve the payloads recorded here")
+    arg_parser.add_argument('--record', nargs='*', default=None, metavar='SPORT',
+                            help="record the live payloads of these sports (all active ones if none) to --payload-dir and exit")
+    arg_parser.add_argument('--latency-ms', type=float, default=0)
+    arg_parser.add_argument('--jitter-ms', type=float, default=0)
+    arg_parser.add_argument('--error-rate', type=float, default=0)
+    arg_parser.add_argument('--rate-limit-rate', type=float, default=0)
+    arg_parser.add_argument('--quota', type=int, default=500)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    if args.record is not None:
+        record(args.payload_dir or 'odds_api_payloads', args.record)
+        return
+    mock = MockOddsAPI(args.sports, args.events, args.books, args.payload_dir, args.latency_ms, args.jitter_ms,
+                       args.error_rate, args.rate_limit_rate, quota=args.quota, seed=args.seed)
+    print(f"Serving {len(mock.payloads)} sports at {mock.start(args.host, args.port)}")
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps({'requests': mock.requests, 'errors': mock.errors, 'rate_limited': mock.rate_limited,
+                              'quota_used': mock.quota_used}), flush=True)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import logging
 import os
+import threading
 import time
-import uuid 
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import pandas as pd
-from pandas import json_normalize
-from utils import get_sqlalchemy_engine
-from sqlalchemy import create_engine
+from database import ALL_BETTING_LINES_INDEXES, get_engine
+from odds_api_parser import OddsFlattener
+from odds_archive import ODDS_ARCHIVE_DIR, OddsArchive
+from metrics import MetricsRecorder
+from odds_history import ALL_BETTING_LINES_KEY, OddsHistoryStore
+from pipeline_events import ChangeNotifier
 
 SQLALCHEMY_DATABASE_URI = 'sqlite:///../sports_betting.db'
 
@@ -17,27 +22,40 @@ SQLALCHEMY_DATABASE_URI = 'sqlite:///../sports_betting.db'
 load_dotenv()
 
 ODDS_API_KEY = os.getenv("ODDS_API_KEY")
+# point it at mock_odds_api.py to load test without spending quota
+ODDS_API_BASE_URL = os.getenv("ODDS_API_BASE_URL", "https://api.the-odds-api.com/v4")
 REGIONS = 'us'
 MARKETS = 'h2h'
 ODDS_FORMAT = 'decimal'
 DATE_FORMAT = 'iso'
 SLEEP_TIME_MINUTES = 5
+# number of sports fetched at the same time, 1 fetches them one after another
+MAX_CONCURRENT_REQUESTS = int(os.getenv("ODDS_API_MAX_CONCURRENCY", 4))
+REQUEST_TIMEOUT_SECONDS = 30
+# responses kept to revalidate, one per sport and params
+REVALIDATION_MAX_ENTRIES = 256
+# requests kept in reserve when spreading polls out over the rest of the day
+QUOTA_RESERVE = int(os.getenv("ODDS_API_QUOTA_RESERVE", 10))
 
 
 class OddsAPI(object):
-    def __init__(self, api_key=ODDS_API_KEY):
+    def __init__(self, api_key=ODDS_API_KEY, pool_size=MAX_CONCURRENT_REQUESTS, base_url=ODDS_API_BASE_URL):
         self.api_key = api_key
-        self.base_url = 'https://api.the-odds-api.com/v4'
+        self.base_url = base_url.rstrip('/')
+        # one pooled session shared by every request so connections get reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # sport key -> seconds the last get_odds_many request for it took
+        self.request_seconds = {}
     
     def get_sports(self):
         url = f"{self.base_url}/sports"
         params = {
             'api_key': self.api_key
         }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            int(f'Failed to get sports: status_code {response.status_code}, response body {response.text}')
-        return response.json()
+        return self._get(url, params, 'Failed to get sports')
     
     def get_odds(self, sport_key, region=REGIONS, mkt=MARKETS, odds_format=ODDS_FORMAT, date_format=DATE_FORMAT):
         url = f"{self.base_url}/sports/{sport_key}/odds/"
@@ -48,21 +66,159 @@ class OddsAPI(object):
             'oddsFormat': odds_format,
             'dateFormat': date_format
         }
-        response = requests.get(url, params=params)
+        return self._get(url, params, 'Failed to get odds')
+
+    def _get(self, url, params, error_msg):
+        response = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
         if response.status_code != 200:
-            int(f'Failed to get odds: status_code {response.status_code}, response body {response.text}')
+            raise requests.HTTPError(f'{error_msg}: status_code {response.status_code}, response body {response.text}')
         return response.json()
 
+    def get_odds_many(self, sport_keys, max_workers=MAX_CONCURRENT_REQUESTS, **kwargs):
+        """
+        Fetches the odds for several sports concurrently over the shared session
+
+        Args:
+            sport_keys (list): the sports to fetch
+            max_workers (int): the maximum number of requests in flight at once
+            **kwargs: passed through to get_odds
+
+        Yields:
+            tuple: (sport_key, odds, error) in the order the requests finish. error is None
+            on success, otherwise odds is None and error is the exception raised for that sport
+        """
+        def timed_get_odds(sport_key):
+            start = time.perf_counter()
+            try:
+                return self.get_odds(sport_key, **kwargs)
+            finally:
+                self.request_seconds[sport_key] = time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+            futures = {executor.submit(timed_get_odds, sport_key): sport_key for sport_key in sport_keys}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+class RevalidatingOddsAPI(OddsAPI):
+    def __init__(self, api_key=ODDS_API_KEY, pool_size=MAX_CONCURRENT_REQUESTS, max_entries=REVALIDATION_MAX_ENTRIES,
+                 base_url=ODDS_API_BASE_URL):
+        """
+        OddsAPI client that makes every request conditional: it keeps the last response of
+        every endpoint (which holds the sport) and regions/markets/format params and sends
+        If-None-Match / If-Modified-Since when the API handed out an ETag or Last-Modified, so
+        an unchanged response comes back as an empty 304. Every call still reaches the API,
+        whether a 304 costs less quota is up to the API. It also tracks the remaining quota
+        from the x-requests-* response headers. not_modified counts the 304s and downloads the
+        full 200 responses
+        """
+        super().__init__(api_key, pool_size=pool_size, base_url=base_url)
+        self.max_entries = max_entries
+        self._responses = {}
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.downloads = 0
+        self.requests_remaining = None
+        self.requests_used = None
+        self.cycle_cost = 0
+
+    def _get(self, url, params, error_msg):
+        key = (url, tuple(sorted((k, v) for k, v in params.items() if k != 'api_key')))
+        with self._lock:
+            entry = self._responses.get(key)
+        headers = {}
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        response = self.session.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+        self._update_quota(response.headers)
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.not_modified += 1
+                entry['fetched_at'] = time.monotonic()
+            return entry['body']
+        if response.status_code != 200:
+            raise requests.HTTPError(f'{error_msg}: status_code {response.status_code}, response body {response.text}')
+        body = response.json()
+        with self._lock:
+            self.downloads += 1
+            self._responses[key] = {
+                'body': body,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.monotonic(),
+            }
+            if len(self._responses) > self.max_entries:
+                oldest = min(self._responses, key=lambda k: self._responses[k]['fetched_at'])
+                del self._responses[oldest]
+        return body
+
+    def _update_quota(self, headers):
+        with self._lock:
+            if 'x-requests-remaining' in headers:
+                self.requests_remaining = float(headers['x-requests-remaining'])
+            if 'x-requests-used' in headers:
+                self.requests_used = float(headers['x-requests-used'])
+            if 'x-requests-last' in headers:
+                self.cycle_cost += float(headers['x-requests-last'])
+
+    def start_cycle(self):
+        """
+        Resets the quota spent in the current poll, call at the start of every cycle
+        """
+        with self._lock:
+            self.cycle_cost = 0
+
+    def next_poll_seconds(self, base_seconds, end_time) -> float:
+        """
+        Works out how long to wait before the next poll. Polls every base_seconds while the
+        remaining quota covers polling at that rate until end_time, otherwise spreads the
+        polls it can still afford evenly over the time that is left
+
+        Args:
+            base_seconds (float): the normal time between polls
+            end_time (datetime.datetime): when the service stops polling for the day
+
+        Returns:
+            float: the number of seconds to sleep
+        """
+        seconds_left = (end_time - datetime.now()).total_seconds()
+        if self.requests_remaining is None or self.cycle_cost <= 0 or seconds_left <= 0:
+            return base_seconds
+        affordable_polls = (self.requests_remaining - QUOTA_RESERVE) / self.cycle_cost
+        if affordable_polls < 1:
+            return max(base_seconds, seconds_left)
+        return max(base_seconds, seconds_left / affordable_polls)
+
+
 class OddsAPIExtractor:
-    def __init__(self, api_key=ODDS_API_KEY):
+    def __init__(self, api_key=ODDS_API_KEY, max_concurrency=MAX_CONCURRENT_REQUESTS, base_url=ODDS_API_BASE_URL,
+                 engine=None, archive_root=ODDS_ARCHIVE_DIR):
+        """
+        Args:
+            api_key (str): the Odds API key
+            max_concurrency (int): the maximum number of odds requests in flight at once
+            base_url (str): the API to extract from, ODDS_API_BASE_URL by default
+            engine (sqlalchemy.Engine): the database to load into, the production database by default
+            archive_root (str): the parquet archive directory
+        """
         self.svc_name = "odds_api"
         self.logger = None
         self.init_logger()
-        self.api = OddsAPI(api_key)
-        self.engine = create_engine(SQLALCHEMY_DATABASE_URI)
+        self.max_concurrency = max_concurrency
+        self.api = RevalidatingOddsAPI(api_key, pool_size=max_concurrency, base_url=base_url)
+        self.engine = engine if engine is not None else get_engine(SQLALCHEMY_DATABASE_URI)
+        self.history = OddsHistoryStore(self.engine, 'all_betting_lines', ALL_BETTING_LINES_KEY,
+                                        indexes=ALL_BETTING_LINES_INDEXES, logger=self.logger)
+        self.archive = OddsArchive(archive_root, logger=self.logger)
+        self.notifier = ChangeNotifier(self.engine)
+        self.metrics = MetricsRecorder(self.engine, self.svc_name, logger=self.logger)
         self.extracted_sports = None
         self.sports_table = pd.DataFrame()
-        self.extracted_odds = pd.DataFrame()
+        self.flattener = OddsFlattener()
         self.odds_table = pd.DataFrame()
         
     def init_logger(self, log_lvl=logging.DEBUG, verbose=True) -> None:
@@ -103,56 +259,52 @@ class OddsAPIExtractor:
     
     def extract_odds(self):
         """
-        Extracts odds data from the API and stores it in the extracted_odds attribute
+        Extracts odds data from the API for every sport concurrently and flattens every
+        response into the flattener as it arrives. A sport that fails is logged and skipped
+        so it does not throw away the odds of the others
 
         Returns:
-        0 if successful
+        0 if at least one sport was extracted, -1 otherwise
         """
-        self.extracted_odds = []
+        self.flattener = OddsFlattener()
         if self.extracted_sports is None:
             return -1
-        for sport_key in self.extracted_sports:
-            try:
-                odds = self.api.get_odds(sport_key)
-                self.extracted_odds.extend(odds)
-            except:
-                print(f'Failed to extract odds for {sport_key}')
-                return -1
+        failed = []
+        for sport_key, odds, error in self.api.get_odds_many(self.extracted_sports, max_workers=self.max_concurrency):
+            self.metrics.observe('odds_api_request_seconds', self.api.request_seconds[sport_key], sport=sport_key)
+            if error is not None:
+                self.logger.warning(f'Failed to extract odds for {sport_key}: {error}')
+                self.metrics.inc('odds_api_request_errors_total', sport=sport_key)
+                failed.append(sport_key)
+                continue
+            self.flattener.add(odds)
+        if failed and len(failed) == len(self.extracted_sports):
+            return -1
         return 0
             
     def transform_odds(self):
         """
-        Transforms the extracted odds data into a table format and stores it in the odds_table attribute
-        """
-        self.odds_table = pd.json_normalize(self.extracted_odds, record_path=["bookmakers", "markets", "outcomes"], 
-                    meta=["sport_key", "commence_time", "home_team", "away_team", 
-                          ["bookmakers", "key"], ["bookmakers", "title"], ["markets", "key"]],
-                    errors="ignore")
-        self.odds_table = self.odds_table.rename(columns={
-                                                        "name": "outcome", 
-                                                        "price": "decimal_odds",
-                                                        'sport_key': 'sport',
-                                                        "commence_time": "start_time", 
-                                                        "bookmakers.title": "sportsbook",}
-                                                        )
-        self.odds_table['update_time'] = pd.to_datetime('now')
-        self.odds_table["id"] = [str(uuid.uuid4()) for _ in range(len(self.odds_table))]
-        # convert start_time to from utc time to central time
-        self.odds_table["start_time"] = pd.to_datetime(self.odds_table["start_time"])
-        self.odds_table["start_time"] = self.odds_table["start_time"].dt.tz_convert('US/Central')
-        self.odds_table = self.odds_table[self.odds_table["start_time"] > pd.to_datetime('now').tz_localize('US/Central')]
-        # remove games that are not today
-        self.odds_table = self.odds_table[self.odds_table["start_time"].dt.date == pd.to_datetime('now').date()]
-        self.odds_table = self.odds_table.loc[:, ['id', "sport", "home_team", "away_team", "start_time", "sportsbook", "outcome", "decimal_odds", "update_time"]]
-        self.logger.debug(f"Transformed {len(self.odds_table)} odds entries")
+        Builds the odds_table attribute from the lines the flattener kept, the events that
+        already started or are not today were dropped while extracting
+        """
+        self.odds_table = self.flattener.to_frame()
+        self.logger.debug(f"Transformed {len(self.odds_table)} odds entries from {self.flattener.events_kept} of "
+                          f"{self.flattener.events_seen} events")
         return 0
         
     def load_odds(self):
         """
-        Writes odds table to database
+        Writes the odds table to the latest snapshot table all_betting_lines and appends the
+        lines whose price changed to all_betting_lines_history. The full snapshot also goes to
+        the parquet archive
         """
-        r = self.odds_table.to_sql('all_betting_lines', self.engine, if_exists='replace', index=False)
-        self.logger.info(f"Loaded {r} rows into all_betting_lines")
+        r = self.history.load(self.odds_table)
+        self.logger.info(f"Loaded {len(self.odds_table)} rows into all_betting_lines, {r} price changes into all_betting_lines_history")
+        self.notifier.bump('all_betting_lines')
+        try:
+            self.archive.write(self.odds_table, 'all_betting_lines')
+        except Exception as e:
+            self.logger.error(f"Failed to archive odds: {e}")
         
         return 0
         
@@ -163,17 +315,30 @@ class OddsAPIExtractor:
         Returns: 0 if successful, -1 if failed
             
         """
-        self.extract_sports()
-        r = self.extract_odds()
-        if r != 0:
-            return r
-        r = self.transform_odds()
-        if r != 0:
-            return r
-        r = self.load_odds()
-        if r != 0:
-            return r
-        return 0
+        self.api.start_cycle()
+        try:
+            with self.metrics.timer('odds_api_cycle_seconds'):
+                self.extract_sports()
+                for stage in [self.extract_odds, self.transform_odds, self.load_odds]:
+                    with self.metrics.timer('odds_api_stage_seconds', stage=stage.__name__):
+                        r = stage()
+                    if r != 0:
+                        return r
+            return 0
+        finally:
+            self.record_metrics()
+
+    def record_metrics(self):
+        """
+        Records the rows extracted this cycle along with the quota and revalidation counters of the client
+        """
+        self.metrics.set('odds_api_rows', len(self.odds_table))
+        self.metrics.set('odds_api_not_modified_responses', self.api.not_modified)
+        self.metrics.set('odds_api_full_responses', self.api.downloads)
+        self.metrics.set('odds_api_cycle_cost', self.api.cycle_cost)
+        if self.api.requests_remaining is not None:
+            self.metrics.set('odds_api_requests_remaining', self.api.requests_remaining)
+        self.metrics.flush()
     
     def run(self):
         """
@@ -181,6 +346,7 @@ class OddsAPIExtractor:
         """
         # end at 9:30 pm central time
         end_time = datetime.now().replace(hour=21, minute=30, second=0, microsecond=0)
+        self.compact_archive()
         self.extract_sports()
         while datetime.now() < end_time:
             if self.extracted_sports is None:
@@ -193,8 +359,21 @@ class OddsAPIExtractor:
             if self.odds_table.empty:
                 print("No more games today, shutting down")
                 break
-            time.sleep(SLEEP_TIME_MINUTES * 60)
+            sleep_seconds = self.api.next_poll_seconds(SLEEP_TIME_MINUTES * 60, end_time)
+            self.logger.debug(f"Quota remaining: {self.api.requests_remaining}, not modified: {self.api.not_modified}, "
+                              f"next poll in {sleep_seconds / 60:.1f} minutes")
+            time.sleep(sleep_seconds)
             
+    def compact_archive(self):
+        """
+        Merges the snapshot files of the days before today, the archive gets one file per sport
+        every poll
+        """
+        try:
+            self.archive.compact_finished_days('all_betting_lines')
+        except Exception as e:
+            self.logger.error(f"Failed to compact the odds archive: {e}")
+
     #Helper functions
     def get_sports(self):
         df = pd.read_sql("SELECT DISTINCT sport FROM avg_odds", self.engine)
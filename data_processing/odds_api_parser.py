@@ -0,0 +1,112 @@
+from array import array
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import uuid
+import numpy as np
+import pandas as pd
+
+from event_keys import line_keys
+
+TIMEZONE = 'US/Central'
+COLUMNS = ['id', 'sport', 'home_team', 'away_team', 'start_time', 'sportsbook', 'outcome', 'decimal_odds', 'update_time']
+
+
+class OddsFlattener(object):
+    def __init__(self, now=None):
+        """
+        Flattens Odds API v4 odds responses into the all_betting_lines table one sport at a
+        time, as the responses arrive, instead of keeping every payload for one json_normalize
+        at the end. Events that already started or do not start today are skipped before any
+        of their rows are made, the rows that are kept go straight into column buffers: the
+        price and the event of every row, the event's strings once per event and every
+        sportsbook title once
+
+        Args:
+            now (pd.Timestamp): the local time of the cycle, naive, now by default
+        """
+        self.now = pd.Timestamp('now') if now is None else pd.Timestamp(now)
+        self._now_central = self.now.tz_localize(TIMEZONE).to_pydatetime()
+        self._today = self.now.date()
+        self._timezone = ZoneInfo(TIMEZONE)
+        # one entry per kept event
+        self._sports, self._home_teams, self._away_teams = [], [], []
+        self._start_times = array('q')
+        # one entry per row
+        self._events = array('l')
+        self._books = array('l')
+        self._outcomes = []
+        self._prices = array('d')
+        self._book_codes = {}
+        self.events_seen = 0
+
+    def __len__(self):
+        return len(self._prices)
+
+    @property
+    def events_kept(self) -> int:
+        return len(self._sports)
+
+    def add(self, events) -> int:
+        """
+        Appends the lines of one odds response
+
+        Args:
+            events (list): the response body, one dict per event
+
+        Returns:
+            int: the number of rows added
+        """
+        rows = len(self._prices)
+        for event in events:
+            self.events_seen += 1
+            if not event.get('commence_time'):
+                continue
+            start_time = datetime.fromisoformat(event['commence_time'].replace('Z', '+00:00')).astimezone(self._timezone)
+            if start_time <= self._now_central or start_time.date() != self._today:
+                continue
+            event_code = len(self._sports)
+            added = False
+            for bookmaker in event.get('bookmakers', ()):
+                title = bookmaker.get('title')
+                book_code = self._book_codes.setdefault(title, len(self._book_codes))
+                for market in bookmaker.get('markets', ()):
+                    for outcome in market.get('outcomes', ()):
+                        self._events.append(event_code)
+                        self._books.append(book_code)
+                        self._outcomes.append(outcome.get('name'))
+                        self._prices.append(outcome.get('price', np.nan))
+                        added = True
+            if added:
+                self._sports.append(event.get('sport_key'))
+                self._home_teams.append(event.get('home_team'))
+                self._away_teams.append(event.get('away_team'))
+                self._start_times.append(int(start_time.timestamp() * 1_000_000))
+        return len(self._prices) - rows
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: the all_betting_lines rows with their line_key, start_time in
+            US/Central and one update_time for the whole cycle
+        """
+        n = len(self._prices)
+        events = np.frombuffer(self._events, dtype=self._events.typecode) if n else np.empty(0, dtype=np.int64)
+        books = np.frombuffer(self._books, dtype=self._books.typecode) if n else np.empty(0, dtype=np.int64)
+        start_times = np.frombuffer(self._start_times, dtype=np.int64) if len(self._start_times) else np.empty(0, dtype=np.int64)
+        titles = np.array(list(self._book_codes), dtype=object)
+        # a random prefix per cycle keeps the ids unique across snapshots
+        prefix = uuid.uuid4().hex
+        df = pd.DataFrame({
+            'id': np.array([f"{prefix}-{i}" for i in range(n)], dtype=object),
+            'sport': np.array(self._sports, dtype=object)[events],
+            'home_team': np.array(self._home_teams, dtype=object)[events],
+            'away_team': np.array(self._away_teams, dtype=object)[events],
+            'start_time': pd.to_datetime(start_times[events], unit='us', utc=True).tz_convert(TIMEZONE),
+            'sportsbook': titles[books] if len(titles) else np.empty(0, dtype=object),
+            'outcome': np.array(self._outcomes, dtype=object),
+            'decimal_odds': np.frombuffer(self._prices, dtype=np.float64) if n else np.empty(0),
+            'update_time': pd.Series(self.now, index=range(n), dtype='datetime64[ns]'),
+        }, columns=COLUMNS)
+        # integer key of the line across sportsbooks, LineFilter groups on it
+        df['line_key'] = line_keys(df)
+        return df
@@ -0,0 +1,194 @@
+from datetime import date as Date
+import logging
+import os
+import shutil
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# relative to the working directory, like the database
+ODDS_ARCHIVE_DIR = os.getenv("ODDS_ARCHIVE_DIR", "../odds_archive")
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string()), ('sport', pa.string())]), flavor='hive')
+TIMESTAMP_COLUMNS = ['start_time', 'update_time']
+# what every archived source has, the columns of a read from a source that was never written
+BASE_COLUMNS = ['date', 'sport', 'update_time']
+# partitions being swapped by compact, the scans skip names starting with _
+STAGING_SUFFIX = '.compacting'
+RETIRED_SUFFIX = '.retired'
+
+
+class OddsArchive(object):
+    def __init__(self, root=ODDS_ARCHIVE_DIR, logger=None):
+        """
+        Parquet archive of every odds snapshot, laid out as
+            <root>/<source>/date=YYYY-MM-DD/sport=<sport key>/part-*.parquet
+        so a time range of history can be scanned lazily, reading only the partitions, row
+        groups and columns a query needs instead of loading whole tables into pandas
+
+        Args:
+            root (str): directory the archive lives in
+        """
+        self.root = root
+        self.logger = logger or logging.getLogger("odds_archive")
+
+    def write(self, df: pd.DataFrame, source) -> int:
+        """
+        Appends a snapshot to the archive, partitioned by the day of its update_time and sport
+
+        Args:
+            df (pd.DataFrame): the snapshot, e.g. the odds_table of OddsAPIExtractor
+            source (str): the table the snapshot belongs to, e.g. all_betting_lines or avg_odds
+
+        Returns:
+            int: the number of rows written
+        """
+        if df.empty:
+            return 0
+        df = df.copy()
+        df['id'] = df['id'].astype(str)
+        df['decimal_odds'] = df['decimal_odds'].astype(float)
+        for column in TIMESTAMP_COLUMNS:
+            times = pd.to_datetime(df[column])
+            if times.dt.tz is not None:
+                # the odds api times are already converted to US/Central, keep the wall clock time
+                times = times.dt.tz_localize(None)
+            df[column] = times.astype('datetime64[us]')
+        df['date'] = df['update_time'].dt.strftime('%Y-%m-%d')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_to_dataset(table, os.path.join(self.root, source), partitioning=PARTITIONING,
+                            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet")
+        self.logger.debug(f"Archived {len(df)} rows of {source}")
+        return len(df)
+
+    def scanner(self, source, start, end, columns=None, sports=None, filter=None) -> ds.Scanner:
+        """
+        Builds a lazy scanner over the snapshots whose update_time falls in [start, end).
+        The date and sport predicates prune partitions, the update_time and extra filter are
+        pushed down to the parquet row groups and only the requested columns are read
+
+        Args:
+            source (str): the archived table, e.g. all_betting_lines or avg_odds
+            start (datetime.datetime): start of the time range
+            end (datetime.datetime): end of the time range (exclusive)
+            columns (list): the columns to read, all of them if None
+            sports (list): only read these sports, all of them if None
+            filter (pyarrow.dataset.Expression): any additional predicate, e.g.
+                ds.field('decimal_odds') > 2
+
+        Returns:
+            pyarrow.dataset.Scanner: call to_batches() to stream or to_table() to load
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        dataset = ds.dataset(os.path.join(self.root, source), format='parquet', partitioning=PARTITIONING)
+        expression = ((ds.field('date') >= start.strftime('%Y-%m-%d'))
+                      & (ds.field('date') <= end.strftime('%Y-%m-%d'))
+                      & (ds.field('update_time') >= pa.scalar(start.to_pydatetime(), pa.timestamp('us')))
+                      & (ds.field('update_time') < pa.scalar(end.to_pydatetime(), pa.timestamp('us'))))
+        if sports is not None:
+            expression = expression & ds.field('sport').isin(list(sports))
+        if filter is not None:
+            expression = expression & filter
+        return dataset.scanner(columns=columns, filter=expression)
+
+    def read(self, source, start, end, columns=None, sports=None, filter=None) -> pd.DataFrame:
+        """
+        Loads the snapshots in [start, end) into a single dataframe, see scanner for the args.
+        A source that was never archived reads as an empty dataframe
+        """
+        if not os.path.isdir(os.path.join(self.root, source)):
+            return pd.DataFrame(columns=columns if columns is not None else BASE_COLUMNS)
+        return self.scanner(source, start, end, columns, sports, filter).to_table().to_pandas()
+
+    def iter_batches(self, source, start, end, columns=None, sports=None, filter=None):
+        """
+        Streams the snapshots in [start, end) as dataframes one record batch at a time so a
+        range bigger than memory can be processed, see scanner for the args
+        """
+        if not os.path.isdir(os.path.join(self.root, source)):
+            return
+        for batch in self.scanner(source, start, end, columns, sports, filter).to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+    def compact(self, source, date) -> int:
+        """
+        Rewrites every sport partition of a day as a single file, the archive gets a small
+        file per sport per snapshot so finished days are worth compacting. Only compact days
+        that are no longer written to. The merged file is written to a staging directory that
+        is then swapped in for the partition with two renames, a crash leaves either the old
+        or the new partition, which the next compact cleans up after
+
+        Args:
+            source (str): the archived table
+            date (str): the day to compact, YYYY-MM-DD
+
+        Returns:
+            int: the number of partitions compacted
+        """
+        day_dir = os.path.join(self.root, source, f"date={date}")
+        if not os.path.isdir(day_dir):
+            return 0
+        self._recover(day_dir)
+        compacted = 0
+        for sport_dir in os.listdir(day_dir):
+            if not sport_dir.startswith('_'):
+                compacted += self._compact_partition(os.path.join(day_dir, sport_dir))
+        if compacted:
+            self.logger.debug(f"Compacted {compacted} partitions of {source} for {date}")
+        return compacted
+
+    def compact_finished_days(self, source, today=None) -> int:
+        """
+        Compacts every day of source before today, days that are already compacted are only
+        listed. The extractors run it once a day before they start writing
+
+        Args:
+            source (str): the archived table
+            today (datetime.date): the first day to leave alone, today by default
+
+        Returns:
+            int: the number of partitions compacted
+        """
+        source_dir = os.path.join(self.root, source)
+        if not os.path.isdir(source_dir):
+            return 0
+        today = (today or Date.today()).strftime('%Y-%m-%d')
+        days = sorted(name[len('date='):] for name in os.listdir(source_dir) if name.startswith('date='))
+        return sum(self.compact(source, day) for day in days if day < today)
+
+    def _compact_partition(self, path) -> int:
+        files = [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.parquet')]
+        if len(files) < 2:
+            return 0
+        parent, name = os.path.split(path)
+        staging = os.path.join(parent, f"_{name}{STAGING_SUFFIX}")
+        retired = os.path.join(parent, f"_{name}{RETIRED_SUFFIX}")
+        os.makedirs(staging)
+        table = ds.dataset(files, format='parquet').to_table()
+        pq.write_table(table.sort_by('update_time'), os.path.join(staging, f"part-{uuid.uuid4().hex}-compacted.parquet"))
+        os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired)
+        return 1
+
+    def _recover(self, day_dir) -> None:
+        """
+        Finishes or rolls back the partition swaps a crashed compact left in day_dir
+        """
+        for entry in os.listdir(day_dir):
+            if not entry.startswith('_'):
+                continue
+            path = os.path.join(day_dir, entry)
+            if entry.endswith(STAGING_SUFFIX):
+                partition = os.path.join(day_dir, entry[1:-len(STAGING_SUFFIX)])
+                if os.path.exists(partition):
+                    # the merged file may be incomplete, the partition is untouched
+                    shutil.rmtree(path)
+                else:
+                    # crashed between the renames, the merged file is complete
+                    os.rename(path, partition)
+        for entry in os.listdir(day_dir):
+            if entry.startswith('_') and entry.endswith(RETIRED_SUFFIX):
+                shutil.rmtree(os.path.join(day_dir, entry))
@@ -0,0 +1,106 @@
+from datetime import datetime
+import logging
+import pandas as pd
+from sqlalchemy import text
+
+from database import write_transaction
+
+ALL_BETTING_LINES_KEY = ['sport', 'home_team', 'away_team', 'start_time', 'sportsbook', 'outcome']
+AVG_ODDS_KEY = ['sport', 'home_team', 'away_team', 'start_time', 'outcome']
+
+
+class OddsHistoryStore(object):
+    def __init__(self, engine, table_name, key_columns, indexes=(), logger=None):
+        """
+        Keeps two tables for a source of odds:
+            <table_name>_history: append-only, one row every time the price of a line changes,
+                unique on the key columns plus update_time
+            <table_name>: the latest snapshot, one row per line seen in the last load, unique
+                on the key columns. This is what LineFilter reads
+        Loads go through a staging table so the writes are bulk INSERT ... SELECT statements
+        and the change detection is an indexed join against the latest snapshot
+
+        Args:
+            engine (sqlalchemy.Engine): the database engine
+            table_name (str): name of the latest snapshot table, e.g. all_betting_lines
+            key_columns (list): columns identifying a line (event, sportsbook, outcome)
+            indexes (list): extra column lists to index the latest snapshot table on
+        """
+        self.engine = engine
+        self.table_name = table_name
+        self.history_table = f"{table_name}_history"
+        self.staging_table = f"{table_name}_staging"
+        self.key_columns = key_columns
+        self.indexes = indexes
+        self.logger = logger or logging.getLogger("odds_history")
+
+    def load(self, df: pd.DataFrame, snapshot_time=None) -> int:
+        """
+        Appends the lines whose price changed since the last load to the history table and
+        replaces the latest snapshot with df
+
+        Args:
+            df (pd.DataFrame): the lines extracted this cycle
+            snapshot_time (datetime.datetime): when the snapshot was taken, defaults to now
+
+        Returns:
+            int: the number of rows appended to the history table
+        """
+        with write_transaction(self.engine) as conn:
+            if df.empty:
+                if self._columns(conn, self.table_name):
+                    conn.execute(text(f"DELETE FROM {self.table_name}"))
+                return 0
+            df = df.assign(snapshot_time=snapshot_time or datetime.now())
+            df.to_sql(self.staging_table, conn, if_exists='replace', index=False)
+            self._ensure_schema(conn)
+            columns = ", ".join(df.columns)
+            staged_columns = ", ".join(f"s.{column}" for column in df.columns)
+            same_key = " AND ".join(f"s.{column} IS l.{column}" for column in self.key_columns)
+            appended = conn.execute(text(
+                f"INSERT OR IGNORE INTO {self.history_table} ({columns}) "
+                f"SELECT {staged_columns} FROM {self.staging_table} s "
+                f"LEFT JOIN {self.table_name} l ON {same_key} "
+                f"WHERE l.rowid IS NULL OR l.decimal_odds IS NOT s.decimal_odds"
+            )).rowcount
+            updates = ", ".join(f"{column} = excluded.{column}" for column in df.columns if column not in self.key_columns)
+            conn.execute(text(
+                f"INSERT INTO {self.table_name} ({columns}) SELECT {columns} FROM {self.staging_table} WHERE true "
+                f"ON CONFLICT ({', '.join(self.key_columns)}) DO UPDATE SET {updates}"
+            ))
+            # lines that were not in this snapshot (started games, pulled lines) drop out of the latest table
+            conn.execute(text(
+                f"DELETE FROM {self.table_name} "
+                f"WHERE snapshot_time IS NOT (SELECT snapshot_time FROM {self.staging_table} LIMIT 1)"
+            ))
+            conn.execute(text(f"DROP TABLE {self.staging_table}"))
+        self.logger.debug(f"Appended {appended} changed prices to {self.history_table}")
+        return appended
+
+    def _ensure_schema(self, conn) -> None:
+        """
+        Creates the latest and history tables with the staging table's columns if they do not
+        exist yet and adds staged columns they are missing. A latest table left over from the old to_sql(if_exists='replace') loads has no
+        snapshot_time or unique key, it only ever held one snapshot so it is dropped and rebuilt
+        """
+        latest_columns = self._columns(conn, self.table_name)
+        if latest_columns and 'snapshot_time' not in latest_columns:
+            conn.execute(text(f"DROP TABLE {self.table_name}"))
+        staged_columns = self._columns(conn, self.staging_table)
+        for table in [self.table_name, self.history_table]:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM {self.staging_table} WHERE 0"))
+            # columns added to the source since the table was created
+            existing = self._columns(conn, table)
+            for column in staged_columns:
+                if column not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column}"))
+        keys = ", ".join(self.key_columns)
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{self.table_name}_line ON {self.table_name} ({keys})"))
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{self.history_table}_line "
+                          f"ON {self.history_table} ({keys}, update_time)"))
+        for columns in self.indexes:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{self.table_name}_{'_'.join(columns)} "
+                              f"ON {self.table_name} ({', '.join(columns)})"))
+
+    def _columns(self, conn, table) -> list:
+        return [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
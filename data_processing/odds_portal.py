@@ -1,9 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
+import queue
 import time
-import uuid
-from bs4 import BeautifulSoup
-from dateutil import parser
 import pandas as pd
 import numpy as np
 import selenium
@@ -13,8 +12,13 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import ElementClickInterceptedException
-from utils import get_sqlalchemy_engine
+from selenium.common.exceptions import ElementClickInterceptedException, TimeoutException
+from database import get_engine
+from metrics import MetricsRecorder
+from odds_archive import OddsArchive
+from odds_history import AVG_ODDS_KEY, OddsHistoryStore
+from odds_portal_parser import ODDS_PORTAL_PARSER, parse_avg_odds
+from pipeline_events import ChangeNotifier
 import os
 from dotenv import load_dotenv
 
@@ -24,6 +28,12 @@ ODDS_PORTAL_USERNAME = os.getenv("ODDS_PORTAL_USERNAME")
 ODDS_PORTAL_PASSWORD = os.getenv("ODDS_PORTAL_PASSWORD")
 SQLALCHEMY_DATABASE_URI = 'sqlite:///../sports_betting.db'
 SLEEP_TIME_MINUTES = 5
+# number of logged in Chrome instances the leagues are spread across
+POOL_SIZE = int(os.getenv("ODDS_PORTAL_POOL_SIZE", 1))
+TABLE_XPATH = '//*[@id="app"]/div[1]/div[1]/div/main/div[3]/div[4]'
+# how long a league table may stay without rows before it counts as a league without games,
+# the fixed sleep get_avg_odds used to take for every league
+EMPTY_TABLE_SECONDS = float(os.getenv("ODDS_PORTAL_EMPTY_TABLE_SECONDS", 0.5))
 
 LEAGUE_URLS = {
             "americanfootball_nfl": "https://www.oddsportal.com/american-football/usa/nfl/",
@@ -41,31 +51,69 @@ LEAGUE_URLS = {
         }
 
 
+class TableReady(object):
+    """
+    WebDriverWait condition that is met once the league table has event rows and the number
+    of rows did not change since the previous poll, i.e. the page stopped rendering rows, or
+    once the table stayed without rows for empty_seconds, i.e. the league has no games.
+    Replaces the fixed sleep after the table shows up
+    """
+    def __init__(self, empty_seconds=EMPTY_TABLE_SECONDS):
+        self.last_count = -1
+        self.empty_deadline = time.monotonic() + empty_seconds
+
+    def __call__(self, web):
+        count = web.execute_script("return document.querySelectorAll('div.eventRow').length")
+        if count == 0:
+            ready = time.monotonic() >= self.empty_deadline
+        else:
+            ready = count == self.last_count
+        self.last_count = count
+        return ready
+
+
 class OddsPortalScraper:
-    def __init__(self, league_urls=LEAGUE_URLS):
+    def __init__(self, league_urls=LEAGUE_URLS, pool_size=POOL_SIZE, headless=False, parser_backend=ODDS_PORTAL_PARSER):
         self.svc_name = "odds_portal"
         self.logger = None  
         self.init_logger()
+        # filled as the drivers start, so the ones that did start can be quit if a later one fails
+        self.drivers = []
         try:
             self.league_urls = league_urls
-            self.engine = get_sqlalchemy_engine()
-            op = webdriver.ChromeOptions()
-            op.add_argument(
-                "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/105.0.0.0 Safari/537.36"
-            )
-            op.add_argument("--disable-web-security")
-            op.add_argument("no-sandbox")
-            op.add_argument("--disable-blink-features=AutomationControlled")
-            op.add_argument("--log-level=3")
-            self.web = webdriver.Chrome(
-                service=Service(ChromeDriverManager().install()), options=op
-            )
-            self.logger.debug("Initialized Chrome webdriver")
-            self.web.minimize_window()
+            self.engine = get_engine(SQLALCHEMY_DATABASE_URI)
+            self.history = OddsHistoryStore(self.engine, 'avg_odds', AVG_ODDS_KEY, logger=self.logger)
+            self.archive = OddsArchive(logger=self.logger)
+            self.notifier = ChangeNotifier(self.engine)
+            self.metrics = MetricsRecorder(self.engine, self.svc_name, logger=self.logger)
+            self.headless = headless
+            self.parser_backend = parser_backend
+            for _ in range(max(pool_size, 1)):
+                self.drivers.append(self.create_driver())
+            self.web = self.drivers[0]
+            self.logger.debug(f"Initialized {len(self.drivers)} Chrome webdrivers")
             self.data = pd.DataFrame()
         except Exception as e:
             self.logger.error("Failed to initialize OddsPortalScraper")
             self.logger.error(e)
+
+    def create_driver(self):
+        op = webdriver.ChromeOptions()
+        op.add_argument(
+            "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/105.0.0.0 Safari/537.36"
+        )
+        op.add_argument("--disable-web-security")
+        op.add_argument("no-sandbox")
+        op.add_argument("--disable-blink-features=AutomationControlled")
+        op.add_argument("--log-level=3")
+        if self.headless:
+            op.add_argument("--headless=new")
+        web = webdriver.Chrome(
+            service=Service(ChromeDriverManager().install()), options=op
+        )
+        if not self.headless:
+            web.minimize_window()
+        return web
         
 
     def init_logger(self, log_lvl=logging.DEBUG, verbose=True) -> None:
@@ -91,119 +139,66 @@ class OddsPortalScraper:
         
 
     def odds_portal_login(self):
-        self.web.get("https://www.oddsportal.com/login/")
+        """
+        Logs every driver in the pool in to OddsPortal at the same time
+        """
+        with ThreadPoolExecutor(max_workers=len(self.drivers)) as executor:
+            list(executor.map(self.login_driver, self.drivers))
+        self.logger.info(f"Logged {len(self.drivers)} drivers in to OddsPortal")
+
+    def login_driver(self, web):
+        web.get("https://www.oddsportal.com/login/")
         login_xpath = (
             "/html/body/div[1]/div[1]/div[1]/div/main/div[3]/div[2]/div/div/form/div[4]"
         )
-        WebDriverWait(self.web, 10).until(
+        WebDriverWait(web, 10).until(
             EC.element_to_be_clickable((By.XPATH, login_xpath))
         )
         time.sleep(5)
-        user = self.web.find_elements(By.ID, "login-username-sign")[-1]
+        user = web.find_elements(By.ID, "login-username-sign")[-1]
         user.send_keys(ODDS_PORTAL_USERNAME)
-        pswd = self.web.find_elements(By.ID, "login-password-sign")[-1]
+        pswd = web.find_elements(By.ID, "login-password-sign")[-1]
         pswd.send_keys(ODDS_PORTAL_PASSWORD)
-        login = self.web.find_element(By.XPATH, login_xpath)
+        login = web.find_element(By.XPATH, login_xpath)
         login.click()
-        self.logger.info("Logged in to OddsPortal")
 
-    def get_avg_odds(self, sport_key, league_url) -> pd.DataFrame:
-        self.web.get(league_url)
-        table_xpath = '//*[@id="app"]/div[1]/div[1]/div/main/div[3]/div[4]'
-        WebDriverWait(self.web, 4).until(
-            EC.element_to_be_clickable((By.XPATH, table_xpath)))
-        time.sleep(.5)
-        soup = BeautifulSoup(self.web.page_source, "html.parser")
-        rows = soup.find_all("div", class_="eventRow flex w-full flex-col text-xs")
-        entries = []
-        event_date = datetime.now().date()
-        for row in rows:
-            try:
-                date_tag = row.find("div", class_="text-black-main font-main w-full truncate text-xs font-normal leading-5")
-                if date_tag is not None:
-                    date_tag = date_tag.text
-                    if 'yesterday' in date_tag.lower():
-                        continue
-                    if 'today' in date_tag.lower():
-                        continue
-                    if 'tomorrow' in date_tag.lower():
-                        event_date = datetime.today() + pd.Timedelta(days=1)
-                    else:
-                        try:
-                            event_date = parser.parse(date_tag).date()
-                        except:
-                            print(date_tag, "not parsed")
-                            continue
-                teams = row.find_all("p", class_="participant-name truncate")
-                home_team, away_team = teams[0].text, teams[1].text
-                time_div = row.find("div", class_="next-m:flex-col min-md:flex-row min-md:gap-1 text-gray-dark flex flex-row self-center text-[12px] w-full")
-                start_time = time_div.find('p').text
-                start_time = datetime.time(datetime.strptime(start_time, "%H:%M"))
-                odds = row.find_all("div", class_="flex-center border-black-borders min-w-[60px] flex-col gap-1 pb-0.5 pt-0.5 relative")
-                odds = [odd.find("p").text for odd in odds] 
-                if len(odds) == 3:
-                    home_odds, draw_odds, away_odds = odds
-                else:
-                    home_odds, away_odds = odds
-                    draw_odds = None
-                start_time = datetime.combine(event_date, start_time)
-                home_entry = {
-                    'id': uuid.uuid4(),
-                    "sport": sport_key, # sport key
-                    'home_team': home_team,
-                    'away_team': away_team,
-                    'start_time': start_time,
-                    'outcome': home_team,
-                    "decimal_odds": home_odds,
-                    'update_time': datetime.now(),
-                }
-                away_entry = {
-                    'id': uuid.uuid4(),
-                    "sport": sport_key, # sport key
-                    'home_team': home_team,
-                    'away_team': away_team,
-                    'start_time': start_time,
-                    'outcome': away_team,
-                    "decimal_odds": away_odds,
-                    'update_time': datetime.now(),
-                }
-                entries.append(home_entry)
-                entries.append(away_entry)
-                if draw_odds is not None:
-                    draw_entry = {
-                        'id': uuid.uuid4(),
-                        "sport": sport_key, # sport key
-                        'home_team': home_team,
-                        'away_team': away_team,
-                        'start_time': start_time,
-                        'outcome': 'Draw',
-                        "decimal_odds": draw_odds,
-                        'update_time': datetime.now(),
-                    }
-                    entries.append(draw_entry)
-            except Exception as e:
-                print(e)
-                continue
-        # select only rows that are today and not tomorrow or beyond
-        df = pd.DataFrame(entries)
-        if df.empty:
-            return df
-        df['start_time'] = pd.to_datetime(df['start_time'])
-        df = df[df['start_time'].dt.date == datetime.now().date()]
-        df = df[df['start_time'].dt.time > datetime.now().time()]
-        df = df.reset_index(drop = True)
-        return df
+    def get_avg_odds(self, sport_key, league_url, web=None) -> pd.DataFrame:
+        web = web or self.web
+        web.get(league_url)
+        WebDriverWait(web, 4).until(
+            EC.element_to_be_clickable((By.XPATH, TABLE_XPATH)))
+        try:
+            WebDriverWait(web, 4, poll_frequency=0.1).until(TableReady())
+        except TimeoutException:
+            # rows still rendering after 4s, parse whatever is there
+            pass
+        return parse_avg_odds(sport_key, web.page_source, self.parser_backend)
     
     def extract_odds(self):
-        dfs = []
-        for league, url in self.league_urls.items():
+        """
+        Scrapes the average odds of every league, spreading the leagues across the drivers in
+        the pool. A driver is only ever used by one league at a time
+        """
+        drivers = queue.Queue()
+        for web in self.drivers:
+            drivers.put(web)
+
+        def scrape_league(league, url):
+            web = drivers.get()
             try:
-                league_df = self.get_avg_odds(league, url)
+                with self.metrics.timer('odds_portal_scrape_seconds', league=league):
+                    return self.get_avg_odds(league, url, web)
             except Exception as e:
-                print(e)
-                continue
-            dfs.append(league_df)
-        df = pd.concat(dfs)
+                self.logger.error(f"Failed to get avg odds for {league}: {e}")
+                self.metrics.inc('odds_portal_scrape_errors_total', league=league)
+                return None
+            finally:
+                drivers.put(web)
+
+        with ThreadPoolExecutor(max_workers=len(self.drivers)) as executor:
+            dfs = list(executor.map(scrape_league, self.league_urls.keys(), self.league_urls.values()))
+        dfs = [league_df for league_df in dfs if league_df is not None]
+        df = pd.concat(dfs) if dfs else pd.DataFrame()
         df = df.reset_index(drop=True)
         self.data = df
         self.logger.debug(f"Extracted {len(df)} odds avg odds entries")
@@ -222,27 +217,47 @@ class OddsPortalScraper:
             return -1
 
     def load_odds(self):
-        r = self.data.to_sql('avg_odds', self.engine, if_exists='replace', index=False)
-        self.logger.info(f"Loaded {r} rows into avg_odds")
-
-    def run_etl(self):
-        try:
-            r = self.extract_odds()
-        except Exception as e:
-            self.logger.error("Failed to extract odds")
-            self.logger.error(e)
-        try:
-            r = self.transform_odds()
-        except Exception as e:
-            self.logger.error("Failed to transform odds")
-            self.logger.error(e)
+        """
+        Writes the average odds to the latest snapshot table avg_odds and appends the lines
+        whose price changed to avg_odds_history. The full snapshot also goes to the parquet archive
+        """
+        r = self.history.load(self.data)
+        self.logger.info(f"Loaded {len(self.data)} rows into avg_odds, {r} price changes into avg_odds_history")
+        self.notifier.bump('avg_odds')
         try:
-            r = self.load_odds()
+            self.archive.write(self.data, 'avg_odds')
         except Exception as e:
-            self.logger.error("Failed to transform odds")
-            self.logger.error(e)
+            self.logger.error(f"Failed to archive odds: {e}")
+
+    def run_etl(self):
+        with self.metrics.timer('odds_portal_cycle_seconds'):
+            try:
+                with self.metrics.timer('odds_portal_stage_seconds', stage='extract_odds'):
+                    r = self.extract_odds()
+            except Exception as e:
+                self.logger.error("Failed to extract odds")
+                self.logger.error(e)
+            try:
+                with self.metrics.timer('odds_portal_stage_seconds', stage='transform_odds'):
+                    r = self.transform_odds()
+            except Exception as e:
+                self.logger.error("Failed to transform odds")
+                self.logger.error(e)
+            try:
+                with self.metrics.timer('odds_portal_stage_seconds', stage='load_odds'):
+                    r = self.load_odds()
+            except Exception as e:
+                self.logger.error("Failed to transform odds")
+                self.logger.error(e)
+        self.metrics.set('odds_portal_rows', len(self.data))
+        self.metrics.flush()
         
     def run(self):
+        try:
+            # the days before today are no longer written to, merge their snapshot files
+            self.archive.compact_finished_days('avg_odds')
+        except Exception as e:
+            self.logger.error(f"Failed to compact the odds archive: {e}")
         self.odds_portal_login()
         end_time = datetime.now().replace(hour=21, minute=30, second=0, microsecond=0)
         while datetime.now() < end_time:
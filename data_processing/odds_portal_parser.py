@@ -0,0 +1,178 @@
+from datetime import datetime
+import logging
+import os
+import uuid
+from bs4 import BeautifulSoup
+from dateutil import parser
+import pandas as pd
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
+
+ODDS_PORTAL_PARSER = os.getenv("ODDS_PORTAL_PARSER", "lxml")
+
+ROW_CLASS = "eventRow flex w-full flex-col text-xs"
+DATE_CLASS = "text-black-main font-main w-full truncate text-xs font-normal leading-5"
+TIME_CLASS = "next-m:flex-col min-md:flex-row min-md:gap-1 text-gray-dark flex flex-row self-center text-[12px] w-full"
+TEAM_CLASS = "participant-name truncate"
+ODDS_CLASS = "flex-center border-black-borders min-w-[60px] flex-col gap-1 pb-0.5 pt-0.5 relative"
+
+COLUMNS = ['id', 'sport', 'home_team', 'away_team', 'start_time', 'outcome', 'decimal_odds', 'update_time']
+
+logger = logging.getLogger("odds_portal")
+
+
+def bs4_rows(html, features="html.parser"):
+    """
+    The original BeautifulSoup path. Yields (date_text, teams, time_text, odds) per event row,
+    with None for anything missing
+    """
+    soup = BeautifulSoup(html, features)
+    for row in soup.find_all("div", class_=ROW_CLASS):
+        date_tag = row.find("div", class_=DATE_CLASS)
+        teams = [team.text for team in row.find_all("p", class_=TEAM_CLASS)]
+        time_div = row.find("div", class_=TIME_CLASS)
+        time_p = time_div.find('p') if time_div is not None else None
+        odds = [odd.find("p") for odd in row.find_all("div", class_=ODDS_CLASS)]
+        yield (date_tag.text if date_tag is not None else None,
+               teams,
+               time_p.text if time_p is not None else None,
+               [odd.text if odd is not None else None for odd in odds])
+
+
+if lxml is not None:
+    def _has_class(tag, classes):
+        return etree.XPath(f'.//{tag}[normalize-space(@class)="{classes}"]')
+
+    # compiled once, matched against the whole class attribute like BeautifulSoup does
+    LXML_ROWS = etree.XPath(f'//div[normalize-space(@class)="{ROW_CLASS}"]')
+    LXML_DATE = _has_class("div", DATE_CLASS)
+    LXML_TEAMS = _has_class("p", TEAM_CLASS)
+    LXML_TIME = _has_class("div", TIME_CLASS)
+    LXML_ODDS = _has_class("div", ODDS_CLASS)
+    LXML_FIRST_P = etree.XPath('.//p')
+
+    def lxml_rows(html):
+        """
+        lxml parser with precompiled XPath selectors, same output as bs4_rows
+        """
+        def first_p_text(el):
+            ps = LXML_FIRST_P(el)
+            return ps[0].text_content() if ps else None
+
+        for row in LXML_ROWS(lxml.html.fromstring(html)):
+            date_tag = LXML_DATE(row)
+            time_div = LXML_TIME(row)
+            yield (date_tag[0].text_content() if date_tag else None,
+                   [team.text_content() for team in LXML_TEAMS(row)],
+                   first_p_text(time_div[0]) if time_div else None,
+                   [first_p_text(odd) for odd in LXML_ODDS(row)])
+
+
+if HTMLParser is not None:
+    def selectolax_rows(html):
+        """
+        selectolax parser (lexbor engine) with attribute selectors, same output as bs4_rows
+        """
+        def first_p_text(node):
+            p = node.css_first('p')
+            return p.text() if p is not None else None
+
+        for row in HTMLParser(html).css(f'div[class="{ROW_CLASS}"]'):
+            date_tag = row.css_first(f'div[class="{DATE_CLASS}"]')
+            time_div = row.css_first(f'div[class="{TIME_CLASS}"]')
+            yield (date_tag.text() if date_tag is not None else None,
+                   [team.text() for team in row.css(f'p[class="{TEAM_CLASS}"]')],
+                   first_p_text(time_div) if time_div is not None else None,
+                   [first_p_text(odd) for odd in row.css(f'div[class="{ODDS_CLASS}"]')])
+
+
+PARSER_BACKENDS = {"bs4": bs4_rows}
+if lxml is not None:
+    PARSER_BACKENDS["lxml"] = lxml_rows
+if HTMLParser is not None:
+    PARSER_BACKENDS["selectolax"] = selectolax_rows
+
+
+def parse_event_rows(sport_key, html, backend=ODDS_PORTAL_PARSER) -> pd.DataFrame:
+    """
+    Parses a league page into one row per outcome (home, away and draw if there is one),
+    appending straight into column lists. Rows are not filtered on the start time
+
+    Args:
+        sport_key (str): the sport key of the league
+        html (str): the page source
+        backend (str): one of PARSER_BACKENDS, falls back to bs4 if it is not installed
+
+    Returns:
+        pd.DataFrame: the avg_odds columns
+    """
+    rows = PARSER_BACKENDS.get(backend, bs4_rows)(html)
+    home_teams, away_teams, start_times, outcomes, odds_column = [], [], [], [], []
+    event_date = datetime.now().date()
+    for date_text, teams, time_text, odds in rows:
+        try:
+            if date_text is not None:
+                if 'yesterday' in date_text.lower():
+                    continue
+                if 'today' in date_text.lower():
+                    continue
+                if 'tomorrow' in date_text.lower():
+                    event_date = datetime.today() + pd.Timedelta(days=1)
+                else:
+                    try:
+                        event_date = parser.parse(date_text).date()
+                    except:
+                        logger.debug(f"{date_text} not parsed")
+                        continue
+            home_team, away_team = teams[0], teams[1]
+            start_time = datetime.time(datetime.strptime(time_text, "%H:%M"))
+            if None in odds:
+                raise ValueError(f"Missing odds for {home_team} vs {away_team}")
+            if len(odds) == 3:
+                home_odds, draw_odds, away_odds = odds
+                event_outcomes = [(home_team, home_odds), (away_team, away_odds), ('Draw', draw_odds)]
+            else:
+                home_odds, away_odds = odds
+                event_outcomes = [(home_team, home_odds), (away_team, away_odds)]
+            start_time = datetime.combine(event_date, start_time)
+        except Exception as e:
+            logger.debug(e)
+            continue
+        for outcome, decimal_odds in event_outcomes:
+            home_teams.append(home_team)
+            away_teams.append(away_team)
+            start_times.append(start_time)
+            outcomes.append(outcome)
+            odds_column.append(decimal_odds)
+    # one uuid per page, suffixed with the row number
+    page_id = uuid.uuid4()
+    return pd.DataFrame({
+        'id': [f"{page_id}-{i}" for i in range(len(outcomes))],
+        'sport': sport_key,
+        'home_team': home_teams,
+        'away_team': away_teams,
+        'start_time': pd.to_datetime(pd.Series(start_times, dtype=object)),
+        'outcome': outcomes,
+        'decimal_odds': odds_column,
+        'update_time': datetime.now(),
+    }, columns=COLUMNS)
+
+
+def parse_avg_odds(sport_key, html, backend=ODDS_PORTAL_PARSER) -> pd.DataFrame:
+    """
+    Parses a league page and keeps only the games that are today and have not started yet
+    """
+    df = parse_event_rows(sport_key, html, backend)
+    if df.empty:
+        return df
+    df = df[df['start_time'].dt.date == datetime.now().date()]
+    df = df[df['start_time'].dt.time > datetime.now().time()]
+    df = df.reset_index(drop=True)
+    return df
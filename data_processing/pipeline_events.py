@@ -0,0 +1,73 @@
+from datetime import datetime
+import time
+from sqlalchemy import text
+
+VERSIONS_TABLE = 'pipeline_versions'
+
+
+class ChangeNotifier(object):
+    def __init__(self, engine):
+        """
+        Change counter shared by the services through the database. Every writer bumps the
+        version of the table it just loaded and readers compare versions to find out if
+        anything changed since they last looked, which is a single indexed read
+        """
+        self.engine = engine
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} "
+                "(table_name TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at TIMESTAMP)"
+            ))
+
+    def bump(self, table_name, conn=None) -> int:
+        """
+        Records that table_name was just written
+
+        Args:
+            table_name (str): the table that was written
+            conn (sqlalchemy.Connection): a transaction to bump in, so the version commits
+                together with what was written, a transaction of its own by default
+
+        Returns:
+            int: the new version of the table
+        """
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self.bump(table_name, conn)
+        conn.execute(text(
+            f"INSERT INTO {VERSIONS_TABLE} (table_name, version, updated_at) VALUES (:table_name, 1, :now) "
+            "ON CONFLICT (table_name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at"
+        ), {'table_name': table_name, 'now': str(datetime.now())})
+        return conn.execute(text(f"SELECT version FROM {VERSIONS_TABLE} WHERE table_name = :table_name"),
+                            {'table_name': table_name}).scalar_one()
+
+    def versions(self, table_names) -> dict:
+        """
+        Returns:
+            dict: table name -> current version, 0 for tables that were never bumped
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT table_name, version FROM {VERSIONS_TABLE}")).fetchall()
+        current = dict(rows)
+        return {table_name: current.get(table_name, 0) for table_name in table_names}
+
+    def wait_for_change(self, table_names, last_versions, timeout, poll_seconds=1.0):
+        """
+        Blocks until any of table_names has a different version than last_versions or the
+        timeout runs out
+
+        Args:
+            table_names (list): the tables to watch
+            last_versions (dict): the versions seen last time, e.g. from a previous call
+            timeout (float): the maximum number of seconds to wait
+            poll_seconds (float): how often to check the counter
+
+        Returns:
+            dict: the current versions, equal to last_versions if nothing changed in time
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self.versions(table_names)
+            if current != last_versions or time.monotonic() >= deadline:
+                return current
+            time.sleep(min(poll_seconds, max(deadline - time.monotonic(), 0)))
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import pandas as pd
+from sqlalchemy import text
+
+from database import write_transaction
+
+ARCHIVE_TABLE = 'reccommended_bets_archive'
+# recommendations for events older than this move out of the archive table LineFilter writes to
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", 30))
+
+
+class RecommendationArchive(object):
+    def __init__(self, engine, table_name=ARCHIVE_TABLE, retention_days=ARCHIVE_RETENTION_DAYS, logger=None):
+        """
+        The bets that were already recommended, unique on their id. The ids are kept in memory
+        so finding the new bets of a cycle is a set lookup, and appends are INSERT OR IGNORE
+        through a staging table, so the cost of a cycle depends on the new bets and not on how
+        many were recommended before. compact moves the bets of events older than
+        retention_days to <table_name>_history to keep the table small
+
+        Args:
+            engine (sqlalchemy.Engine): the database engine
+            table_name (str): the archive table
+            retention_days (int): how many days of events stay in the archive table
+        """
+        self.engine = engine
+        self.table_name = table_name
+        self.history_table = f"{table_name}_history"
+        self.staging_table = f"{table_name}_staging"
+        self.retention_days = retention_days
+        self.logger = logger or logging.getLogger("recommendation_archive")
+        with write_transaction(self.engine) as conn:
+            if self._columns(conn, self.table_name):
+                self._ensure_key(conn)
+                self.ids = {row[0] for row in conn.execute(text(f"SELECT id FROM {self.table_name}"))}
+            else:
+                self.ids = set()
+
+    def new_bets(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: the rows of df whose id was not recommended yet
+        """
+        if df.empty:
+            return df
+        # look every id of the cycle up in the set, isin would hash the whole archive every cycle
+        return df[[bet_id not in self.ids for bet_id in df['id']]]
+
+    def append(self, df: pd.DataFrame) -> int:
+        """
+        Adds the bets in df to the archive, bets already in it are ignored
+
+        Returns:
+            int: the number of bets added
+        """
+        if df.empty:
+            return 0
+        with write_transaction(self.engine) as conn:
+            df.to_sql(self.staging_table, conn, if_exists='replace', index=False)
+            self._ensure_schema(conn, self.table_name, df.columns)
+            columns = ", ".join(df.columns)
+            added = conn.execute(text(
+                f"INSERT OR IGNORE INTO {self.table_name} ({columns}) SELECT {columns} FROM {self.staging_table}"
+            )).rowcount
+            conn.execute(text(f"DROP TABLE {self.staging_table}"))
+        self.ids.update(df['id'])
+        return added
+
+    def compact(self, now=None) -> int:
+        """
+        Moves the bets on events that started more than retention_days ago to the history
+        table. Those events are over so their ids can not come up again and are dropped from
+        the in-memory set as well
+
+        Args:
+            now (datetime.datetime): the current time, defaults to now
+
+        Returns:
+            int: the number of bets moved
+        """
+        with write_transaction(self.engine) as conn:
+            columns = self._columns(conn, self.table_name)
+            if not columns:
+                return 0
+            self._ensure_schema(conn, self.history_table, columns, source=self.table_name)
+            # start_time is stored as text in the pandas datetime format, compare in the same format
+            cutoff = ((now or datetime.now()) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S.%f')
+            expired = [row[0] for row in conn.execute(
+                text(f"SELECT id FROM {self.table_name} WHERE start_time < :cutoff"), {'cutoff': cutoff})]
+            if not expired:
+                return 0
+            column_list = ", ".join(columns)
+            conn.execute(text(
+                f"INSERT OR IGNORE INTO {self.history_table} ({column_list}) "
+                f"SELECT {column_list} FROM {self.table_name} WHERE start_time < :cutoff"
+            ), {'cutoff': cutoff})
+            conn.execute(text(f"DELETE FROM {self.table_name} WHERE start_time < :cutoff"), {'cutoff': cutoff})
+        self.ids.difference_update(expired)
+        self.logger.debug(f"Moved {len(expired)} bets older than {cutoff} to {self.history_table}")
+        return len(expired)
+
+    def _ensure_schema(self, conn, table, columns, source=None) -> None:
+        """
+        Creates table like source (the staging table by default) if it does not exist and adds
+        any of columns it is missing, e.g. when LineFilter starts writing a new column
+        """
+        source = source or self.staging_table
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM {source} WHERE 0"))
+        existing = self._columns(conn, table)
+        for column in columns:
+            if column not in existing:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN "{column}"'))
+        if table == self.table_name:
+            self._ensure_key(conn)
+        else:
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_id ON {table} (id)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_start_time ON {table} (start_time)"))
+
+    def _ensure_key(self, conn) -> None:
+        """
+        Makes id unique in the archive table. The archive used to be rewritten with
+        to_sql(if_exists='replace') and has no key, any duplicate ids are dropped first
+        """
+        indexes = [row[1] for row in conn.execute(text(f"PRAGMA index_list({self.table_name})"))]
+        if f"ux_{self.table_name}_id" in indexes:
+            return
+        conn.execute(text(f"DELETE FROM {self.table_name} WHERE rowid NOT IN "
+                          f"(SELECT MIN(rowid) FROM {self.table_name} GROUP BY id)"))
+        conn.execute(text(f"CREATE UNIQUE INDEX ux_{self.table_name}_id ON {self.table_name} (id)"))
+
+    def _columns(self, conn, table) -> list:
+        return [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
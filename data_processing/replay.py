@@ -0,0 +1,207 @@
+"""
+Replays archived odds snapshots through the LineFilter transform path on a simulated clock,
+to reproduce or profile a production day offline or test a change against a season of
+data. Every time an odds source loaded a snapshot that day, the replay sets the clock to the
+snapshot's update_time, hands LineFilter the latest snapshot of both sources as they were at
+that moment and runs transform. Nothing sleeps, a day runs as fast as the transforms do, and
+days run in parallel across processes, each against its own scratch database
+
+    python replay.py --start 2024-03-01 --end 2024-03-31 --workers 4 --output flagged.csv
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+import tempfile
+import time
+import pandas as pd
+
+from database import get_engine, new_engine
+from filter_lines import SQLALCHEMY_DATABASE_URI, LineFilter
+from odds_archive import ODDS_ARCHIVE_DIR, OddsArchive
+from synthetic_data import load_bundled_team_names
+
+SOURCES = ['all_betting_lines', 'avg_odds']
+# the odds portal stamps every league page separately, loads closer together than this are one tick
+TICK_MERGE_SECONDS = 60
+
+
+class SimulatedClock(object):
+    def __init__(self, now):
+        """
+        Stands in for datetime.now, returns whatever time the replay last set
+        """
+        self.now = pd.Timestamp(now).to_pydatetime()
+
+    def __call__(self):
+        return self.now
+
+    def set(self, now) -> None:
+        self.now = pd.Timestamp(now).to_pydatetime()
+
+
+class SnapshotTimeline(object):
+    def __init__(self, df):
+        """
+        The snapshots of one source over a day. Every league of a snapshot shares an
+        update_time, so the state of the latest table at time t is, for every sport, the rows
+        of its last update_time at or before t
+
+        Args:
+            df (pd.DataFrame): the archived rows of the source
+        """
+        df = df.drop(columns=['date'], errors='ignore')
+        df['sport'] = df['sport'].astype(str)
+        self.snapshots = {key: group for key, group in df.groupby(['sport', 'update_time'], sort=False)}
+        self.times = {sport: group['update_time'].drop_duplicates().sort_values().to_numpy()
+                      for sport, group in df.groupby('sport')}
+        self.columns = df.columns
+
+    def update_times(self) -> list:
+        return sorted({t for times in self.times.values() for t in times})
+
+    def at(self, now) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: the latest snapshot of every sport as of now
+        """
+        now = pd.Timestamp(now).to_datetime64()
+        frames = []
+        for sport, times in self.times.items():
+            i = times.searchsorted(now, side='right')
+            if i:
+                frames.append(self.snapshots[(sport, pd.Timestamp(times[i - 1]))])
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)
+
+
+def replay_ticks(timelines) -> list:
+    """
+    Merges the update times of every source into the times LineFilter would have run at
+    """
+    times = sorted(t for timeline in timelines for t in timeline.update_times())
+    ticks = []
+    for t in times:
+        if ticks and (t - ticks[-1]) / pd.Timedelta(seconds=1) <= TICK_MERGE_SECONDS:
+            ticks[-1] = t
+        else:
+            ticks.append(t)
+    return ticks
+
+
+def load_team_names(database_uri=SQLALCHEMY_DATABASE_URI) -> pd.DataFrame:
+    """
+    The team_names table of the production database, or the bundled team files without one
+    """
+    try:
+        return pd.read_sql('SELECT * FROM team_names', get_engine(database_uri))
+    except Exception:
+        return load_bundled_team_names()
+
+
+def replay_day(date, archive_root=ODDS_ARCHIVE_DIR, alpha=None, team_names=None, with_load=False, keep_merged=False) -> dict:
+    """
+    Replays one day of the archive
+
+    Args:
+        date (str): the day to replay, YYYY-MM-DD
+        archive_root (str): the odds archive directory
+        alpha (float): the alpha to run LineFilter with, ALPHA by default
+        team_names (pd.DataFrame): the team_names table, see load_team_names
+        with_load (bool): also run LineFilter.load every tick, to profile the writes
+        keep_merged (bool): also return every tick's merged lines, the input of the backtest
+
+    Returns:
+        dict: the bets flagged that day with the simulated time they were flagged at, the
+        number of ticks and how long the transforms took. With keep_merged, merged holds the
+        merged lines of every tick with the time they were observed at
+    """
+    start = pd.Timestamp(date)
+    end = start + pd.Timedelta(days=1)
+    archive = OddsArchive(archive_root)
+    timelines = {}
+    for source in SOURCES:
+        timelines[source] = SnapshotTimeline(archive.read(source, start, end))
+    ticks = replay_ticks(timelines.values())
+    team_names = load_team_names() if team_names is None else team_names
+
+    flagged, merged = [], []
+    stage_seconds = 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        clock = SimulatedClock(start)
+        line_filter = LineFilter(engine=new_engine(f"sqlite:///{os.path.join(tmp, 'replay.db')}"),
+                                 alpha=alpha, clock=clock)
+        line_filter.logger.setLevel('INFO')
+        try:
+            for tick in ticks:
+                clock.set(tick)
+                line_filter.all_betting_lines = timelines['all_betting_lines'].at(tick)
+                line_filter.average_odds = timelines['avg_odds'].at(tick)
+                line_filter.team_names = team_names
+                if line_filter.all_betting_lines.empty or line_filter.average_odds.empty:
+                    continue
+                tick_start = time.perf_counter()
+                line_filter.transform()
+                if with_load:
+                    line_filter.load()
+                else:
+                    line_filter.archive.append(line_filter.bets_to_reccommend)
+                stage_seconds += time.perf_counter() - tick_start
+                if not line_filter.bets_to_reccommend.empty:
+                    flagged.append(line_filter.bets_to_reccommend.assign(flagged_at=tick))
+                if keep_merged:
+                    merged.append(line_filter.merged_df.assign(observed_at=tick))
+        finally:
+            # the pool reuses its workers, leave no threads or log handlers behind for the next day
+            line_filter.close()
+            line_filter.engine.dispose()
+    return {
+        'date': str(start.date()),
+        'ticks': len(ticks),
+        'transform_seconds': stage_seconds,
+        'flagged': pd.concat(flagged, ignore_index=True) if flagged else pd.DataFrame(),
+        'merged': pd.concat(merged, ignore_index=True) if merged else pd.DataFrame(),
+    }
+
+
+def replay(dates, archive_root=ODDS_ARCHIVE_DIR, alpha=None, workers=None, with_load=False, keep_merged=False):
+    """
+    Replays several days in parallel, one process per day
+
+    Yields:
+        dict: the result of replay_day for every day, in date order
+    """
+    team_names = load_team_names()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(replay_day, str(pd.Timestamp(date).date()), archive_root, alpha, team_names,
+                                   with_load, keep_merged) for date in dates]
+        for future in futures:
+            yield future.result()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--start', required=True, help="first day to replay, YYYY-MM-DD")
+    arg_parser.add_argument('--end', default=None, help="last day to replay, defaults to --start")
+    arg_parser.add_argument('--archive-root', default=ODDS_ARCHIVE_DIR)
+    arg_parser.add_argument('--alpha', type=float, default=None)
+    arg_parser.add_argument('--workers', type=int, default=None)
+    arg_parser.add_argument('--with-load', action='store_true', help="run LineFilter.load on every tick as well")
+    arg_parser.add_argument('--output', default=None, help="CSV file for the flagged bets")
+    args = arg_parser.parse_args()
+
+    dates = pd.date_range(args.start, args.end or args.start, freq='D')
+    start = time.perf_counter()
+    flagged = []
+    for result in replay(dates, args.archive_root, args.alpha, args.workers, args.with_load):
+        flagged.append(result['flagged'])
+        print(json.dumps({'date': result['date'], 'ticks': result['ticks'], 'flagged': len(result['flagged']),
+                          'transform_seconds': round(result['transform_seconds'], 3)}), flush=True)
+    print(json.dumps({'days': len(dates), 'wall_seconds': round(time.perf_counter() - start, 3)}))
+    if args.output:
+        pd.concat([pd.DataFrame()] + flagged, ignore_index=True).to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import gspread
+import pandas as pd
+from oauth2client.service_account import ServiceAccountCredentials
+from sqlalchemy import text
+
+from database import write_transaction
+from recommendation_archive import ARCHIVE_RETENTION_DAYS, ARCHIVE_TABLE
+
+SHEETS_CREDENTIALS_FILE = os.getenv("SHEETS_CREDENTIALS_FILE", "sportsbook-scraping-363802-5ed6e9e4d35c.json")
+SHEET_TITLE = 'Sports Betting Log'
+SHEETS_SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+SHEET_COLUMNS = ['sport', 'start_time', 'home_team', 'away_team', 'outcome', 'sportsbook',
+                 'decimal_odds', 'avg_odds', "thresh", "kelly", "half_kelly", "expected_value"]
+# ids of the archive rows that are already in the sheet
+POSTED_TABLE = 'sheets_posted_bets'
+SHEETS_FLUSH_SECONDS = int(os.getenv("SHEETS_FLUSH_SECONDS", 300))
+SHEETS_BATCH_SIZE = 500
+START_TIME_INDEX = SHEET_COLUMNS.index('start_time')
+
+
+class SheetsSync(object):
+    def __init__(self, engine, credentials_file=SHEETS_CREDENTIALS_FILE, sheet_title=SHEET_TITLE,
+                 flush_seconds=SHEETS_FLUSH_SECONDS, batch_size=SHEETS_BATCH_SIZE, retention_days=ARCHIVE_RETENTION_DAYS,
+                 logger=None):
+        """
+        Appends recommended bets to the Google Sheets log. Bets are queued with enqueue and a
+        background thread appends the ones that are not in the sheet yet every flush_seconds,
+        batch_size rows per call. The authorized client is kept between flushes and the ids
+        that were posted are stored in the database so restarts do not post them again. compact
+        forgets the ids of events older than retention_days, like the recommendation archive
+
+        Args:
+            engine (sqlalchemy.Engine): the database engine
+            credentials_file (str): the service account json key file
+            sheet_title (str): the title of the Google Sheet
+            flush_seconds (int): how often queued rows are appended
+            batch_size (int): the maximum number of rows per append_rows call
+            retention_days (int): how many days of events the posted ids are kept for
+        """
+        self.engine = engine
+        self.credentials_file = credentials_file
+        self.sheet_title = sheet_title
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.logger = logger or logging.getLogger("sheets_sync")
+        self._sheet = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.posted_ids = self._load_posted_ids()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def sheet(self):
+        if self._sheet is None:
+            creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_file, SHEETS_SCOPE)
+            self._sheet = gspread.authorize(creds).open(self.sheet_title).sheet1
+        return self._sheet
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, df: pd.DataFrame) -> int:
+        """
+        Queues the rows of df that are not in the sheet or the queue yet
+
+        Args:
+            df (pd.DataFrame): recommended bets, with an id column and SHEET_COLUMNS
+
+        Returns:
+            int: the number of rows queued
+        """
+        if df.empty:
+            return 0
+        with self._lock:
+            # look every id of the cycle up in the sets, isin would hash every posted id every cycle
+            new = df[[bet_id not in self.posted_ids and bet_id not in self._pending for bet_id in df['id']]]
+            rows = new[SHEET_COLUMNS].astype({'start_time': str}).fillna('').values.tolist()
+            self._pending.update(zip(new['id'], rows))
+        return len(rows)
+
+    def flush(self) -> int:
+        """
+        Appends the queued rows to the sheet and records their ids as posted
+
+        Returns:
+            int: the number of rows appended
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            pending = list(self._pending.items())
+        appended = 0
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            try:
+                self.sheet.append_rows([row for _, row in batch], value_input_option='USER_ENTERED', table_range='A1')
+            except Exception as e:
+                # drop the client so the next flush authorizes again, the rows stay queued
+                self._sheet = None
+                self.logger.error(f"Failed to append to Google Sheets: {e}")
+                break
+            ids = [bet_id for bet_id, _ in batch]
+            self._mark_posted([(bet_id, row[START_TIME_INDEX]) for bet_id, row in batch])
+            with self._lock:
+                self.posted_ids.update(ids)
+                for bet_id in ids:
+                    self._pending.pop(bet_id, None)
+            appended += len(batch)
+        if appended:
+            self.logger.debug(f"Appended {appended} bets to Google Sheets")
+        return appended
+
+    def compact(self, now=None) -> int:
+        """
+        Forgets the posted ids of events that started more than retention_days ago. Only new
+        bets are queued and the recommendation archive drops those events at the same age, so
+        they can not be queued again
+
+        Args:
+            now (datetime.datetime): the current time, defaults to now
+
+        Returns:
+            int: the number of ids dropped
+        """
+        # start_time is stored as text in the pandas datetime format, compare in the same format
+        cutoff = ((now or datetime.now()) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S.%f')
+        with write_transaction(self.engine) as conn:
+            expired = [row[0] for row in conn.execute(
+                text(f"SELECT id FROM {POSTED_TABLE} WHERE start_time < :cutoff"), {'cutoff': cutoff})]
+            conn.execute(text(f"DELETE FROM {POSTED_TABLE} WHERE start_time < :cutoff"), {'cutoff': cutoff})
+        with self._lock:
+            self.posted_ids.difference_update(expired)
+        if expired:
+            self.logger.debug(f"Dropped {len(expired)} posted ids older than {cutoff}")
+        return len(expired)
+
+    def stop(self) -> None:
+        """
+        Stops the background thread after a last flush
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+        self.flush()
+
+    def _load_posted_ids(self) -> set:
+        """
+        Creates the posted ids table if needed. The first time, it is seeded with the archive,
+        which the old full rewrites already put in the sheet. A table from before the ids had
+        a start_time gets the start times the archive has for them
+        """
+        with write_transaction(self.engine) as conn:
+            columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({POSTED_TABLE})"))]
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {POSTED_TABLE} (id TEXT PRIMARY KEY, start_time TEXT)"))
+            archive = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                   {'name': ARCHIVE_TABLE}).fetchone()
+            if not columns and archive:
+                conn.execute(text(f"INSERT OR IGNORE INTO {POSTED_TABLE} (id, start_time) "
+                                  f"SELECT id, start_time FROM {ARCHIVE_TABLE}"))
+            elif columns and 'start_time' not in columns:
+                conn.execute(text(f"ALTER TABLE {POSTED_TABLE} ADD COLUMN start_time TEXT"))
+                if archive:
+                    conn.execute(text(f"UPDATE {POSTED_TABLE} SET start_time = "
+                                      f"(SELECT start_time FROM {ARCHIVE_TABLE} WHERE {ARCHIVE_TABLE}.id = {POSTED_TABLE}.id)"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{POSTED_TABLE}_start_time ON {POSTED_TABLE} (start_time)"))
+            return {row[0] for row in conn.execute(text(f"SELECT id FROM {POSTED_TABLE}"))}
+
+    def _mark_posted(self, posted) -> None:
+        """
+        Records (id, start_time) pairs as posted
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text(f"INSERT OR IGNORE INTO {POSTED_TABLE} (id, start_time) VALUES (:id, :start_time)"),
+                         [{'id': bet_id, 'start_time': start_time} for bet_id, start_time in posted])
@@ -0,0 +1,235 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from event_keys import line_keys
+from odds_portal_parser import DATE_CLASS, ODDS_CLASS, ROW_CLASS, TEAM_CLASS, TIME_CLASS
+
+# team files bundled at the root of the repo
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+TEAM_FILES = {
+    "icehockey_nhl": ("NHL_teams.csv", "teamName"),
+    "americanfootball_nfl": ("nfl_teams.csv", "Name"),
+    "baseball_mlb": ("mlb_teams.csv", "teamName"),
+    "soccer_usa_mls": ("mls_teams.json", "name"),
+}
+
+
+def load_bundled_team_names() -> pd.DataFrame:
+    """
+    Loads the team files that ship with the repo into the same shape as the
+    team_names table (sport, team_name)
+
+    Returns:
+        pd.DataFrame: one row per team with the sport key and canonical name
+    """
+    frames = []
+    for sport, (file_name, column) in TEAM_FILES.items():
+        path = os.path.join(DATA_DIRECTORY, file_name)
+        if file_name.endswith('.json'):
+            with open(path) as f:
+                names = [team[column] for team in json.load(f)['teams']]
+        else:
+            names = pd.read_csv(path, encoding='utf-8-sig')[column].dropna().to_list()
+        frames.append(pd.DataFrame({'sport': sport, 'team_name': [name.strip() for name in names]}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def add_name_noise(name, rng, noise=0.5) -> str:
+    """
+    Mangles a canonical team name the way the different sources tend to, e.g.
+    changing the case, dropping the city, adding a suffix or a typo. With
+    probability 1 - noise the name is returned untouched
+
+    Args:
+        name (str): the canonical team name
+        rng (np.random.Generator): random generator used to pick the mangling
+        noise (float): probability that the name gets changed at all
+
+    Returns:
+        str: the noisy team name
+    """
+    if rng.random() >= noise:
+        return name
+    words = name.split()
+    choice = rng.integers(0, 4)
+    if choice == 0:
+        return name.lower()
+    if choice == 1 and len(words) > 1:
+        return " ".join(words[1:])
+    if choice == 2:
+        return f"{name} {rng.choice(['FC', 'SC', '(US)'])}"
+    # swap two neighbouring characters somewhere in the name
+    i = int(rng.integers(0, max(len(name) - 1, 1)))
+    return name[:i] + name[i + 1:i + 2] + name[i:i + 1] + name[i + 2:]
+
+
+def generate_raw_team_names(team_names, n_rows, noise=0.5, seed=0) -> pd.DataFrame:
+    """
+    Samples n_rows (sport, name) pairs from the team_names table with noise added
+    to the names
+
+    Args:
+        team_names (pd.DataFrame): table with sport and team_name columns
+        n_rows (int): number of rows to generate
+        noise (float): probability that any given name gets mangled
+        seed (int): seed for the random generator
+
+    Returns:
+        pd.DataFrame: sport, team_name (canonical) and raw_name (noisy) columns
+    """
+    rng = np.random.default_rng(seed)
+    sample = team_names.sample(n=n_rows, replace=True, random_state=seed).reset_index(drop=True)
+    sample['raw_name'] = [add_name_noise(name, rng, noise) for name in sample['team_name']]
+    return sample
+
+
+def render_odds_portal_page(team_names, sport, n_events=20, three_way=False, seed=0) -> str:
+    """
+    Renders a league page with the same structure and classes OddsPortalScraper looks for,
+    used as a local fixture for the scraper and parser benchmarks. The first row carries a
+    'Today' date header and a later one a 'Tomorrow' header, like the live pages
+
+    Args:
+        team_names (pd.DataFrame): table with sport and team_name columns
+        sport (str): the sport key to take the teams from
+        n_events (int): number of event rows on the page
+        three_way (bool): whether the rows have a draw price
+        seed (int): seed for the random generator
+
+    Returns:
+        str: the page html
+    """
+    rng = np.random.default_rng(seed)
+    teams = team_names[team_names['sport'] == sport]['team_name'].to_list()
+    rows = []
+    for i in range(n_events):
+        home, away = rng.choice(teams, size=2, replace=False)
+        header = ""
+        if i == 0:
+            header = f'<div class="{DATE_CLASS}">Today, {pd.Timestamp.now():%d %b}</div>'
+        elif i == n_events - n_events // 4:
+            header = f'<div class="{DATE_CLASS}">Tomorrow, {pd.Timestamp.now() + pd.Timedelta(days=1):%d %b}</div>'
+        odds = rng.uniform(1.2, 5.0, 3 if three_way else 2).round(2)
+        odds_cells = "".join(f'<div class="{ODDS_CLASS}"><p class="height-content">{odd:.2f}</p></div>' for odd in odds)
+        rows.append(
+            f'<div class="{ROW_CLASS}">{header}'
+            f'<div class="flex w-full"><div class="{TIME_CLASS}"><p>{rng.integers(0, 24):02d}:{rng.choice([0, 15, 30, 45]):02d}</p></div>'
+            f'<a href="#"><p class="{TEAM_CLASS}">{home}</p></a>'
+            f'<a href="#"><p class="{TEAM_CLASS}">{away}</p></a>'
+            f'{odds_cells}</div></div>'
+        )
+    # the scraper waits on //*[@id="app"]/div[1]/div[1]/div/main/div[3]/div[4]
+    return (
+        '<html><head><title>OddsPortal fixture</title></head><body>'
+        '<div id="app"><div><div><div><main><div></div><div></div><div>'
+        '<div></div><div></div><div></div>'
+        f'<div>{"".join(rows)}</div>'
+        '</div></main></div></div></div></div></body></html>'
+    )
+
+
+def generate_line_tables(team_names, bookmakers, n_events, sports=None, noise=0.3, seed=0, start=None) -> tuple:
+    """
+    Generates all_betting_lines and avg_odds tables for n_events random events of each
+    sport, shaped like the tables the odds sources load. Every bookmaker prices every
+    outcome around a common fair price, the average odds are the mean of those prices and
+    each source mangles the team names on its
+    own, so the tables only join after the names are resolved against team_names
+
+    Args:
+        team_names (pd.DataFrame): table with sport and team_name columns
+        bookmakers (list): the sportsbook names to price the events at
+        n_events (int): number of events per sport
+        sports (list): the sport keys to generate, all of team_names' sports if None
+        noise (float): probability that any given name gets mangled
+        seed (int): seed for the random generator
+        start (pd.Timestamp): the events start within 24 hours after this, defaults to now
+
+    Returns:
+        tuple: the all_betting_lines and avg_odds DataFrames
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp.now().floor('min') if start is None else pd.Timestamp(start)
+    sports = sports or team_names['sport'].unique().tolist()
+    update_time = pd.Timestamp.now()
+    lines, averages = [], []
+    for sport in sports:
+        teams = team_names[team_names['sport'] == sport]['team_name'].to_numpy()
+        three_way = sport.startswith('soccer')
+        for _ in range(n_events):
+            home, away = rng.choice(teams, size=2, replace=False)
+            start_time = start + pd.Timedelta(minutes=int(rng.integers(1, 24 * 60)))
+            outcomes = [home, away] + (['Draw'] if three_way else [])
+            fair = rng.dirichlet(np.ones(len(outcomes)) * 5)
+            names = {name: add_name_noise(name, rng, noise) for name in [home, away]}
+            avg_names = {name: add_name_noise(name, rng, noise) for name in [home, away]}
+            for outcome, probability in zip(outcomes, fair):
+                # books take ~5% margin and scatter around it, the average is their mean
+                prices = (0.95 * rng.uniform(0.98, 1.02, len(bookmakers)) / probability).clip(1.01).round(2)
+                averages.append((sport, avg_names[home], avg_names[away], start_time,
+                                 avg_names.get(outcome, outcome), round(prices.mean(), 2)))
+                for sportsbook, price in zip(bookmakers, prices):
+                    lines.append((sport, names[home], names[away], start_time, sportsbook,
+                                  names.get(outcome, outcome), price))
+    all_betting_lines = pd.DataFrame(lines, columns=['sport', 'home_team', 'away_team', 'start_time', 'sportsbook',
+                                                     'outcome', 'decimal_odds'])
+    avg_odds = pd.DataFrame(averages, columns=['sport', 'home_team', 'away_team', 'start_time', 'outcome', 'decimal_odds'])
+    for df in [all_betting_lines, avg_odds]:
+        df.insert(0, 'id', [str(i) for i in range(len(df))])
+        df['update_time'] = update_time
+    all_betting_lines['line_key'] = line_keys(all_betting_lines)
+    return all_betting_lines, avg_odds
+
+
+def generate_odds_api_events(sport_key, teams, bookmakers, n_events=20, three_way=False, start=None,
+                             window_hours=6, seed=0) -> list:
+    """
+    Builds the body of an Odds API v4 /sports/{sport}/odds response for the h2h market, used
+    by the mock Odds API server. Events start between 10 minutes and window_hours after start
+
+    Args:
+        sport_key (str): the sport key
+        teams (list): team names to draw the events from, at least 2
+        bookmakers (dict): bookmaker key -> title
+        n_events (int): number of events
+        three_way (bool): whether the market has a Draw outcome
+        start (pd.Timestamp): the current time in UTC, now by default
+        window_hours (float): how far ahead the events start
+        seed (int): seed for the random generator
+
+    Returns:
+        list: the events, as the API returns them
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp.now(tz='UTC') if start is None else pd.Timestamp(start)
+    start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+    last_update = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+    offsets = rng.uniform(10, window_hours * 60, n_events)
+    events = []
+    for i in range(n_events):
+        home, away = rng.choice(teams, size=2, replace=False)
+        outcomes = [home, away] + (['Draw'] if three_way else [])
+        probability = rng.dirichlet(np.full(len(outcomes), 4.0))
+        prices = (0.95 / probability[None, :] * rng.uniform(0.97, 1.03, (len(bookmakers), len(outcomes)))).clip(1.01)
+        events.append({
+            'id': f"{sport_key}_{seed}_{i}",
+            'sport_key': sport_key,
+            'sport_title': sport_key,
+            'commence_time': (start + pd.Timedelta(minutes=offsets[i])).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'home_team': home,
+            'away_team': away,
+            'bookmakers': [{
+                'key': key,
+                'title': title,
+                'last_update': last_update,
+                'markets': [{
+                    'key': 'h2h',
+                    'last_update': last_update,
+                    'outcomes': [{'name': name, 'price': round(float(price), 2)} for name, price in zip(outcomes, book_prices)],
+                }],
+            } for (key, title), book_prices in zip(bookmakers.items(), prices)],
+        })
+    return events
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+import logging
+import os
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz
+from fuzzywuzzy import process
+from fuzzywuzzy import utils
+try:
+    from rapidfuzz import fuzz as rapid_fuzz
+    from rapidfuzz import process as rapid_process
+except ImportError:
+    rapid_process = None
+
+TEAM_NAME_CACHE_SIZE = int(os.getenv("TEAM_NAME_CACHE_SIZE", 50000))
+SCORE_CUTOFF = 80
+
+
+def fuzzywuzzy_processor(name) -> str:
+    """
+    The processing a name goes through in process.extractOne with fuzz.token_set_ratio:
+    extractOne's default processor, then the scorer's own full_process with force_ascii. The
+    rapidfuzz path uses it too so names with accents or punctuation match the same way
+    """
+    return utils.full_process(utils.full_process(name), force_ascii=True)
+
+
+class TeamNameResolver(object):
+    def __init__(self, cache_size=TEAM_NAME_CACHE_SIZE, score_cutoff=SCORE_CUTOFF, logger=None):
+        """
+        Maps the raw team names coming from the different sources onto the canonical
+        names in the team_names table. The candidate names are indexed by sport once per
+        cycle with refresh() and every raw name -> canonical name lookup is memoized in a
+        bounded LRU cache that survives across cycles, so only names that have never been
+        seen before get scored, and those are scored in a single batch per sport.
+        """
+        self.cache_size = cache_size
+        self.score_cutoff = score_cutoff
+        self.logger = logger or logging.getLogger("team_resolver")
+        self._candidates = {}
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self, team_names: pd.DataFrame) -> None:
+        """
+        Rebuilds the per sport candidate index from the team_names table. Cached
+        lookups are only dropped for the sports whose candidates changed
+
+        Args:
+            team_names (pd.DataFrame): table with sport and team_name columns
+        """
+        if team_names.empty:
+            candidates = {}
+        else:
+            candidates = {sport: group.to_list() for sport, group in team_names.groupby('sport', sort=False)['team_name']}
+        changed = {sport for sport in set(candidates) | set(self._candidates)
+                   if candidates.get(sport) != self._candidates.get(sport)}
+        if changed and self._cache:
+            for key in [key for key in self._cache if key[0] in changed]:
+                del self._cache[key]
+        self._candidates = candidates
+
+    def resolve(self, sports, names) -> np.ndarray:
+        """
+        Resolves the raw names to their canonical names. Follows the same rules as
+        LineFilter.lambda_fuzzy_wuzzy: names for sports without candidates are returned
+        as is, draw is normalised to 'draw' and names without a match above the score
+        cutoff become NaN
+
+        Args:
+            sports (array-like): the sport key of every name
+            names (array-like): the raw team names
+
+        Returns:
+            np.ndarray: the canonical names, aligned with the input
+        """
+        if len(names) == 0:
+            return np.array([], dtype=object)
+        codes, uniques = pd.MultiIndex.from_arrays([np.asarray(sports, dtype=object),
+                                                    np.asarray(names, dtype=object)]).factorize()
+        resolved = np.empty(len(uniques), dtype=object)
+        unseen = {}
+        for i, key in enumerate(uniques):
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                resolved[i] = self._cache[key]
+                self.hits += 1
+            else:
+                unseen.setdefault(key[0], []).append(i)
+                self.misses += 1
+        for sport, positions in unseen.items():
+            raw_names = [uniques[i][1] for i in positions]
+            for i, canonical in zip(positions, self._match(sport, raw_names)):
+                resolved[i] = canonical
+                self._remember(uniques[i], canonical)
+        if unseen:
+            self.logger.debug(f"Scored {sum(len(p) for p in unseen.values())} unseen team names across {len(unseen)} sports")
+        return resolved[codes]
+
+    def resolve_columns(self, df: pd.DataFrame, columns, sport_column='sport') -> pd.DataFrame:
+        """
+        Resolves several name columns of a dataframe in one batch so names that appear in
+        more than one column (e.g. home_team and outcome) are only looked up once
+
+        Args:
+            df (pd.DataFrame): the dataframe with the raw names
+            columns (list): the columns holding team names
+            sport_column (str): the column holding the sport key
+
+        Returns:
+            pd.DataFrame: the dataframe with the name columns replaced by the canonical names
+        """
+        if df.empty:
+            return df
+        sports = np.tile(df[sport_column].to_numpy(dtype=object), len(columns))
+        names = np.concatenate([df[column].to_numpy(dtype=object) for column in columns])
+        resolved = self.resolve(sports, names)
+        for i, column in enumerate(columns):
+            df[column] = resolved[i * len(df):(i + 1) * len(df)]
+        return df
+
+    def _match(self, sport, raw_names) -> list:
+        """
+        Scores a batch of raw names against the candidates of a single sport
+        """
+        teams = self._candidates.get(sport, [])
+        out = [None] * len(raw_names)
+        to_score = []
+        for i, team_name in enumerate(raw_names):
+            if not teams:
+                out[i] = team_name
+            elif team_name.lower() == 'draw':
+                out[i] = 'draw'
+            else:
+                to_score.append(i)
+        if not to_score:
+            return out
+        queries = [raw_names[i] for i in to_score]
+        if rapid_process is not None:
+            # one vectorized pass over the whole query x candidate matrix, processed and rounded
+            # the way fuzzywuzzy processes and rounds so the cutoff behaves identically
+            scores = np.rint(rapid_process.cdist(queries, teams, scorer=rapid_fuzz.token_set_ratio,
+                                                 processor=fuzzywuzzy_processor, workers=-1))
+            best = scores.argmax(axis=1)
+            for i, j, score in zip(to_score, best, scores[np.arange(len(best)), best]):
+                out[i] = teams[j] if score >= self.score_cutoff else np.nan
+        else:
+            for i, query in zip(to_score, queries):
+                match = process.extractOne(query, teams, scorer=fuzz.token_set_ratio, score_cutoff=self.score_cutoff)
+                out[i] = np.nan if match is None else match[0]
+        return out
+
+    def _remember(self, key, canonical) -> None:
+        self._cache[key] = canonical
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,17 +1,102 @@
-from flask import Flask, render_template, jsonify, send_from_directory
+from flask import Flask, render_template, jsonify, send_from_directory, request, make_response, Response
 import requests
+import threading
 import time
 from apscheduler.schedulers.background import BackgroundScheduler
 import json
 import pandas as pd
-from sqlalchemy import create_engine
+from api.config import get_engine
+from api.queries import DEFAULT_LIMIT, all_lines_json, query_lines
+from bet_stream import BetBroadcaster, sse_events
+from data_processing.metrics import render_metrics
+from data_processing.pipeline_events import ChangeNotifier
 
 SQLALCHEMY_DATABASE_URI = 'sqlite:///sports_betting.db'
 
 
 app = Flask(__name__, static_folder='static')
 
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
+engine = get_engine(SQLALCHEMY_DATABASE_URI)
+notifier = ChangeNotifier(engine)
+
+
+class VersionedPageCache(object):
+    def __init__(self, notifier):
+        """
+        Caches rendered pages keyed on the version of the table they are built from. A page
+        is rebuilt once per pipeline write no matter how many viewers there are, every other
+        request only reads the version counter
+        """
+        self.notifier = notifier
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, table_name, build) -> dict:
+        """
+        Returns the cached page if the table did not change since it was built, otherwise
+        builds it. Tables the pipeline never bumped (version 0) are not cached
+
+        Args:
+            name (str): the page name
+            table_name (str): the table the page is built from
+            build (callable): renders the page
+
+        Returns:
+            dict: body and etag (None when the page is not cached)
+        """
+        version = self.notifier.versions([table_name])[table_name]
+        if version == 0:
+            return {'body': build(), 'etag': None}
+        entry = self._entries.get(name)
+        if entry is None or entry['version'] != version:
+            with self._lock:
+                # another request may have rebuilt it while we waited for the lock
+                entry = self._entries.get(name)
+                if entry is None or entry['version'] != version:
+                    entry = {'version': version, 'body': build(), 'etag': f"{name}-{version}"}
+                    self._entries[name] = entry
+        return entry
+
+
+page_cache = VersionedPageCache(notifier)
+broadcaster = BetBroadcaster(engine)
+
+
+def cached_response(name, table_name, build):
+    """
+    Serves a page out of the page cache with an ETag, answering 304 when the client already
+    has the current version
+    """
+    entry = page_cache.get(name, table_name, build)
+    if entry['etag'] is not None and request.if_none_match.contains(entry['etag']):
+        response = make_response('', 304)
+    else:
+        response = make_response(entry['body'])
+    if entry['etag'] is not None:
+        response.set_etag(entry['etag'])
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def format_lines(df) -> list:
+    """
+    Rounds the numeric columns and formats the times of a lines table for the templates
+    """
+    df['mean_implied_probability'] = df['mean_implied_probability'].round(2)
+    df['predicted_probability'] = df['predicted_probability'].round(2)
+    df['expected_value'] = df['expected_value'].round(2)
+    df['kelly'] = df['kelly'].round(3)
+    df['half_kelly'] = df['half_kelly'].round(3)
+    df['best_implied_probability'] = df['best_implied_probability'].round(2)
+    
+    df['thresh'] = df['thresh'].round(2)
+    df['start_time'] = pd.to_datetime(df['start_time'])
+    df['best_odds_update_time'] = pd.to_datetime(df['best_odds_update_time'])
+    df['avg_odds_update_time'] = pd.to_datetime(df['avg_odds_update_time'])
+    df['start_time'] = df['start_time'].dt.strftime('%Y-%m-%d %H:%M') # add time zone
+    df['best_odds_update_time'] = df['best_odds_update_time'].dt.strftime('%Y-%m-%d %H:%M')
+    df['avg_odds_update_time'] = df['avg_odds_update_time'].dt.strftime('%Y-%m-%d %H:%M')
+    return json.loads(df.to_json(orient='records'))
 
 
 
@@ -26,56 +111,72 @@ def about():
 
 @app.route("/plus_ev_bets")
 def plus_ev():
+    return cached_response("plus_ev_bets", "plus_ev_bets", render_plus_ev)
+
+def render_plus_ev():
     df = pd.read_sql("SELECT * FROM plus_ev_bets", engine)
     if df.empty:
         return render_template("no_bets_right_now.html", bets=None, image_url='jontay_porter.jpeg')
-    df['mean_implied_probability'] = df['mean_implied_probability'].round(2)
-    df['predicted_probability'] = df['predicted_probability'].round(2)
-    df['expected_value'] = df['expected_value'].round(2)
-    df['kelly'] = df['kelly'].round(3)
-    df['half_kelly'] = df['half_kelly'].round(3)
-    df['best_implied_probability'] = df['best_implied_probability'].round(2)
-    
-    df['thresh'] = df['thresh'].round(2)
-    df['start_time'] = pd.to_datetime(df['start_time'])
-    df['best_odds_update_time'] = pd.to_datetime(df['best_odds_update_time'])
-    df['avg_odds_update_time'] = pd.to_datetime(df['avg_odds_update_time'])
-    df['start_time'] = df['start_time'].dt.strftime('%Y-%m-%d %H:%M') # add time zone
-    df['best_odds_update_time'] = df['best_odds_update_time'].dt.strftime('%Y-%m-%d %H:%M')
-    df['avg_odds_update_time'] = df['avg_odds_update_time'].dt.strftime('%Y-%m-%d %H:%M')
-    return render_template("plus_ev.html", bets=json.loads(df.to_json(orient='records')), image_url='static/jontay_porter.jpeg')
+    return render_template("plus_ev.html", bets=format_lines(df), image_url='static/jontay_porter.jpeg')
 
 @app.route("/best_lines")
 def best_lines():
+    return cached_response("best_lines", "best_lines_model_probabilities", render_best_lines)
+
+def render_best_lines():
     df = pd.read_sql("SELECT * FROM best_lines_model_probabilities", engine)
-    df['mean_implied_probability'] = df['mean_implied_probability'].round(2)
-    df['predicted_probability'] = df['predicted_probability'].round(2)
-    df['expected_value'] = df['expected_value'].round(2)
-    df['kelly'] = df['kelly'].round(3)
-    df['half_kelly'] = df['half_kelly'].round(3)
-    df['best_implied_probability'] = df['best_implied_probability'].round(2)
-    
-    df['thresh'] = df['thresh'].round(2)
-    df['start_time'] = pd.to_datetime(df['start_time'])
-    df['best_odds_update_time'] = pd.to_datetime(df['best_odds_update_time'])
-    df['avg_odds_update_time'] = pd.to_datetime(df['avg_odds_update_time'])
-    df['start_time'] = df['start_time'].dt.strftime('%Y-%m-%d %H:%M') # add time zone
-    df['best_odds_update_time'] = df['best_odds_update_time'].dt.strftime('%Y-%m-%d %H:%M')
-    df['avg_odds_update_time'] = df['avg_odds_update_time'].dt.strftime('%Y-%m-%d %H:%M')
-    data = json.loads(df.to_json(orient='records'))
-    return render_template("all_lines.html", bets=data)
+    return render_template("all_lines.html", bets=format_lines(df))
+
+def lines_response(table_name, default_sort):
+    """
+    Answers a lines query from the request's query string, see api.queries.query_lines. Without
+    a query string every row comes back as a bare JSON array, as before the endpoints paged
+    """
+    args = request.args
+    if not args:
+        return all_lines_json(engine, table_name)
+    try:
+        result = query_lines(engine, table_name, sport=args.get('sport'), sportsbook=args.get('sportsbook'),
+                             min_ev=args.get('min_ev', type=float), min_kelly=args.get('min_kelly', type=float),
+                             start_after=args.get('start_after'), start_before=args.get('start_before'),
+                             sort=args.get('sort', default_sort), cursor=args.get('cursor'),
+                             limit=args.get('limit', DEFAULT_LIMIT, type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
 
 @app.get("/all_best_lines")
 def get_all_best_lines():
-    df = pd.read_sql("SELECT * FROM best_lines_model_probabilities", engine)
-    
-    return df.to_json(orient='records')
+    return lines_response('best_lines_model_probabilities', 'start_time')
 
 # Define endpoint for "filtered_lines"
 @app.get("/reccommended_bets")
 def get_filtered_lines():
-    df = pd.read_sql("SELECT * FROM plus_ev_bets", engine)
-    return df.to_json(orient='records')
+    return lines_response('plus_ev_bets', '-expected_value')
+
+@app.get("/all_lines")
+def get_all_lines():
+    return lines_response('all_betting_lines', 'start_time')
+
+
+@app.get("/stream/plus_ev_bets")
+def stream_plus_ev_bets():
+    """
+    Pushes the new +EV bets as Server-Sent Events. Filter with ?sport=key, repeatable or
+    comma separated
+    """
+    sports = [sport for value in request.args.getlist('sport') for sport in value.split(',') if sport]
+    subscriber = broadcaster.subscribe(sports)
+    return Response(sse_events(broadcaster, subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus scrape endpoint for the metrics every pipeline service writes to the database
+    """
+    return Response(render_metrics(engine), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/image/<path:filename>')